@@ -1,6 +1,10 @@
 from openai import OpenAI
 import os
+import time
+import atexit
 from dotenv import load_dotenv
+from response_cache import ResponseCache
+from sina import MAX_TOKENS, MODEL, SYSTEM_MESSAGE, build_messages
 
 load_dotenv()
 
@@ -8,42 +12,157 @@ api_key = os.getenv("OPENAI_API_KEY")
 
 client = OpenAI(api_key=api_key)
 
+CACHE_PATH = "response_cache.json"
+CACHE_SIZE = 1000  # Maximum number of cached answers
+CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached answer is asked again
+SEMANTIC_CACHE = False  # Also reuse answers to similar complaints, at the cost of one embedding call per miss
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.92
+HISTORY_TOKEN_BUDGET = 1500  # Prompt size above which the oldest turns are summarized
+SUMMARIZE_HISTORY = True  # Replace old turns with a summary instead of just dropping them
+SUMMARY_MAX_TOKENS = 150
+SUMMARY_PREFIX = "Summary of the conversation so far: "
+SHOW_TURN_STATS = True  # Print time to first token and prompt tokens after every answer
 
-def ask_question(complains):
-    messages = [
-        {"role": "user", "content": "Your job is to pay very good attention to the user’s complaints and concerns, "
-                                    "ask questions if needed, and then provide the best natural remedies "
-                                    "in a very short answer."},
-        {"role": "user", "content": complains}
-    ]
+# Time to first token and prompt size of every question asked
+turn_stats = []
+
+
+def embed(text):
+    return client.embeddings.create(model=EMBEDDING_MODEL, input=text).data[0].embedding
+
+
+cache = ResponseCache(CACHE_PATH, max_size=CACHE_SIZE, ttl=CACHE_TTL,
+                      embed=embed if SEMANTIC_CACHE else None, threshold=SIMILARITY_THRESHOLD)
+atexit.register(cache.save)
+
+
+def estimate_tokens(messages):
+    # Roughly 4 characters per token, plus a few tokens of overhead per message
+    return sum(len(message["content"]) // 4 + 4 for message in messages)
+
+
+def summarize(messages):
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {"role": "system", "content": "Summarize this conversation between a user and Sina, a natural remedies "
+                                          "assistant, in a few sentences. Keep the user's complaints, their answers "
+                                          "to Sina's questions and the remedies already suggested."},
+            {"role": "user", "content": transcript}
+        ],
+        max_tokens=SUMMARY_MAX_TOKENS,
+    )
+    return response.choices[0].message.content
+
+
+def trim_history(history):
+    """Keep the conversation under HISTORY_TOKEN_BUDGET by folding the oldest turns into a summary."""
+    if estimate_tokens(history) <= HISTORY_TOKEN_BUDGET:
+        return history
+
+    # Drop whole turns until the rest takes at most half the budget, so this does not happen every turn
+    system, turns = history[:1], history[1:]
+    dropped = []
+    if turns and turns[0]["role"] == "system":
+        # An earlier summary is folded into the new one
+        dropped, turns = turns[:1], turns[1:]
+    while len(turns) > 2 and estimate_tokens(system + turns) > HISTORY_TOKEN_BUDGET // 2:
+        dropped += turns[:2]
+        turns = turns[2:]
+
+    if SUMMARIZE_HISTORY and dropped:
+        try:
+            summary = summarize(dropped)
+            return system + [{"role": "system", "content": SUMMARY_PREFIX + summary}] + turns
+        except Exception as e:
+            print(f"Could not summarize the conversation: {e}")
+    return system + turns
+
+
+def ask_question(complains, history=None, on_token=None):
+    """
+    Answer a complaint, streaming the answer to on_token as it is generated.
+
+    history holds the system message and the conversation so far; the new question and its answer are
+    added to it on success.
+    """
+    messages = build_messages(complains, history)
+    on_token = on_token or (lambda text: None)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=100,
-        )
-        answer = response.choices[0].message.content
+        start = time.perf_counter()
+        answer, key, embedding = cache.get(messages, model=MODEL, max_tokens=MAX_TOKENS)
+
+        if answer is not None:
+            on_token(answer)
+            turn_stats.append({"time_to_first_token": time.perf_counter() - start, "prompt_tokens": 0,
+                               "cached": True})
+        else:
+            stream = client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                max_tokens=MAX_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            parts = []
+            first_token = None
+            prompt_tokens = None
+            for chunk in stream:
+                if chunk.usage:
+                    prompt_tokens = chunk.usage.prompt_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    parts.append(chunk.choices[0].delta.content)
+                    on_token(parts[-1])
+
+            answer = "".join(parts)
+            cache.put(key, messages, answer, time.perf_counter() - start, embedding, model=MODEL,
+                      max_tokens=MAX_TOKENS)
+            turn_stats.append({"time_to_first_token": first_token, "prompt_tokens": prompt_tokens,
+                               "cached": False})
+
+        if history is not None:
+            history += [messages[-1], {"role": "assistant", "content": answer}]
+            history[:] = trim_history(history)
         return answer
     except Exception as e:
-        return f"An error occurred: {str(e)}"
+        error = f"An error occurred: {str(e)}"
+        on_token(error)
+        return error
+
+
+def print_cache_stats():
+    stats = cache.stats()
+    print(f"Cache: {stats['exact_hits']} exact and {stats['semantic_hits']} similar hits, {stats['misses']} misses "
+          f"(hit rate {stats['hit_rate']:.0%}), {stats['latency_saved']:.1f} s saved")
 
 
 if __name__ == "__main__":
     print("Hello, my name is Sina, how can I assist you today?")
 
     # Initialize conversation history with a system message
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant that provides natural remedies from Ayurveda, "
-                                      "TMC or Unani.You are a devoted healer, a good listener, and an expert in your "
-                                      "field. Your name is Sina."}
-    ]
+    messages = [SYSTEM_MESSAGE]
 
     while True:
         question = input("You: ")
 
         if question.lower() in ["exit", "quit", "goodbye"]:
             print("Sina: Goodbye! Feel free to reach out anytime for natural remedies.")
+            print_cache_stats()
             break
 
-        answer = ask_question(question)
-        print("Sina:", answer)
\ No newline at end of file
+        print("Sina: ", end="", flush=True)
+        asked = len(turn_stats)
+        ask_question(question, messages, on_token=lambda text: print(text, end="", flush=True))
+        print()
+
+        if SHOW_TURN_STATS and len(turn_stats) > asked:
+            stats = turn_stats[-1]
+            if stats["cached"]:
+                print("  (answered from cache)")
+            elif stats["time_to_first_token"] is not None:
+                print(f"  (first token after {stats['time_to_first_token']:.2f} s, "
+                      f"{stats['prompt_tokens']} prompt tokens)")
@@ -0,0 +1,146 @@
+"""
+Run many complaints through Sina without the interactive prompt.
+
+Reads one JSON object per line with a "complaint" (and optionally an "id"), asks up to --concurrency of them
+at the same time, and writes one JSON result per line as soon as each answer arrives:
+
+    python batch.py complaints.jsonl -o answers.jsonl --concurrency 16 --rpm 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from sina import MAX_TOKENS, MODEL, build_messages
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 0.5  # Seconds, doubled after every failed attempt
+BACKOFF_MAX = 20
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, with bursts of up to `capacity` requests."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_delay(error, attempt):
+    retry_after = error.response.headers.get("retry-after") if getattr(error, "response", None) else None
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, BACKOFF_BASE)
+        except ValueError:
+            pass
+    # Full jitter, so clients that were throttled together do not retry together
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def ask(client, bucket, complaint):
+    """Return (answer, attempts), retrying rate limits, server errors and connection errors."""
+    for attempt in range(MAX_ATTEMPTS):
+        if bucket:
+            await bucket.acquire()
+        try:
+            response = await client.chat.completions.create(
+                model=MODEL,
+                messages=build_messages(complaint),
+                max_tokens=MAX_TOKENS,
+            )
+            return response.choices[0].message.content, attempt + 1
+        except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(retry_delay(e, attempt))
+
+
+async def run(lines, output, concurrency=8, rpm=None, client=None):
+    """Answer every JSON line of `lines` and write the results to `output` in completion order."""
+    own_client = client is None
+    client = client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    bucket = TokenBucket(rpm / 60) if rpm else None
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    summary = {"answered": 0, "failed": 0, "retries": 0}
+    start = time.perf_counter()
+
+    async def worker():
+        while True:
+            number, line = await queue.get()
+            if line is None:
+                return
+            result = {"id": number}
+            asked = time.perf_counter()
+            try:
+                # A malformed line gets an error result instead of stopping the batch
+                request = json.loads(line)
+                result["id"] = request.get("id", number)
+                if "complaint" not in request:
+                    raise ValueError('No "complaint" in this line')
+                result["complaint"] = request["complaint"]
+                result["answer"], result["attempts"] = await ask(client, bucket, request["complaint"])
+                summary["answered"] += 1
+                summary["retries"] += result["attempts"] - 1
+            except Exception as e:
+                result["error"] = str(e)
+                summary["failed"] += 1
+            result["latency"] = round(time.perf_counter() - asked, 4)
+            result["finished_at"] = round(time.perf_counter() - start, 4)
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    for number, line in enumerate(lines):
+        if line.strip():
+            await queue.put((number, line))
+    for _ in workers:
+        await queue.put((None, None))
+    await asyncio.gather(*workers)
+    if own_client:
+        await client.close()
+
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", help="JSONL file with one {\"complaint\": ...} per line, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL file for the results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Questions in flight at the same time")
+    parser.add_argument("--rpm", type=float, help="Maximum requests per minute")
+    args = parser.parse_args()
+
+    lines = sys.stdin if args.input == "-" else open(args.input, "r")
+    output = open(args.output, "w") if args.output else sys.stdout
+    with lines, output:
+        summary = asyncio.run(run(lines, output, args.concurrency, args.rpm))
+
+    print(f"{summary['answered']} answered, {summary['failed']} failed, {summary['retries']} retries in "
+          f"{summary['seconds']:.1f} s ({summary['answered'] / summary['seconds']:.1f} answers/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
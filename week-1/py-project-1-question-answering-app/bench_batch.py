@@ -0,0 +1,55 @@
+"""
+Measure batch.py throughput against the local mock Chat Completions API at increasing concurrency.
+
+    python bench_batch.py --requests 200 --max-concurrency 64 --rps 100
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+
+import mock_chat
+
+COMPLAINTS = ["headache", "trouble sleeping", "stress at work", "bloating after meals", "dry skin", "sore throat",
+              "low energy in the afternoon", "back pain"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=mock_chat.LATENCY)
+    parser.add_argument("--rps", type=float, help="Rate limit of the mock API, in requests per second")
+    parser.add_argument("--rpm", type=float, help="Client-side pacing, in requests per minute")
+    args = parser.parse_args()
+
+    server, base_url = mock_chat.start_in_background(latency=args.latency, rate_limit=args.rps)
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="test")
+
+    import batch
+
+    lines = [json.dumps({"id": n, "complaint": COMPLAINTS[n % len(COMPLAINTS)]}) for n in range(args.requests)]
+    print(f"Mock API: {args.latency * 1000:.0f} ms per answer, rate limit "
+          f"{f'{args.rps:.0f} requests/s' if args.rps else 'none'}")
+    print("concurrency   answers/s   p50 latency   p99 latency   retries   429s   failed")
+    state = server.RequestHandlerClass.state
+
+    concurrency = 1
+    while concurrency <= args.max_concurrency:
+        output = io.StringIO()
+        rejected = state.rejected
+        summary = asyncio.run(batch.run(lines, output, concurrency, args.rpm))
+        latencies = sorted(json.loads(line)["latency"] for line in output.getvalue().splitlines())
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{concurrency:>11}  {summary['answered'] / summary['seconds']:10.1f}  "
+              f"{statistics.median(latencies) * 1000:9.0f} ms  {p99 * 1000:9.0f} ms  "
+              f"{summary['retries']:>8}  {state.rejected - rejected:>5}  {summary['failed']:>7}")
+        concurrency *= 2
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
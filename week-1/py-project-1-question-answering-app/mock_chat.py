@@ -0,0 +1,147 @@
+"""
+Fake Chat Completions API with a requests-per-second limit, for bench_batch.py.
+
+Requests over the limit get a 429 with a retry-after header, the way batch.py is throttled by the real API, and
+the others are answered with ANSWER after LATENCY. To try the app against it:
+
+    python mock_chat.py --port 4020 --rps 20
+    OPENAI_BASE_URL=http://127.0.0.1:4020/v1 OPENAI_API_KEY=test python app.py
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY = 0.5  # Seconds to produce a whole answer
+RATE_LIMIT = None  # Requests per second accepted before answering 429
+ANSWER = ("Try a warm cup of ginger and tulsi tea, rest in a dark and quiet room, and massage a drop of "
+          "peppermint oil into your temples.")
+
+_ids = itertools.count(1)
+
+
+class MockState:
+    def __init__(self, latency=LATENCY, rate_limit=RATE_LIMIT, answer=ANSWER):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.answer = answer
+        self.tokens = re.findall(r'\S+\s*', answer)
+        self.lock = threading.Lock()
+        self.allowance = rate_limit or 0
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.rejected = 0
+
+    def admit(self):
+        """Return 0 if the request is within the rate limit, otherwise the seconds to wait before retrying."""
+        with self.lock:
+            self.requests += 1
+            if not self.rate_limit:
+                return 0
+            now = time.monotonic()
+            self.allowance = min(self.rate_limit, self.allowance + (now - self.updated) * self.rate_limit)
+            self.updated = now
+            if self.allowance >= 1:
+                self.allowance -= 1
+                return 0
+            self.rejected += 1
+            return (1 - self.allowance) / self.rate_limit
+
+
+def completion(content, prompt_tokens, chunk=False):
+    payload = {
+        "id": f"chatcmpl-{next(_ids)}",
+        "object": "chat.completion.chunk" if chunk else "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o-mini",
+    }
+    if chunk:
+        payload["choices"] = [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+    else:
+        payload["choices"] = [{"index": 0, "message": {"role": "assistant", "content": content},
+                               "finish_reason": "stop"}]
+        payload["usage"] = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                            "total_tokens": prompt_tokens + len(content) // 4}
+    return payload
+
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # Set by make_server()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path != "/v1/chat/completions":
+            return self.send_json({"error": {"message": f"Unknown route {self.path}"}}, 404)
+
+        wait = state.admit()
+        if wait:
+            return self.send_json({"error": {"message": "Rate limit reached", "type": "requests"}}, 429,
+                                  {"retry-after": f"{wait:.3f}"})
+
+        prompt_tokens = sum(len(message.get("content", "")) // 4 + 4 for message in body.get("messages", []))
+        if not body.get("stream"):
+            time.sleep(state.latency)
+            return self.send_json(completion(state.answer, prompt_tokens))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for token in state.tokens:
+            time.sleep(state.latency / len(state.tokens))
+            self.wfile.write(f"data: {json.dumps(completion(token, prompt_tokens, chunk=True))}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        usage = completion("", prompt_tokens)
+        usage.update(object="chat.completion.chunk", choices=[])
+        self.wfile.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    request_queue_size = 512  # bench_batch.py opens up to --max-concurrency connections at once
+
+
+def make_server(port=0, **settings):
+    """Create a mock server bound to localhost. Use port=0 to pick a free port."""
+    handler = type("Handler", (MockChatHandler,), {"state": MockState(**settings)})
+    return MockServer(("127.0.0.1", port), handler)
+
+
+def start_in_background(**settings):
+    """Start a mock server on a free port and return (server, base_url)."""
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI Chat Completions API.")
+    parser.add_argument("--port", type=int, default=4020)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--rps", type=float, default=RATE_LIMIT, help="Requests per second before answering 429")
+    args = parser.parse_args()
+
+    server = make_server(args.port, latency=args.latency, rate_limit=args.rps)
+    print(f"Mock Chat Completions API listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def prompt_key(messages, **params):
+    """Hash the normalized messages together with the request parameters (model, max_tokens, ...)."""
+    normalized = [[message["role"], normalize(message["content"])] for message in messages]
+    payload = json.dumps([normalized, sorted(params.items())], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of chat completion answers with two levels of lookup.
+
+    The first level matches the exact prompt after normalizing case and whitespace. The optional second level
+    compares the embedding of the last message with the cached ones and reuses the answer of the most similar
+    entry, as long as the rest of the prompt is the same and the cosine similarity reaches `threshold`.
+    Entries expire after `ttl` seconds, the least recently used ones are dropped beyond `max_size`, and the
+    cache is saved to `path` as JSON.
+    """
+
+    def __init__(self, path=None, max_size=1000, ttl=7 * 24 * 3600, embed=None, threshold=0.95):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.embed = embed
+        self.threshold = threshold
+        self.entries = OrderedDict()  # key -> {"context", "answer", "latency", "created", "embedding"}
+        self._matrices = {}  # context -> (keys, matrix of their unit-length embeddings)
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries.update(json.load(f))
+            self._expire()
+
+    def get(self, messages, **params):
+        """Return (answer, key, embedding) for a prompt. answer is None on a miss."""
+        self._expire()
+        key = prompt_key(messages, **params)
+        entry = self.entries.get(key)
+        if entry:
+            self.entries.move_to_end(key)
+            self.exact_hits += 1
+            self.latency_saved += entry["latency"]
+            return entry["answer"], key, None
+
+        embedding = None
+        if self.embed:
+            embedding = self._unit(self.embed(messages[-1]["content"]))
+            entry = self._most_similar(embedding, prompt_key(messages[:-1], **params))
+            if entry:
+                self.semantic_hits += 1
+                self.latency_saved += entry["latency"]
+                return entry["answer"], key, embedding
+
+        self.misses += 1
+        return None, key, embedding
+
+    def put(self, key, messages, answer, latency, embedding=None, **params):
+        self.entries[key] = {
+            "context": prompt_key(messages[:-1], **params),
+            "answer": answer,
+            "latency": latency,
+            "created": time.time(),
+            "embedding": embedding.tolist() if embedding is not None else None,
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self._matrices.clear()
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "latency_saved": self.latency_saved,
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _expire(self):
+        now = time.time()
+        expired = [key for key, entry in self.entries.items() if now - entry["created"] >= self.ttl]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            self._matrices.clear()
+
+    def _most_similar(self, embedding, context):
+        if context not in self._matrices:
+            keys = [key for key, entry in self.entries.items()
+                    if entry["embedding"] is not None and entry["context"] == context]
+            matrix = np.array([self.entries[key]["embedding"] for key in keys], dtype=np.float32)
+            self._matrices[context] = (keys, matrix)
+        keys, matrix = self._matrices[context]
+        if not keys:
+            return None
+
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        self.entries.move_to_end(keys[best])
+        return self.entries[keys[best]]
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
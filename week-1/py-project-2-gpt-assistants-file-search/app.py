@@ -1,12 +1,24 @@
 import os
+import json
 import time
-from flask import Flask, request, jsonify, render_template
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from werkzeug.utils import secure_filename
 from openai import OpenAI
 from dotenv import load_dotenv
+from thread_cache import ThreadCache
+from ingestion_index import IngestionIndex
+from upload_jobs import UploadJobs, QueueFull
+from pdf_chunker import pdf_to_chunks, pdf_to_text_files
+from local_retrieval import BM25Index
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['INGESTION_INDEX'] = 'ingested.json'
+app.config['LOCAL_INDEX'] = 'local_index.jsonl'
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
 
 # Load environment variables
@@ -19,45 +31,222 @@ client = OpenAI(api_key=api_key)
 # Configuration constants
 ASSISTANT_ID = os.getenv('ASSISTANT_ID')  # Move to environment variable
 MAX_RETRIES = 10
-RETRY_DELAY = 2
+POLL_INITIAL_DELAY = 0.05  # First wait between run status checks, doubled after every check
+POLL_MAX_DELAY = 2
+RUN_TIMEOUT = 20
+INDEX_TIMEOUT = 600  # Seconds to wait for the vector store to index an uploaded file
+THREAD_CACHE_SIZE = 1000  # Maximum number of conversations kept
+THREAD_TTL = 3600  # Seconds of inactivity before a conversation is forgotten
+WARM_THREADS = 4  # Threads created ahead of time for new conversations
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_SPOOL_SIZE = 32 * 1024 * 1024  # Uploads larger than this are buffered on disk instead of in memory
+UPLOAD_WORKERS = 4  # Files sent to OpenAI at the same time
+UPLOAD_QUEUE_SIZE = 32  # Files waiting or in progress before new uploads are refused
+INDEX_WAITERS = 32  # Vector store file batches waited for at the same time, after their upload
+PREPROCESS_PDFS = True  # Upload the text extracted from PDFs instead of the PDFs themselves
+PDF_WORKERS = 2  # Processes extracting text from the pages of one PDF
+RETRIEVAL_BACKEND = 'assistants'  # 'assistants' for the Assistants vector store, 'local' for the local index
+CHAT_MODEL = 'gpt-4o-mini'  # Model answering from local search results
+TOP_K = 5  # Passages sent to the model with each question
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 
-def upload_pdf_to_vector_store(file_path):
-    try:
-        with open(file_path, 'rb') as file:
-            file_data = client.files.create(
-                file=open(file_path, 'rb'),
-                purpose='assistants'
+# pdf_chunker's worker processes import this script again as __mp_main__ when it is run with `python app.py`.
+# They only extract text, so they neither load the local index nor create warm threads.
+PDF_WORKER = __name__ == '__mp_main__'
+
+ingestion_index = IngestionIndex(app.config['INGESTION_INDEX'])
+vector_store_lock = threading.Lock()
+upload_jobs = UploadJobs(workers=UPLOAD_WORKERS, max_pending=UPLOAD_QUEUE_SIZE)
+index_waiters = ThreadPoolExecutor(max_workers=INDEX_WAITERS, thread_name_prefix='index')
+local_index = BM25Index(app.config['LOCAL_INDEX']) if RETRIEVAL_BACKEND == 'local' and not PDF_WORKER else None
+
+
+def read_upload(stream):
+    """Copy an uploaded file into a buffer chunk by chunk, hashing it on the way."""
+    digest = hashlib.sha256()
+    buffer = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        buffer.write(chunk)
+    buffer.seek(0)
+    return digest.hexdigest(), buffer
+
+
+def get_vector_store_id():
+    # All documents go into one long-lived vector store, created on the first upload
+    with vector_store_lock:
+        if not ingestion_index.vector_store_id:
+            vector_store = client.beta.vector_stores.create(
+                name="Document Vector Store"
+            )
+            ingestion_index.vector_store_id = vector_store.id
+            print(f"Vector store created with ID: {vector_store.id}")
+        return ingestion_index.vector_store_id
+
+
+def attach_vector_store(vector_store_id):
+    # Held while updating, so concurrent uploads update the assistant once
+    with vector_store_lock:
+        if ingestion_index.assistant_vector_store_id != vector_store_id:
+            client.beta.assistants.update(
+                ASSISTANT_ID,
+                tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}}
             )
+            ingestion_index.assistant_vector_store_id = vector_store_id
+            print(f"Assistant updated with Vector Store ID: {vector_store_id}")
 
-        print(f"File uploaded with ID: {file_data.id}")
 
-        vector_store = client.beta.vector_stores.create(
-            name="Document Vector Store"
+def upload_files(uploads, on_stage):
+    file_ids = []
+    for upload in uploads:
+        on_stage('uploading', files_uploaded=len(file_ids))
+        file_data = client.files.create(
+            file=upload,
+            purpose='assistants'
         )
+        file_ids.append(file_data.id)
+        print(f"File uploaded with ID: {file_data.id}")
+    return file_ids
 
-        vector_store_response = client.beta.vector_stores.files.create(
-            vector_store_id=vector_store.id,
-            file_id=file_data.id
-        )
-        print("File added to vector store", vector_store_response)
 
-        client.beta.assistants.update(
-            ASSISTANT_ID,
-            tool_resources={"file_search": {"vector_store_ids": [vector_store.id]}}
+def wait_for_batch(vector_store_id, batch_id):
+    """Poll a vector store file batch with exponential backoff until it is no longer in progress."""
+    delay = POLL_INITIAL_DELAY
+    deadline = time.monotonic() + INDEX_TIMEOUT
+    while True:
+        batch = client.beta.vector_stores.file_batches.retrieve(batch_id, vector_store_id=vector_store_id)
+        if batch.status != 'in_progress':
+            return batch
+        if time.monotonic() >= deadline:
+            raise Exception(f"Vector store file batch {batch_id} still in progress after {INDEX_TIMEOUT} s")
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+
+def finish_ingestion(digest, record, vector_store_id, on_stage):
+    # Recorded once indexed, so a file whose batch failed or was cancelled can be uploaded again
+    try:
+        batch = wait_for_batch(vector_store_id, record['batch_id'])
+    except Exception as e:
+        print(f"Error checking vector store file batch status: {e}")
+        ingestion_index.release(digest)
+        on_stage('failed', error=str(e))
+        return
+    if batch.status == 'completed':
+        ingestion_index.add(digest, record)
+    else:
+        ingestion_index.release(digest)
+    on_stage(batch.status)
+
+
+def finish_duplicate(filename, on_stage, record):
+    if record:
+        print(f"File {filename} was already uploaded, skipping")
+        on_stage('duplicate')
+    else:
+        on_stage('failed', error="An upload of the same file failed, please upload it again")
+
+
+def upload_pdf_to_vector_store(filename, digest, buffer, on_stage=None):
+    on_stage = on_stage or (lambda stage, **info: None)
+    reserved = False
+    try:
+        with buffer:
+            # An upload of the same file in progress is not waited for, so it does not hold up a worker: this
+            # file gets its outcome when it finishes
+            if not ingestion_index.reserve(digest, partial(finish_duplicate, filename, on_stage)):
+                return ingestion_index.vector_store_id
+            reserved = True
+
+            file_ids = []
+            if PREPROCESS_PDFS:
+                # Send the extracted text instead of the PDF, which is smaller and faster to index
+                on_stage('extracting')
+                file_ids = upload_files(pdf_to_text_files(filename, buffer, workers=PDF_WORKERS), on_stage)
+            if not file_ids:
+                # No text layer (e.g. a scanned PDF), let the vector store process the PDF itself
+                buffer.seek(0)
+                file_ids = upload_files([(filename, buffer)], on_stage)
+
+        vector_store_id = get_vector_store_id()
+
+        batch = client.beta.vector_stores.file_batches.create(
+            vector_store_id=vector_store_id,
+            file_ids=file_ids
         )
+        print("Files added to vector store", batch)
+        on_stage('indexing', batch_id=batch.id, vector_store_id=vector_store_id)
+        attach_vector_store(vector_store_id)
 
-        print(f"Assistant updated with Vector Store ID: {vector_store.id}")
-        return vector_store.id
+        # Waiting for the vector store to index the files does not hold up the next uploads
+        index_waiters.submit(finish_ingestion, digest, {'filename': filename, 'file_ids': file_ids,
+                                                        'batch_id': batch.id}, vector_store_id, on_stage)
+        reserved = False
+        return vector_store_id
 
     except Exception as e:
         print(f"Error uploading file or creating vector store: {e}")
         raise
 
+    finally:
+        if reserved:
+            ingestion_index.release(digest)
+
+
+def add_pdf_to_local_index(filename, digest, buffer, on_stage=None):
+    on_stage = on_stage or (lambda stage, **info: None)
+    try:
+        with buffer:
+            if digest in local_index.digests:
+                print(f"File {filename} was already indexed, skipping")
+                on_stage('duplicate')
+                return
+
+            on_stage('extracting')
+            added = local_index.add(digest, filename, pdf_to_chunks(buffer, workers=PDF_WORKERS))
+
+        print(f"Indexed {added} chunks of {filename}")
+        on_stage('completed', chunks=added)
+
+    except Exception as e:
+        print(f"Error indexing file: {e}")
+        raise
+
+
+def local_messages(question):
+    """Build a chat prompt answering the question from the best matching passages of the local index."""
+    passages = local_index.search(question, TOP_K)
+    context = "\n\n".join(f"[{p['filename']}, page {p['page']}]\n{p['text']}" for p in passages)
+    return [
+        {"role": "system", "content": "Answer the user's question using only the document excerpts below. "
+                                      "If they do not contain the answer, say so.\n\n" + context},
+        {"role": "user", "content": question}
+    ]
+
+
+def ask_local(question):
+    response = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=local_messages(question)
+    )
+    return response.choices[0].message.content.strip()
+
+
+def stream_local(question):
+    """Yield the answer text from the local index as it is generated."""
+    stream = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=local_messages(question),
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
 
 def get_thread():
     try:
@@ -67,6 +256,10 @@ def get_thread():
         raise
 
 
+thread_cache = ThreadCache(lambda: get_thread().id, max_size=THREAD_CACHE_SIZE, ttl=THREAD_TTL,
+                           warm_size=WARM_THREADS if RETRIEVAL_BACKEND == 'assistants' and not PDF_WORKER else 0)
+
+
 def add_question(thread_id, question):
     try:
         response = client.beta.threads.messages.create(
@@ -91,31 +284,85 @@ def run_assistant(thread_id):
         raise
 
 
+def get_answer(thread_id, run_id):
+    messages = client.beta.threads.messages.list(thread_id, run_id=run_id)
+    for message in messages.data:
+        if message.role == 'assistant':
+            # Return the first response text
+            return message.content[0].text.value.strip()
+    return None
+
+
 def check_status(thread_id, run_id):
-    for attempt in range(MAX_RETRIES):
+    # Poll with exponential backoff so short runs are picked up within tens of milliseconds
+    delay = POLL_INITIAL_DELAY
+    deadline = time.monotonic() + RUN_TIMEOUT
+    attempt = 0
+
+    while time.monotonic() < deadline:
         try:
             run_status = client.beta.threads.runs.retrieve(
                 thread_id=thread_id,
                 run_id=run_id
             )
-
+        except Exception as e:
+            attempt += 1
+            print(f"Error checking status (attempt {attempt}): {e}")
+            if attempt == MAX_RETRIES:
+                raise
+        else:
             if run_status.status == "completed":
-                messages = client.beta.threads.messages.list(thread_id)
-                for message in messages.data:
-                    if message.role == 'assistant':
-                        # Return the first response text
-                        return message.content[0].text.value.strip()
-            elif run_status.status == "failed":
-                raise Exception("Assistant run failed")
+                return get_answer(thread_id, run_id)
+            elif run_status.status in ("failed", "cancelled", "expired"):
+                raise Exception(f"Assistant run {run_status.status}")
+
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+    return None
+
+
+def stream_assistant(thread_id):
+    """Run the assistant and yield the answer text as it is generated."""
+    with client.beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=ASSISTANT_ID
+    ) as stream:
+        for text in stream.text_deltas:
+            yield text
+
+        run = stream.current_run
+        if run and run.status in ("failed", "cancelled", "expired"):
+            raise Exception(f"Assistant run {run.status}")
+
 
-            time.sleep(RETRY_DELAY)
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
 
+
+def stream_answer(texts, on_close=None):
+    """
+    Forward answer tokens to the browser as Server-Sent Events while the answer is generated, and call
+    `on_close` once the answer is done or the browser went away.
+    """
+    def generate():
+        try:
+            for text in texts:
+                yield sse_event({'delta': text})
+            yield sse_event({'done': True})
         except Exception as e:
-            print(f"Error checking status (attempt {attempt + 1}): {e}")
-            if attempt == MAX_RETRIES - 1:
-                raise
+            print(f"Error streaming assistant response: {e}")
+            yield sse_event({'error': str(e)})
+        finally:
+            if on_close:
+                on_close()
 
-    return None
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if on_close:
+        # Also called when the response is closed before the generator started
+        response.call_on_close(on_close)
+    return response
 
 
 @app.route('/')
@@ -125,33 +372,48 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
+    files = request.files.getlist('file')
+    if not files:
         return jsonify({'error': 'No file uploaded'}), 400
 
-    file = request.files['file']
-    if file.filename == '':
+    if any(file.filename == '' for file in files):
         return jsonify({'error': 'No file selected'}), 400
 
-    if not allowed_file(file.filename):
+    if not all(allowed_file(file.filename) for file in files):
         return jsonify({'error': 'Invalid file type'}), 400
 
+    tasks = []
+    buffers = []
     try:
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-
-        vector_store_id = upload_pdf_to_vector_store(file_path)
-        os.remove(file_path)  # Clean up the temporary file
-
-        if vector_store_id:
-            return jsonify({'message': 'File uploaded and processed successfully.'}), 200
-        else:
-            return jsonify({'error': 'Failed to process file.'}), 500
+        # The request body is only readable while the request lasts, so buffer the files before queueing them
+        for file in files:
+            filename = secure_filename(file.filename)
+            digest, buffer = read_upload(file.stream)
+            buffers.append(buffer)
+            ingest = add_pdf_to_local_index if RETRIEVAL_BACKEND == 'local' else upload_pdf_to_vector_store
+            tasks.append((filename, partial(ingest, filename, digest, buffer)))
+
+        job_id = upload_jobs.submit(tasks)
+        return jsonify({'job_id': job_id, 'status_url': f'/upload/{job_id}'}), 202
+
+    except QueueFull as e:
+        for buffer in buffers:
+            buffer.close()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/upload/<job_id>')
+def upload_status(job_id):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown upload job'}), 404
+
+    return jsonify(job), 200
+
+
 @app.route('/ask', methods=['POST'])
 def ask_question():
     try:
@@ -161,11 +423,33 @@ def ask_question():
         if not question:
             return jsonify({'error': 'No question provided'}), 400
 
-        thread = get_thread()
-        add_question(thread.id, question)
-        run = run_assistant(thread.id)
+        if RETRIEVAL_BACKEND == 'local':
+            if data.get('stream'):
+                return stream_answer(stream_local(question))
+            response = ask_local(question)
+        else:
+            session_id = data.get('session_id')
+            release = thread_cache.hold(session_id, RUN_TIMEOUT) if session_id else lambda: None
+            if release is None:
+                return jsonify({'error': 'The previous question of this session is still being answered'}), 409
+
+            streaming = False
+            try:
+                thread_id = thread_cache.get(session_id)
+                add_question(thread_id, question)
 
-        response = check_status(thread.id, run.id)
+                if data.get('stream'):
+                    answer = stream_answer(stream_assistant(thread_id), on_close=release)
+                    streaming = True
+                    return answer
+
+                run = run_assistant(thread_id)
+
+                response = check_status(thread_id, run.id)
+            finally:
+                # A streamed answer lets the session's next question in once it is done
+                if not streaming:
+                    release()
 
         if response:
             return jsonify({'answer': response}), 200
@@ -176,6 +460,10 @@ def ask_question():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/metrics')
+def metrics():
+    return jsonify({'thread_cache': thread_cache.stats()})
+
+
 if __name__ == '__main__':
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     app.run(debug=True, port=3000)
@@ -0,0 +1,68 @@
+"""
+Benchmark POST /ask in streaming and polling mode against the local mock Assistants API.
+
+Reports time-to-first-token (TTFT) and total latency percentiles for both modes:
+
+    python bench_ask.py --requests 50
+"""
+import argparse
+import os
+import statistics
+import time
+
+import mock_assistants
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def ask(test_client, stream):
+    start = time.perf_counter()
+    response = test_client.post('/ask', json={'question': 'What is this document about?', 'stream': stream},
+                                buffered=False)
+    first_token = None
+    for chunk in response.response:
+        if first_token is None and chunk:
+            first_token = time.perf_counter() - start
+    total = time.perf_counter() - start
+    response.close()
+    assert response.status_code == 200, response.status_code
+    return first_token or total, total
+
+
+def report(name, results):
+    ttft = [r[0] * 1000 for r in results]
+    total = [r[1] * 1000 for r in results]
+    print(f"{name:<10} TTFT p50 {statistics.median(ttft):8.1f} ms  p99 {percentile(ttft, 99):8.1f} ms   "
+          f"total p50 {statistics.median(total):8.1f} ms  p99 {percentile(total, 99):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--run-latency", type=float, default=mock_assistants.RUN_LATENCY)
+    parser.add_argument("--token-delay", type=float, default=mock_assistants.TOKEN_DELAY)
+    args = parser.parse_args()
+
+    server, base_url = mock_assistants.start_in_background(run_latency=args.run_latency,
+                                                           token_delay=args.token_delay)
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="test", ASSISTANT_ID="asst_mock")
+
+    import app
+
+    test_client = app.app.test_client()
+    print(f"Mock run: {args.run_latency * 1000:.0f} ms to first token, {args.token_delay * 1000:.0f} ms per token, "
+          f"{server.RequestHandlerClass.state.run_duration() * 1000:.0f} ms per answer")
+
+    for name, stream in (("streaming", True), ("polling", False)):
+        ask(test_client, stream)  # Warm up the connection pool
+        report(name, [ask(test_client, stream) for _ in range(args.requests)])
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark the PDF to text pipeline in pdf_chunker.py with different numbers of worker processes.
+
+Reports pages/sec and peak RSS of the main process and of the largest worker. Without --pdf, a 500-page
+sample document is generated first:
+
+    python bench_pdf.py --pages 500 --max-workers 8
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = ("assistant vector store document page question answer search index chunk text file upload thread "
+         "run message model retrieval passage context summary section paragraph table figure").split()
+
+
+def write_sample_pdf(path, pages, lines_per_page=60):
+    """Write a plain PDF with `pages` pages of random Helvetica text."""
+    random.seed(0)
+    offsets = []
+    with open(path, 'wb') as f:
+        def add_object(body):
+            offsets.append(f.tell())
+            f.write(f"{len(offsets)} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = " ".join(f"{4 + 2 * n} 0 R" for n in range(pages))
+        add_object(b"<< /Type /Catalog /Pages 2 0 R >>")
+        add_object(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        for n in range(pages):
+            lines = [" ".join(random.choices(WORDS, k=12)) for _ in range(lines_per_page)]
+            content = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+            add_object(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R "
+                       f">> >> /Contents {5 + 2 * n} 0 R >>".encode())
+            add_object(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def worker_peak_rss_kb():
+    """Largest peak RSS of the processes started by this one, which the shared pool keeps running."""
+    parents = {}
+    for name in os.listdir('/proc'):
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                parents[int(name)] = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (ValueError, OSError):
+            continue
+    descendants = {os.getpid()}
+    while True:
+        found = {pid for pid, parent in parents.items() if parent in descendants} - descendants
+        if not found:
+            break
+        descendants |= found
+    peak = 0
+    for pid in descendants - {os.getpid()}:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        peak = max(peak, int(line.split()[1]))
+        except OSError:
+            continue
+    return peak
+
+
+def measure(path, workers):
+    """Run the pipeline once in this process and print its statistics as JSON."""
+    from pdf_chunker import iter_chunks, iter_pages, iter_text_files
+
+    start = time.perf_counter()
+    pages = set()
+    text_bytes = 0
+
+    def count_pages(chunks):
+        for chunk in chunks:
+            pages.add(chunk['page'])
+            yield chunk
+
+    for _, buffer in iter_text_files(count_pages(iter_chunks(iter_pages(path, workers))), 'sample'):
+        text_bytes += len(buffer.getbuffer())
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'pages': len(pages),
+        'seconds': elapsed,
+        'text_bytes': text_bytes,
+        'rss_main_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'rss_worker_kb': worker_peak_rss_kb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdf", help="PDF to process instead of a generated sample")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--measure", type=int, metavar="WORKERS", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        return measure(args.pdf, args.measure)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.pdf
+        if not path:
+            path = os.path.join(tmp_dir, 'sample.pdf')
+            write_sample_pdf(path, args.pages)
+        print(f"{os.path.basename(path)}: {os.path.getsize(path) / 1e6:.1f} MB")
+        print("workers     pages/s   peak RSS main   peak RSS worker   text size")
+
+        workers = 1
+        while workers <= args.max_workers:
+            # A fresh process per run, so the peak RSS of one run does not hide the next
+            output = subprocess.run([sys.executable, __file__, '--pdf', path, '--measure', str(workers)],
+                                    check=True, capture_output=True, text=True).stdout
+            stats = json.loads(output)
+            print(f"{workers:>7}  {stats['pages'] / stats['seconds']:10.1f}  {stats['rss_main_kb'] / 1024:11.1f} MB"
+                  f"  {stats['rss_worker_kb'] / 1024:13.1f} MB  {stats['text_bytes'] / 1e6:7.2f} MB")
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare the local BM25 backend with the Assistants vector store flow, stubbed by the local mock API.
+
+Builds both indexes over a generated corpus, then times searches and POST /ask with each backend:
+
+    python bench_retrieval.py --pages 3000 --requests 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import mock_assistants
+from bench_ask import percentile
+
+
+def make_corpus(pages, words_per_page=400, vocabulary=5000):
+    """Return (page_number, text) pairs with a Zipf-like word distribution and a list of sample queries."""
+    random.seed(0)
+    words = [f"w{n}" for n in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    corpus = []
+    for page in range(1, pages + 1):
+        lines = [" ".join(random.choices(words, weights, k=20)) for _ in range(words_per_page // 20)]
+        corpus.append((page, "\n".join(lines)))
+    queries = [" ".join(random.choices(words[50:2000], k=4)) for _ in range(200)]
+    return corpus, queries
+
+
+def report(name, values):
+    values = [v * 1000 for v in values]
+    print(f"  {name:<28} p50 {statistics.median(values):9.2f} ms  p99 {percentile(values, 99):9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=3000)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    server, base_url = mock_assistants.start_in_background()
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="test", ASSISTANT_ID="asst_mock")
+
+    import app
+    from local_retrieval import BM25Index
+    from pdf_chunker import iter_chunks, iter_text_files
+
+    corpus, queries = make_corpus(args.pages)
+    test_client = app.app.test_client()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        app.ingestion_index = app.IngestionIndex(os.path.join(tmp_dir, 'ingested.json'))
+
+        start = time.perf_counter()
+        index = BM25Index()
+        index.add('corpus', 'corpus.pdf', iter_chunks(corpus))
+        index.search(queries[0])  # Builds the NumPy posting arrays
+        local_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        file_ids = app.upload_files(iter_text_files(iter_chunks(corpus), 'corpus'), lambda stage, **info: None)
+        vector_store_id = app.get_vector_store_id()
+        batch = app.client.beta.vector_stores.file_batches.create(vector_store_id=vector_store_id,
+                                                                  file_ids=file_ids)
+        while app.client.beta.vector_stores.file_batches.retrieve(
+                batch.id, vector_store_id=vector_store_id).status == 'in_progress':
+            time.sleep(0.05)
+        assistants_build = time.perf_counter() - start
+
+        search_times = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query)
+            search_times.append(time.perf_counter() - start)
+
+        ask_times = {}
+        for backend in ('local', 'assistants'):
+            app.RETRIEVAL_BACKEND = backend
+            app.local_index = index
+            ask_times[backend] = []
+            for query in queries[:args.requests]:
+                start = time.perf_counter()
+                response = test_client.post('/ask', json={'question': query})
+                assert response.status_code == 200, response.json
+                ask_times[backend].append(time.perf_counter() - start)
+
+    print(f"Corpus: {args.pages} pages, {len(index)} chunks, {len(file_ids)} text files")
+    print("Index build")
+    print(f"  local BM25                   {local_build * 1000:9.1f} ms")
+    print(f"  Assistants vector store      {assistants_build * 1000:9.1f} ms (stubbed)")
+    print("Query latency")
+    report("local BM25 search", search_times)
+    report("/ask, local backend", ask_times['local'])
+    report("/ask, Assistants backend", ask_times['assistants'])
+    print("Upstream calls:", server.RequestHandlerClass.state.calls)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
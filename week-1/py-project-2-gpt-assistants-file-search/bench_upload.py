@@ -0,0 +1,83 @@
+"""
+Load test POST /upload against the local mock Assistants API with 1 to N upload workers.
+
+Every run uploads the same number of distinct PDFs, a few per request, and waits until the vector store
+reports all of them as indexed:
+
+    python bench_upload.py --files 32 --max-workers 8
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import mock_assistants
+
+
+def run(app, test_client, workers, files, files_per_request, index_path):
+    from ingestion_index import IngestionIndex
+    from upload_jobs import UploadJobs
+
+    app.ingestion_index = IngestionIndex(index_path)
+    app.PREPROCESS_PDFS = False  # The generated files are random bytes, not real PDFs
+    app.upload_jobs = UploadJobs(workers=workers, max_pending=files)
+
+    start = time.perf_counter()
+    status_urls = []
+    # Keep the app's progress messages out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for first in range(0, files, files_per_request):
+            pdfs = [(io.BytesIO(os.urandom(64 * 1024)), f'doc-{n}.pdf')
+                    for n in range(first, min(first + files_per_request, files))]
+            response = test_client.post('/upload', data={'file': pdfs})
+            assert response.status_code == 202, response.json
+            status_urls.append(response.json['status_url'])
+        accepted = time.perf_counter() - start
+
+        while status_urls:
+            time.sleep(0.02)
+            for url in list(status_urls):
+                job = test_client.get(url).json
+                assert job['status'] != 'failed', job
+                if job['status'] == 'completed':
+                    status_urls.remove(url)
+        elapsed = time.perf_counter() - start
+
+    print(f"{workers:>7}  {files / elapsed:10.1f} files/s  {elapsed:8.2f} s total  "
+          f"{accepted / (files / files_per_request) * 1000:6.1f} ms per request to accept")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--files-per-request", type=int, default=4)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--upload-latency", type=float, default=mock_assistants.UPLOAD_LATENCY)
+    parser.add_argument("--index-latency", type=float, default=mock_assistants.INDEX_LATENCY)
+    args = parser.parse_args()
+
+    server, base_url = mock_assistants.start_in_background(upload_latency=args.upload_latency,
+                                                           index_latency=args.index_latency)
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="test", ASSISTANT_ID="asst_mock")
+
+    import app
+
+    test_client = app.app.test_client()
+    print(f"Mock API: {args.upload_latency * 1000:.0f} ms per file upload, "
+          f"{args.index_latency * 1000:.0f} ms to index a file")
+    print("workers  throughput")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workers = 1
+        while workers <= args.max_workers:
+            run(app, test_client, workers, args.files, args.files_per_request,
+                os.path.join(tmp_dir, f'ingested-{workers}.json'))
+            workers *= 2
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+
+
+class IngestionIndex:
+    """
+    Local record of the files already added to the vector store, keyed by the SHA-256 of their contents.
+
+    A file being added is reserved first, so concurrent uploads of the same file add it only once: the others
+    are told the outcome of the first one when it is added or released, without waiting for it.
+
+    The index also remembers the long-lived vector store and the store the assistant currently searches, so
+    both survive a restart. It is saved as JSON and rewritten atomically after every change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reserved = {}  # Digest of a file being added -> callbacks of the later uploads of the same file
+        self._data = {'vector_store_id': None, 'assistant_vector_store_id': None, 'files': {}}
+
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self._data.update(json.load(f))
+
+    def get(self, digest):
+        with self._lock:
+            return self._data['files'].get(digest)
+
+    def reserve(self, digest, on_done):
+        """
+        Reserve a file to add it. Returns False if it is already in the index or being added, and then calls
+        `on_done(record)` with its record once it is in the index, or with None if its upload was released.
+        """
+        with self._lock:
+            if digest in self._reserved:
+                self._reserved[digest].append(on_done)
+                return False
+            record = self._data['files'].get(digest)
+            if record is None:
+                self._reserved[digest] = []
+                return True
+        on_done(record)
+        return False
+
+    def release(self, digest):
+        """Give up a reservation without adding the file."""
+        with self._lock:
+            callbacks = self._reserved.pop(digest, [])
+        for on_done in callbacks:
+            on_done(None)
+
+    def add(self, digest, record):
+        with self._lock:
+            self._data['files'][digest] = record
+            callbacks = self._reserved.pop(digest, [])
+            self._save()
+        for on_done in callbacks:
+            on_done(record)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data['files'])
+
+    @property
+    def vector_store_id(self):
+        return self._data['vector_store_id']
+
+    @vector_store_id.setter
+    def vector_store_id(self, value):
+        with self._lock:
+            self._data['vector_store_id'] = value
+            self._save()
+
+    @property
+    def assistant_vector_store_id(self):
+        return self._data['assistant_vector_store_id']
+
+    @assistant_vector_store_id.setter
+    def assistant_vector_store_id(self, value):
+        with self._lock:
+            self._data['assistant_vector_store_id'] = value
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,110 @@
+"""
+Local alternative to the Assistants vector store: a BM25 index over the text chunks of the uploaded PDFs.
+
+Chunks are kept in memory with an inverted index from terms to the chunks containing them. Scoring a query
+only touches the posting lists of its terms, which are turned into NumPy arrays the first time they are
+searched. Chunks are also appended to a JSONL file, so the index is rebuilt after a restart.
+"""
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'\w+')
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, path=None):
+        self.path = path
+        self.chunks = []
+        self.digests = set()
+        self._postings = {}  # term -> ([chunk indexes], [term frequencies])
+        self._arrays = {}  # term -> (chunk indexes, term frequencies) as NumPy arrays
+        self._lengths = []
+        self._length_array = None
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    self._add_chunk(json.loads(line))
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def add(self, digest, filename, chunks):
+        """Index the chunks of one document. Returns the number of chunks added, 0 for a known document."""
+        # Read the chunks before taking the lock, so searches are not blocked while a PDF is being extracted
+        records = [dict(chunk, digest=digest, filename=filename) for chunk in chunks]
+        with self._lock:
+            if digest in self.digests:
+                return 0
+
+            for record in records:
+                self._add_chunk(record)
+            self.digests.add(digest)
+
+            if self.path:
+                with open(self.path, 'a') as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            return len(records)
+
+    def search(self, query, k=5):
+        """Return the k best matching chunks for a query, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not self.chunks or not terms:
+                return []
+
+            if self._length_array is None:
+                self._length_array = np.array(self._lengths, dtype=np.float32)
+            lengths = self._length_array
+            count = len(lengths)
+            norm = K1 * (1 - B + B * lengths / lengths.mean())
+
+            scores = np.zeros(count, dtype=np.float32)
+            for term in terms:
+                postings = self._posting_arrays(term)
+                if postings is None:
+                    continue
+                indexes, frequencies = postings
+                idf = math.log(1 + (count - len(indexes) + 0.5) / (len(indexes) + 0.5))
+                scores[indexes] += idf * frequencies * (K1 + 1) / (frequencies + norm[indexes])
+
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [self.chunks[i] for i in top if scores[i] > 0]
+
+    def _add_chunk(self, record):
+        index = len(self.chunks)
+        terms = Counter(tokenize(record['text']))
+        for term, frequency in terms.items():
+            indexes, frequencies = self._postings.setdefault(term, ([], []))
+            indexes.append(index)
+            frequencies.append(frequency)
+            self._arrays.pop(term, None)
+
+        self.chunks.append(record)
+        self.digests.add(record['digest'])
+        self._lengths.append(sum(terms.values()))
+        self._length_array = None
+
+    def _posting_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None and term in self._postings:
+            indexes, frequencies = self._postings[term]
+            arrays = (np.array(indexes, dtype=np.int64), np.array(frequencies, dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
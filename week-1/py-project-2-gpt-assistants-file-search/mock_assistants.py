@@ -0,0 +1,338 @@
+"""
+Fake Assistants API for bench_ask.py, bench_retrieval.py and bench_upload.py.
+
+Every run answers ANSWER after RUN_LATENCY, one token every TOKEN_DELAY, whether it is streamed or polled, and
+a file batch reports its files as indexed INDEX_LATENCY after it was created. Chat completions give the same
+answer, for the local retrieval backend. To try the app without an API key:
+
+    python mock_assistants.py --port 4010
+    OPENAI_BASE_URL=http://127.0.0.1:4010/v1 OPENAI_API_KEY=test ASSISTANT_ID=asst_mock python app.py
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RUN_LATENCY = 0.3  # Seconds from run creation until the first token is produced
+TOKEN_DELAY = 0.02  # Seconds between two generated tokens
+UPLOAD_LATENCY = 0.2  # Seconds to accept an uploaded file
+INDEX_LATENCY = 0.5  # Seconds for a vector store to finish indexing a file
+ANSWER = ("The document says that the assistant answers questions using the uploaded PDF as its only source of "
+          "truth, and quotes the relevant passage when it can.")
+
+_ids = itertools.count(1)
+
+
+def new_id(prefix):
+    return f"{prefix}_{next(_ids)}"
+
+
+class MockState:
+    def __init__(self, run_latency=RUN_LATENCY, token_delay=TOKEN_DELAY, upload_latency=UPLOAD_LATENCY,
+                 index_latency=INDEX_LATENCY, answer=ANSWER):
+        self.run_latency = run_latency
+        self.token_delay = token_delay
+        self.upload_latency = upload_latency
+        self.index_latency = index_latency
+        self.tokens = re.findall(r'\S+\s*', answer)
+        self.answer = answer
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.runs = {}
+        self.files = {}
+        self.vector_stores = {}
+        self.indexing_started = {}
+        self.batches = {}
+        self.calls = {}
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def run_duration(self):
+        return self.run_latency + len(self.tokens) * self.token_delay
+
+
+def thread_object(thread_id):
+    return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {},
+            "tool_resources": {}}
+
+
+def message_object(thread_id, role, text, run_id=None, message_id=None):
+    return {
+        "id": message_id or new_id("msg"),
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "status": "completed",
+        "run_id": run_id,
+        "assistant_id": "asst_mock" if role == "assistant" else None,
+        "attachments": [],
+        "metadata": {},
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+    }
+
+
+def run_object(run, status):
+    return {
+        "id": run["id"],
+        "object": "thread.run",
+        "created_at": int(run["created_at"]),
+        "thread_id": run["thread_id"],
+        "assistant_id": run["assistant_id"],
+        "status": status,
+        "model": "gpt-4o-mini",
+        "instructions": "",
+        "tools": [],
+        "metadata": {},
+        "parallel_tool_calls": True,
+    }
+
+
+def batch_object(batch_id, vector_store_id, total, completed):
+    return {
+        "id": batch_id,
+        "object": "vector_store.file_batch",
+        "vector_store_id": vector_store_id,
+        "status": "completed" if completed == total else "in_progress",
+        "created_at": int(time.time()),
+        "file_counts": {"in_progress": total - completed, "completed": completed, "failed": 0, "cancelled": 0,
+                        "total": total},
+    }
+
+
+def chat_completion_object(text):
+    return {
+        "id": new_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+    }
+
+
+class MockAssistantsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # Set by make_server()
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def read_json(self):
+        body = self.read_body()
+        return json.loads(body) if body else {}
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_sse(self, event, data):
+        payload = data if isinstance(data, str) else json.dumps(data)
+        self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        state = self.state
+
+        match = re.fullmatch(r"/v1/threads/([^/]+)/runs/([^/]+)", path)
+        if match:
+            state.count("runs.retrieve")
+            run = state.runs.get(match.group(2))
+            if not run:
+                return self.send_json({"error": {"message": "No such run"}}, 404)
+            done = time.monotonic() - run["started"] >= state.run_duration()
+            return self.send_json(run_object(run, "completed" if done else "in_progress"))
+
+        match = re.fullmatch(r"/v1/vector_stores/([^/]+)/file_batches/([^/]+)", path)
+        if match:
+            state.count("vector_stores.file_batches.retrieve")
+            file_ids = state.batches.get(match.group(2))
+            if file_ids is None:
+                return self.send_json({"error": {"message": "No such batch"}}, 404)
+            completed = sum(time.monotonic() - state.indexing_started[file_id] >= state.index_latency
+                            for file_id in file_ids)
+            return self.send_json(batch_object(match.group(2), match.group(1), len(file_ids), completed))
+
+        match = re.fullmatch(r"/v1/threads/([^/]+)/messages", path)
+        if match:
+            state.count("messages.list")
+            run_id = parse_qs(urlparse(self.path).query).get("run_id", [None])[0]
+            messages = [m for m in state.threads.get(match.group(1), []) if not run_id or m["run_id"] == run_id]
+            return self.send_json({"object": "list", "data": list(reversed(messages)), "has_more": False})
+
+        self.send_json({"error": {"message": f"Unknown route {path}"}}, 404)
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        state = self.state
+
+        if path == "/v1/files":
+            state.count("files.create")
+            size = len(self.read_body())
+            time.sleep(state.upload_latency)
+            file_id = new_id("file")
+            with state.lock:
+                state.files[file_id] = size
+            return self.send_json({"id": file_id, "object": "file", "bytes": size, "created_at": int(time.time()),
+                                   "filename": "upload.pdf", "purpose": "assistants", "status": "processed"})
+
+        body = self.read_json()
+
+        if path == "/v1/vector_stores":
+            state.count("vector_stores.create")
+            store_id = new_id("vs")
+            with state.lock:
+                state.vector_stores[store_id] = []
+            return self.send_json({"id": store_id, "object": "vector_store", "name": body.get("name", ""),
+                                   "status": "completed", "usage_bytes": 0, "created_at": int(time.time()),
+                                   "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0,
+                                                   "total": 0}})
+
+        match = re.fullmatch(r"/v1/vector_stores/([^/]+)/file_batches", path)
+        if match:
+            state.count("vector_stores.file_batches.create")
+            file_ids = body.get("file_ids", [])
+            batch_id = new_id("vsfb")
+            with state.lock:
+                state.vector_stores.setdefault(match.group(1), []).extend(file_ids)
+                state.batches[batch_id] = file_ids
+                for file_id in file_ids:
+                    state.indexing_started[file_id] = time.monotonic()
+            return self.send_json(batch_object(batch_id, match.group(1), len(file_ids), 0))
+
+        if path == "/v1/chat/completions":
+            state.count("chat.completions.create")
+            if body.get("stream"):
+                return self.stream_chat_completion()
+            time.sleep(state.run_duration())
+            return self.send_json(chat_completion_object(state.answer))
+
+        match = re.fullmatch(r"/v1/assistants/([^/]+)", path)
+        if match:
+            state.count("assistants.update")
+            return self.send_json({"id": match.group(1), "object": "assistant", "created_at": int(time.time()),
+                                   "model": "gpt-4o-mini", "tools": [{"type": "file_search"}],
+                                   "tool_resources": body.get("tool_resources", {})})
+
+        if path == "/v1/threads":
+            state.count("threads.create")
+            thread_id = new_id("thread")
+            with state.lock:
+                state.threads[thread_id] = []
+            return self.send_json(thread_object(thread_id))
+
+        match = re.fullmatch(r"/v1/threads/([^/]+)/messages", path)
+        if match:
+            state.count("messages.create")
+            message = message_object(match.group(1), body.get("role", "user"), body.get("content", ""))
+            with state.lock:
+                state.threads.setdefault(match.group(1), []).append(message)
+            return self.send_json(message)
+
+        match = re.fullmatch(r"/v1/threads/([^/]+)/runs", path)
+        if match:
+            state.count("runs.create")
+            thread_id = match.group(1)
+            run = {"id": new_id("run"), "thread_id": thread_id, "assistant_id": body.get("assistant_id"),
+                   "created_at": time.time(), "started": time.monotonic()}
+            with state.lock:
+                state.runs[run["id"]] = run
+                state.threads.setdefault(thread_id, []).append(
+                    message_object(thread_id, "assistant", state.answer, run_id=run["id"]))
+            if body.get("stream"):
+                return self.stream_run(run)
+            return self.send_json(run_object(run, "queued"))
+
+        self.send_json({"error": {"message": f"Unknown route {path}"}}, 404)
+
+    def stream_run(self, run):
+        state = self.state
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        message_id = new_id("msg")
+        in_progress = message_object(run["thread_id"], "assistant", "", run_id=run["id"], message_id=message_id)
+        in_progress["status"] = "in_progress"
+        in_progress["content"] = []
+
+        self.send_sse("thread.run.created", run_object(run, "queued"))
+        self.send_sse("thread.run.in_progress", run_object(run, "in_progress"))
+        time.sleep(state.run_latency)
+        self.send_sse("thread.message.created", in_progress)
+        for token in state.tokens:
+            self.send_sse("thread.message.delta", {
+                "id": message_id,
+                "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": token}}]},
+            })
+            time.sleep(state.token_delay)
+        self.send_sse("thread.message.completed",
+                      message_object(run["thread_id"], "assistant", state.answer, run_id=run["id"],
+                                     message_id=message_id))
+        self.send_sse("thread.run.completed", run_object(run, "completed"))
+        self.send_sse("done", "[DONE]")
+
+
+    def stream_chat_completion(self):
+        state = self.state
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(state.run_latency)
+        for token in state.tokens:
+            chunk = chat_completion_object(token)
+            chunk["object"] = "chat.completion.chunk"
+            chunk["choices"] = [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(state.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(port=0, **settings):
+    """Create a mock server bound to localhost. Use port=0 to pick a free port."""
+    handler = type("Handler", (MockAssistantsHandler,), {"state": MockState(**settings)})
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def start_in_background(**settings):
+    """Start a mock server on a free port and return (server, base_url)."""
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI Assistants API.")
+    parser.add_argument("--port", type=int, default=4010)
+    parser.add_argument("--run-latency", type=float, default=RUN_LATENCY)
+    parser.add_argument("--token-delay", type=float, default=TOKEN_DELAY)
+    parser.add_argument("--upload-latency", type=float, default=UPLOAD_LATENCY)
+    parser.add_argument("--index-latency", type=float, default=INDEX_LATENCY)
+    args = parser.parse_args()
+
+    server = make_server(args.port, run_latency=args.run_latency, token_delay=args.token_delay,
+                         upload_latency=args.upload_latency, index_latency=args.index_latency)
+    print(f"Mock Assistants API listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
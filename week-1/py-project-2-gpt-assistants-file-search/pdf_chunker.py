@@ -0,0 +1,145 @@
+"""
+Turn a PDF into compact plain-text files before it is sent to the vector store.
+
+Pages are extracted with pdfplumber in a pool of worker processes, a few pages per task, and only a bounded
+number of tasks are in flight at once, so memory stays flat even for documents with hundreds of pages. The
+text is then cut into chunks that remember the page and character offset they came from.
+
+The pool is started on the first PDF and shared by the next ones. Its processes are started by a fork server
+rather than forked from the app, whose threads may hold locks at the moment of the fork.
+"""
+import atexit
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdfplumber
+
+PDF_WORKERS = os.cpu_count() or 1
+PAGES_PER_TASK = 8
+CHUNK_SIZE = 2000  # Characters per chunk
+TEXT_FILE_SIZE = 512 * 1024  # Bytes per generated text file
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pools = {}  # Number of workers -> ProcessPoolExecutor
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """The shared pool of `workers` processes, started on first use."""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                                  mp_context=multiprocessing.get_context(START_METHOD))
+        return _pools[workers]
+
+
+@atexit.register
+def shutdown_pools():
+    with _pools_lock:
+        while _pools:
+            _pools.popitem()[1].shutdown(cancel_futures=True)
+
+
+def extract_pages(path, start, stop):
+    """Return (page_number, text) for the pages in [start, stop), numbered from 1."""
+    pages = []
+    with pdfplumber.open(path, pages=range(start + 1, stop + 1)) as pdf:
+        for page in pdf.pages:
+            pages.append((page.page_number, page.extract_text() or ''))
+            page.close()
+    return pages
+
+
+def iter_pages(path, workers=PDF_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """Yield (page_number, text) for every page of a PDF, in order."""
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+    if workers <= 1:
+        for start, stop in ranges:
+            yield from extract_pages(path, start, stop)
+        return
+
+    executor = get_pool(workers)
+    # Keep every worker busy, but never hold more than two tasks per worker in memory
+    pending = deque()
+    try:
+        for start, stop in ranges:
+            pending.append(executor.submit(extract_pages, path, start, stop))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        # A worker died, e.g. killed for its memory; the next PDF gets a new pool
+        with _pools_lock:
+            if _pools.get(workers) is executor:
+                del _pools[workers]
+        raise
+    finally:
+        # Pages of a PDF that was given up are not extracted for nothing
+        for future in pending:
+            future.cancel()
+
+
+def iter_chunks(pages, chunk_size=CHUNK_SIZE):
+    """Split page texts into chunks of at most chunk_size characters, cutting at line breaks or spaces."""
+    for page_number, text in pages:
+        offset = 0
+        while offset < len(text):
+            end = min(offset + chunk_size, len(text))
+            if end < len(text):
+                cut = text.rfind('\n', offset, end)
+                if cut <= offset:
+                    cut = text.rfind(' ', offset, end)
+                if cut > offset:
+                    end = cut + 1
+
+            chunk = text[offset:end].strip()
+            if chunk:
+                yield {'page': page_number, 'offset': offset, 'text': chunk}
+            offset = end
+
+
+def iter_text_files(chunks, name, max_size=TEXT_FILE_SIZE):
+    """Pack chunks into (filename, buffer) text files of about max_size bytes each."""
+    part = 1
+    buffer = io.BytesIO()
+    for chunk in chunks:
+        entry = f"[page {chunk['page']}, offset {chunk['offset']}]\n{chunk['text']}\n\n".encode('utf-8')
+        if buffer.tell() and buffer.tell() + len(entry) > max_size:
+            buffer.seek(0)
+            yield f"{name}-{part}.txt", buffer
+            part += 1
+            buffer = io.BytesIO()
+        buffer.write(entry)
+
+    if buffer.tell():
+        buffer.seek(0)
+        yield f"{name}-{part}.txt", buffer
+
+
+def pdf_to_chunks(stream, workers=PDF_WORKERS):
+    """Yield the text chunks of an uploaded PDF as soon as their pages are extracted."""
+    # The worker processes need a path to open, so the upload is copied to a temporary file first
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
+        for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+            pdf_file.write(chunk)
+
+    try:
+        yield from iter_chunks(iter_pages(pdf_file.name, workers))
+    finally:
+        os.remove(pdf_file.name)
+
+
+def pdf_to_text_files(filename, stream, workers=PDF_WORKERS):
+    """Convert an uploaded PDF into text files, yielding each one as soon as it is complete."""
+    name = os.path.splitext(filename)[0]
+    yield from iter_text_files(pdf_to_chunks(stream, workers), name)
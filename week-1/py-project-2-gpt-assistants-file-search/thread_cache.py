@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class ThreadCache:
+    """
+    Map client session IDs to Assistants thread IDs so a conversation keeps using the same thread.
+
+    Sessions are evicted least-recently-used first once there are more than `max_size` of them, and after
+    `ttl` seconds without a question. A few threads are created ahead of time in the background, so a new
+    session does not have to wait for `threads.create`.
+
+    A thread does not accept a new message while a run on it is active, so the questions of one session are
+    answered one at a time with `hold`.
+    """
+
+    def __init__(self, create_thread, max_size=1000, ttl=3600, warm_size=4):
+        self.create_thread = create_thread
+        self.max_size = max_size
+        self.ttl = ttl
+        self.warm_size = warm_size
+
+        self._sessions = OrderedDict()  # session_id -> (thread_id, last_used)
+        self._warm = deque()
+        self._held = {}  # session_id -> (lock, number of requests holding or waiting for it)
+        self._lock = threading.Lock()
+        self._refill = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.warm_hits = 0
+        self.lru_evictions = 0
+        self.ttl_evictions = 0
+
+        if warm_size:
+            self._refill.set()
+            threading.Thread(target=self._fill_warm_pool, daemon=True).start()
+
+    def get(self, session_id=None):
+        """Return the thread ID for a session, assigning a fresh thread to new or unknown sessions."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id) if session_id else None
+            if entry:
+                self._sessions[session_id] = (entry[0], now)
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            thread_id = self._warm.popleft() if self._warm else None
+            if thread_id:
+                self.warm_hits += 1
+
+        if self.warm_size:
+            self._refill.set()
+        if thread_id is None:
+            thread_id = self.create_thread()
+
+        if session_id:
+            with self._lock:
+                self._sessions[session_id] = (thread_id, now)
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > self.max_size:
+                    self._sessions.popitem(last=False)
+                    self.lru_evictions += 1
+        return thread_id
+
+    def hold(self, session_id, timeout=None):
+        """
+        Wait until no other question of the session is being answered. Returns a function that lets the next
+        question in, which can safely be called more than once, or None if the session is still busy after
+        `timeout` seconds.
+        """
+        with self._lock:
+            lock, users = self._held.get(session_id, (threading.Lock(), 0))
+            self._held[session_id] = (lock, users + 1)
+        acquired = lock.acquire(timeout=-1 if timeout is None else timeout)
+
+        released = threading.Lock()
+
+        def release():
+            if not released.acquire(blocking=False):
+                return
+            with self._lock:
+                if acquired:
+                    lock.release()
+                users = self._held[session_id][1] - 1
+                if users:
+                    self._held[session_id] = (lock, users)
+                else:
+                    del self._held[session_id]
+
+        if not acquired:
+            release()
+            return None
+        return release
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'sessions': len(self._sessions),
+                'warm_threads': len(self._warm),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'warm_hits': self.warm_hits,
+                'evictions': {'lru': self.lru_evictions, 'ttl': self.ttl_evictions},
+            }
+
+    def _expire(self, now):
+        # Sessions are kept in last-used order, so expired ones are always at the front
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used < self.ttl:
+                break
+            del self._sessions[session_id]
+            self.ttl_evictions += 1
+
+    def _fill_warm_pool(self):
+        while True:
+            self._refill.wait()
+            self._refill.clear()
+            while len(self._warm) < self.warm_size:
+                try:
+                    thread_id = self.create_thread()
+                except Exception as e:
+                    print(f"Error pre-creating thread: {e}")
+                    break
+                with self._lock:
+                    self._warm.append(thread_id)
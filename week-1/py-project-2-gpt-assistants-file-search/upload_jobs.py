@@ -0,0 +1,81 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+FINISHED_STAGES = {'completed', 'duplicate', 'failed', 'cancelled'}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UploadJobs:
+    """
+    Run uploads on a bounded pool of background workers and keep track of their progress.
+
+    A job is made of one task per uploaded file, and the tasks of a job run concurrently. At most
+    `max_pending` tasks may be queued or running at once; further submissions are refused with QueueFull
+    so the caller can ask the client to retry later.
+    """
+
+    def __init__(self, workers=4, max_pending=32, max_jobs=1000):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, tasks):
+        """
+        Start a job and return its ID. `tasks` is a list of (filename, func) pairs, where func is called on a
+        worker with an `on_stage(stage, **info)` callback to report its progress.
+        """
+        acquired = 0
+        for _ in tasks:
+            if not self._pending.acquire(blocking=False):
+                for _ in range(acquired):
+                    self._pending.release()
+                raise QueueFull("Too many uploads in progress, please try again later")
+            acquired += 1
+
+        job_id = uuid.uuid4().hex
+        files = [{'filename': filename, 'stage': 'queued'} for filename, _ in tasks]
+        with self._lock:
+            self._jobs[job_id] = files
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        for entry, (_, func) in zip(files, tasks):
+            self._executor.submit(self._run, entry, func)
+        return job_id
+
+    def get(self, job_id):
+        """Return a snapshot of a job with its overall status, or None for an unknown job."""
+        with self._lock:
+            files = self._jobs.get(job_id)
+            if files is None:
+                return None
+            files = [dict(entry) for entry in files]
+
+        stages = {entry['stage'] for entry in files}
+        if stages <= {'completed', 'duplicate'}:
+            status = 'completed'
+        elif stages <= FINISHED_STAGES:
+            status = 'failed'
+        else:
+            status = 'in_progress'
+        return {'id': job_id, 'status': status, 'files': files}
+
+    def _run(self, entry, func):
+        def on_stage(stage, **info):
+            with self._lock:
+                entry.update(info, stage=stage)
+
+        try:
+            func(on_stage)
+        except Exception as e:
+            on_stage('failed', error=str(e))
+        finally:
+            self._pending.release()
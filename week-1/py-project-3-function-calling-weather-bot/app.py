@@ -2,8 +2,11 @@ import os
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from weather_tools import weather_tools
+
 load_dotenv()
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+tools = weather_tools(ttl=int(os.getenv('WEATHER_CACHE_TTL', 600)))
 
 assistant_id = os.getenv('ASSISTANT_ID')
 thread_id = None
@@ -94,47 +97,10 @@ run = client.beta.threads.runs.create_and_poll(
 
 tool_outputs = []
 
-
-# Mock weather data
-def get_mock_weather_data(location):
-    # Simple logic to determine if location is in US (checking for state code)
-    is_us_location = ", " in location and len(location.split(", ")[1]) == 2
-
-    if is_us_location:
-        # US location - return Fahrenheit temperatures
-        temp = "57"
-        unit = "Fahrenheit"
-    else:
-        # Non-US location - return Celsius temperatures
-        temp = "14"
-        unit = "Celsius"
-
-    rain_prob = "0.06"
-    uv_risk = "0.30"
-    return temp, rain_prob, uv_risk, unit
-
-
 # Check if the run requires tool outputs
 if run.status == 'requires_action' and hasattr(run, 'required_action'):
-    temp, rain_prob, uv_risk, unit = get_mock_weather_data(location)
-
-    # Loop through each tool in the required action section
-    for tool in run.required_action.submit_tool_outputs.tool_calls:
-        if tool.function.name == "get_current_temperature":
-            tool_outputs.append({
-                "tool_call_id": tool.id,
-                "output": temp
-            })
-        elif tool.function.name == "get_rain_probability":
-            tool_outputs.append({
-                "tool_call_id": tool.id,
-                "output": rain_prob
-            })
-        elif tool.function.name == "get_UV_risk":
-            tool_outputs.append({
-                "tool_call_id": tool.id,
-                "output": uv_risk
-            })
+    # Run each tool call with its own arguments, at the same time
+    tool_outputs = tools.dispatch(run.required_action.submit_tool_outputs.tool_calls)
 
     # Submit all tool outputs at once after collecting them in a list
     if tool_outputs:
@@ -0,0 +1,75 @@
+"""
+Measure how long the weather bot's tool calls take for a question about several locations, with a slow stub weather
+provider instead of the mock data.
+
+Each question asks for the temperature, the rain probability and the UV risk of --locations locations, as the
+assistant does, in one run with a tool call per function and location. The question is asked twice, like a user
+asking again a minute later:
+
+    python bench_tools.py --locations 4 --delay 0.3
+"""
+import argparse
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from weather_tools import get_mock_weather_data, weather_tools
+
+LOCATIONS = ["San Francisco, CA", "London, UK", "Berlin, Germany", "New York, NY", "Tokyo, Japan", "Paris, France",
+             "Austin, TX", "Sydney, Australia"]
+
+
+class SlowProvider:
+    """The mock weather data, after `delay` seconds, like a weather API."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, location):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return get_mock_weather_data(location)
+
+
+def tool_calls(locations):
+    calls = []
+    for location in locations:
+        unit = "Fahrenheit" if location.endswith((", CA", ", NY", ", TX")) else "Celsius"
+        for name, arguments in (("get_current_temperature", {"location": location, "unit": unit}),
+                                ("get_rain_probability", {"location": location}),
+                                ("get_UV_risk", {"location": location})):
+            calls.append(SimpleNamespace(id=f"call_{len(calls)}",
+                                         function=SimpleNamespace(name=name, arguments=json.dumps(arguments))))
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--locations", type=int, default=4, choices=range(1, len(LOCATIONS) + 1))
+    parser.add_argument("--delay", type=float, default=0.3, help="Seconds per weather lookup")
+    args = parser.parse_args()
+
+    calls = tool_calls(LOCATIONS[:args.locations])
+    print(f"{len(calls)} tool calls for {args.locations} locations, {args.delay * 1000:.0f} ms per weather lookup")
+    print("dispatch                 first question   lookups   second question   lookups")
+    for label, ttl, max_workers in (("one at a time", 0, 1), ("concurrent", 0, 16), ("concurrent + cache", 600, 16)):
+        provider = SlowProvider(args.delay)
+        tools = weather_tools(provider, ttl=ttl, max_workers=max_workers)
+        results = []
+        for _ in range(2):
+            calls_before = provider.calls
+            start = time.perf_counter()
+            outputs = tools.dispatch(calls)
+            results.append((time.perf_counter() - start, provider.calls - calls_before))
+            assert all(not output["output"].startswith("Error") for output in outputs), outputs
+        tools.executor.shutdown()
+        (first, first_calls), (second, second_calls) = results
+        print(f"{label:<22}  {first * 1000:10.0f} ms  {first_calls:>8}  {second * 1000:11.0f} ms  {second_calls:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def normalize(value):
+    """Arguments with the case and whitespace of their strings normalized, so "London,  UK" is "london, uk"."""
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+
+class TtlCache:
+    """
+    Results of slow calls, kept for `ttl` seconds.
+
+    Concurrent lookups of the same key share one call: the first one makes it and the others wait for its
+    result. Failed calls are not kept.
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._entries = {}  # key -> (future, created)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, call):
+        """Return the cached result for `key`, or the result of `call()`."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry:
+                self.hits += 1
+                future = entry[0]
+                owner = False
+            else:
+                self.misses += 1
+                future = Future()
+                self._entries[key] = (future, now)
+                owner = True
+        if owner:
+            try:
+                future.set_result(call())
+            except Exception as e:
+                with self._lock:
+                    if self._entries.get(key, (None,))[0] is future:
+                        del self._entries[key]
+                future.set_exception(e)
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def _expire(self, now):
+        # Entries are kept in the order they were created, so expired ones are always at the front
+        while self._entries:
+            key, (_, created) = next(iter(self._entries.items()))
+            if now - created < self.ttl:
+                break
+            del self._entries[key]
+
+
+class ToolRegistry:
+    """
+    The functions the assistant can call, by name.
+
+    `dispatch` runs the tool calls of a run, each with its own JSON arguments, concurrently in a thread pool
+    and returns their outputs for `submit_tool_outputs`. Results are cached for `ttl` seconds, keyed on the
+    tool and its normalized arguments.
+    """
+
+    def __init__(self, max_workers=16, ttl=600):
+        self.tools = {}
+        self.cache = TtlCache(ttl)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def register(self, function, name=None):
+        self.tools[name or function.__name__] = function
+        return function
+
+    def call(self, name, arguments):
+        """Run one tool with its JSON arguments and return its output as a string."""
+        if name not in self.tools:
+            print(f"Unknown tool {name}")
+            return f"Error: unknown function {name}"
+        try:
+            function = self.tools[name]
+            kwargs = json.loads(arguments or "{}")
+            key = (name, json.dumps(normalize(kwargs), sort_keys=True))
+            return str(self.cache.get(key, lambda: function(**kwargs)))
+        except Exception as e:
+            # The assistant gets the error instead of the run waiting for an output that never comes
+            print(f"Tool {name}({arguments}) failed: {e!r}")
+            return f"Error: {e}"
+
+    def dispatch(self, tool_calls):
+        futures = [(tool.id, self.executor.submit(self.call, tool.function.name, tool.function.arguments))
+                   for tool in tool_calls]
+        return [{"tool_call_id": tool_call_id, "output": future.result()} for tool_call_id, future in futures]
+
+
+def is_us_location(location):
+    # Simple logic to determine if location is in US (checking for state code)
+    return ", " in location and len(location.split(", ")[1].strip()) == 2
+
+
+# Mock weather data
+def get_mock_weather_data(location):
+    if is_us_location(location):
+        # US location - return Fahrenheit temperatures
+        temp = "57"
+        unit = "Fahrenheit"
+    else:
+        # Non-US location - return Celsius temperatures
+        temp = "14"
+        unit = "Celsius"
+
+    rain_prob = "0.06"
+    uv_risk = "0.30"
+    return temp, rain_prob, uv_risk, unit
+
+
+def weather_tools(get_weather_data=get_mock_weather_data, ttl=600, max_workers=16):
+    """
+    A registry with the weather bot's tools on top of `get_weather_data(location)`, which returns
+    (temperature, rain probability, UV risk, unit) like `get_mock_weather_data`.
+
+    The tools for the same location share one lookup of its weather, cached like the tool results.
+    """
+    registry = ToolRegistry(max_workers, ttl)
+    weather = TtlCache(ttl)
+
+    def lookup(location):
+        return weather.get(normalize(location), lambda: get_weather_data(location))
+
+    def get_current_temperature(location, unit=None):
+        temp, _, _, data_unit = lookup(location)
+        if unit == "Celsius" and data_unit == "Fahrenheit":
+            return f"{(float(temp) - 32) * 5 / 9:.0f}"
+        if unit == "Fahrenheit" and data_unit == "Celsius":
+            return f"{float(temp) * 9 / 5 + 32:.0f}"
+        return temp
+
+    def get_rain_probability(location):
+        return lookup(location)[1]
+
+    def get_UV_risk(location):
+        return lookup(location)[2]
+
+    for function in (get_current_temperature, get_rain_probability, get_UV_risk):
+        registry.register(function)
+    return registry
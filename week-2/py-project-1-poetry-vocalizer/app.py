@@ -1,7 +1,14 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, send_file, Response
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from dotenv import load_dotenv
+from audio_cache import AudioCache, audio_key
 
 load_dotenv()
 
@@ -10,6 +17,69 @@ app = Flask(__name__)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 VOICE_ID = "ThT5KcBeYPX3keUQqHPh"
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1")
+TTS_STREAM_URL = f"{ELEVENLABS_BASE_URL}/text-to-speech/{VOICE_ID}/stream"
+OPENAI_HEADERS = {
+    "Authorization": f"Bearer {OPENAI_API_KEY}",
+    "Content-Type": "application/json",
+}
+ELEVENLABS_HEADERS = {
+    "xi-api-key": ELEVENLABS_API_KEY,
+    "Content-Type": "application/json",
+}
+
+CONNECT_TIMEOUT = 5  # Seconds to open a connection
+READ_TIMEOUT = 60  # Seconds to wait for the response, synthesizing a long poem can take a while
+MAX_RETRIES = 3  # Retries on 429 and 5xx responses and on errors connecting
+BACKOFF_FACTOR = 0.5  # Seconds, doubled after every retry (retry-after is honored when present)
+POOL_SIZE = 32  # Connections kept alive per host, roughly the number of requests served at once
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_session():
+    """Create a requests Session that keeps connections alive per host and retries transient errors."""
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,  # Also retry POST on connect errors and on these statuses
+        read=False,  # But not after a read error: the request was sent and may already be generating and billed
+        respect_retry_after_header=True,
+        raise_on_status=False,  # Return the last error response so its message can be shown
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+TTS_MODEL = "eleven_monolingual_v1"
+VOICE_SETTINGS = {
+    "stability": 0.7,
+    "similarity_boost": 0.75,
+}
+AUDIO_CACHE_DIR = os.path.join("static", "audio")
+AUDIO_CACHE_MAX_BYTES = 500 * 1024 * 1024  # Least recently played voice-overs are deleted above this size
+AUDIO_MAX_AGE = 365 * 24 * 3600  # Seconds browsers may keep a cached voice-over
+MAX_PENDING = 256  # Streamed voice-overs that were requested but not downloaded yet
+SYNTHESIS_WAIT = 300  # Seconds a request waits for the same voice-over requested by another one
+SEGMENT_LINES = 2  # Lines of the poem voiced together by /poem-to-speech, a verse break always ends a segment
+TTS_WORKERS = 8  # Segments synthesized at the same time, across all requests
+
+
+# Shared by all requests, so calls to OpenAI and ElevenLabs reuse open connections
+http = make_session()
+audio_cache = AudioCache(AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES)
+
+# Lyrics of the latest streamed voice-overs by audio key, so /audio/<key>.mp3 can synthesize them
+pending_lyrics = OrderedDict()
+pending_lock = threading.Lock()
+# Voice-overs being synthesized, by audio key. Other requests for the same audio wait for the event.
+synthesizing = {}
+
+tts_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS)
 
 
 @app.route("/")
@@ -17,6 +87,81 @@ def index():
     return render_template("index.html")
 
 
+def poem_request(words, stream=False):
+    """Return the JSON body of the chat completion request that writes the poem."""
+    prompt = (f"Write a two-verse poem using the words: {', '.join(words)}. Each verse should be 4-6 lines long and "
+              f"creatively incorporate the words. Word 1: (Name of the person being celebrated) Word 2: (Event being "
+              f"celebrated) Please ensure the poem is heartfelt and celebratory.")
+
+    return {
+        "model": "gpt-4o-mini",  # Fixed model name
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 200,  # Increased token limit for longer poems
+        "stream": stream,
+    }
+
+
+def request_poem(words, stream=False):
+    return http.post(
+        f"{OPENAI_BASE_URL}/chat/completions",
+        headers=OPENAI_HEADERS,
+        json=poem_request(words, stream),
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        stream=stream,
+    )
+
+
+def stream_poem(words):
+    """Yield the text of a new poem as it is generated."""
+    with request_poem(words, stream=True) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"OpenAI API error: {response.text}")
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            if line == "data: [DONE]":
+                break
+            choices = json.loads(line[len("data: "):])["choices"]
+            if choices and choices[0]["delta"].get("content"):
+                yield choices[0]["delta"]["content"]
+
+
+class VerseSplitter:
+    """Collect streamed text into segments that end at a verse break or after SEGMENT_LINES lines."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.lines = []
+
+    def feed(self, text):
+        """Add a piece of text and return the segments it completed."""
+        *complete, self.buffer = (self.buffer + text).split("\n")
+        segments = []
+        for line in complete:
+            if line.strip():
+                self.lines.append(line.strip())
+            if self.lines and (not line.strip() or len(self.lines) >= SEGMENT_LINES):
+                segments.append("\n".join(self.lines))
+                self.lines = []
+        return segments
+
+    def finish(self):
+        """Return the last segment, if the poem did not end with a line break."""
+        if self.buffer.strip():
+            self.lines.append(self.buffer.strip())
+        segments = ["\n".join(self.lines)] if self.lines else []
+        self.buffer, self.lines = "", []
+        return segments
+
+
+def split_verses(texts):
+    """Yield (text, segments) for every piece of streamed text, with the segments of the poem it completed."""
+    splitter = VerseSplitter()
+    for text in texts:
+        yield text, splitter.feed(text)
+    yield "", splitter.finish()
+
+
 @app.route("/generate-poetry", methods=["POST"])
 def generate_poetry():
     data = request.json
@@ -25,27 +170,12 @@ def generate_poetry():
     if not words or len(words) != 2:
         return jsonify({"error": "Please provide exactly 2 words."}), 400
 
-    prompt = (f"Write a two-verse poem using the words: {', '.join(words)}. Each verse should be 4-6 lines long and "
-              f"creatively incorporate the words. Word 1: (Name of the person being celebrated) Word 2: (Event being "
-              f"celebrated) Please ensure the poem is heartfelt and celebratory.")
-
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "gpt-4o-mini",  # Fixed model name
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 200,  # Increased token limit for longer poems
-            },
-        )
+        response = request_poem(words)
+        response_data = response.json()
         # Print the response for debugging
-        print("OpenAI API response:", response.json())
+        print("OpenAI API response:", response_data)
 
-        response_data = response.json()
         if "choices" in response_data and len(response_data["choices"]) > 0:
             lyrics = response_data["choices"][0]["message"]["content"].strip()
             return jsonify({"lyrics": lyrics})
@@ -57,6 +187,82 @@ def generate_poetry():
         return jsonify({"error": f"Failed to generate poetry: {str(e)}"}), 500
 
 
+def voice_over_request(lyrics):
+    """Return the JSON body of the text-to-speech request."""
+    return {
+        "text": lyrics,
+        "model_id": TTS_MODEL,
+        "voice_settings": VOICE_SETTINGS,
+    }
+
+
+def synthesize(lyrics):
+    """Start a streaming text-to-speech request. The caller reads the audio with iter_content()."""
+    return http.post(
+        TTS_STREAM_URL,
+        headers=ELEVENLABS_HEADERS,
+        json=voice_over_request(lyrics),
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        stream=True,
+    )
+
+
+def relay_audio(response, key):
+    """Yield the audio chunks as they arrive from ElevenLabs while saving them to the cache."""
+    with response, audio_cache.writer(key) as audio_file:
+        for chunk in response.iter_content(chunk_size=None):
+            audio_file.write(chunk)
+            yield chunk
+
+
+def claim_synthesis(key):
+    """
+    Return (True, event) if the caller is to synthesize `key` and then call finish_synthesis(key, event), or
+    (False, event) if another request is already synthesizing it, with the event set once it is done.
+    """
+    with pending_lock:
+        event = synthesizing.get(key)
+        if event:
+            return False, event
+        event = synthesizing[key] = threading.Event()
+        return True, event
+
+
+def finish_synthesis(key, event):
+    with pending_lock:
+        if synthesizing.get(key) is event:
+            del synthesizing[key]
+    event.set()
+
+
+def cache_voice_over(lyrics):
+    """Synthesize lyrics into the audio cache, unless they are already there, and return the audio URL."""
+    key = audio_key(lyrics, VOICE_ID, TTS_MODEL, VOICE_SETTINGS)
+    while not audio_cache.get(key):
+        claimed, event = claim_synthesis(key)
+        if not claimed:
+            # Synthesized by another request, or by this one if that one failed
+            event.wait(SYNTHESIS_WAIT)
+            continue
+        try:
+            response = synthesize(lyrics)
+            if response.status_code != 200:
+                raise RuntimeError(f"ElevenLabs API error: {response.text}")
+            for _ in relay_audio(response, key):
+                pass
+        finally:
+            finish_synthesis(key, event)
+    return f"/audio/{key}.mp3"
+
+
+def remember_lyrics(key, lyrics):
+    with pending_lock:
+        pending_lyrics[key] = lyrics
+        pending_lyrics.move_to_end(key)
+        while len(pending_lyrics) > MAX_PENDING:
+            pending_lyrics.popitem(last=False)
+
+
 @app.route("/voice-over", methods=["POST"])
 def voice_over():
     data = request.json
@@ -65,38 +271,117 @@ def voice_over():
     if not lyrics:
         return jsonify({"error": "No lyrics provided."}), 400
 
+    key = audio_key(lyrics, VOICE_ID, TTS_MODEL, VOICE_SETTINGS)
+    audio_url = f"/audio/{key}.mp3"
+    if audio_cache.get(key):
+        return jsonify({"audioUrl": audio_url, "cached": True})
+
+    if data.get("stream"):
+        # The audio is synthesized while the browser downloads it from audio_url
+        remember_lyrics(key, lyrics)
+        return jsonify({"audioUrl": audio_url, "cached": False})
+
     try:
-        response = requests.post(
-            f"https://api.elevenlabs.io/v1/text-to-speech/{VOICE_ID}",
-            headers={
-                "xi-api-key": ELEVENLABS_API_KEY,
-                "Content-Type": "application/json",
-            },
-            json={
-                "text": lyrics,
-                "model_id": "eleven_monolingual_v1",
-                "voice_settings": {
-                    "stability": 0.7,
-                    "similarity_boost": 0.75,
-                },
-            },
-        )
+        response = synthesize(lyrics)
 
         if response.status_code != 200:
             return jsonify({"error": f"ElevenLabs API error: {response.text}"}), response.status_code
 
-        file_path = os.path.join("static", "generated_audio.mp3")
-        os.makedirs("static", exist_ok=True)
+        for _ in relay_audio(response, key):
+            pass
+
+        return jsonify({"audioUrl": audio_url, "cached": False})
+
+    except Exception as e:
+        print(f"Error generating voice-over: {e}")
+        return jsonify({"error": "Failed to generate voice-over."}), 500
+
 
-        with open(file_path, "wb") as audio_file:
-            audio_file.write(response.content)
+@app.route("/audio/<key>.mp3")
+def audio(key):
+    while True:
+        path = audio_cache.get(key)
+        if path:
+            # Content-addressed, so the file behind a URL never changes. send_file handles Range and If-None-Match.
+            return send_file(path, mimetype="audio/mpeg", etag=key, max_age=AUDIO_MAX_AGE)
 
-        return jsonify({"audioUrl": "/static/generated_audio.mp3"})
+        with pending_lock:
+            lyrics = pending_lyrics.get(key)
+        if lyrics is None:
+            return jsonify({"error": "Audio not found."}), 404
 
+        claimed, event = claim_synthesis(key)
+        if claimed:
+            break
+        # A range request, a retry or another player of audio that is being synthesized: serve the file once
+        # it is saved, or synthesize it if that request failed
+        if not event.wait(SYNTHESIS_WAIT):
+            return jsonify({"error": "Timed out waiting for the voice-over."}), 504
+
+    try:
+        response = synthesize(lyrics)
+        if response.status_code != 200:
+            finish_synthesis(key, event)
+            return jsonify({"error": f"ElevenLabs API error: {response.text}"}), response.status_code
     except Exception as e:
+        finish_synthesis(key, event)
         print(f"Error generating voice-over: {e}")
         return jsonify({"error": "Failed to generate voice-over."}), 500
 
+    def relay():
+        try:
+            yield from relay_audio(response, key)
+        finally:
+            finish_synthesis(key, event)
+
+    # The audio is not complete yet, so there is no Content-Length and no Range support on this first request
+    audio_response = Response(relay(), mimetype="audio/mpeg", headers={"Cache-Control": "no-store"})
+    # Also when the response is closed before its first chunk
+    audio_response.call_on_close(lambda: finish_synthesis(key, event))
+    return audio_response
+
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.route("/poem-to-speech", methods=["POST"])
+def poem_to_speech():
+    """
+    Generate a poem and its voice-over in one go, as Server-Sent Events.
+
+    Every few lines are sent to ElevenLabs as soon as they are written, while the rest of the poem is still
+    being generated. The browser receives the text as it arrives and the audio of each segment, in order.
+    """
+    data = request.json
+    words = data.get("words")
+
+    if not words or len(words) != 2:
+        return jsonify({"error": "Please provide exactly 2 words."}), 400
+
+    def generate():
+        voice_overs = []  # (segment, future) in poem order
+        sent = 0
+        try:
+            for text, segments in split_verses(stream_poem(words)):
+                if text:
+                    yield sse_event({"lyrics": text})
+                voice_overs += [(segment, tts_pool.submit(cache_voice_over, segment)) for segment in segments]
+                while sent < len(voice_overs) and voice_overs[sent][1].done():
+                    segment, future = voice_overs[sent]
+                    yield sse_event({"index": sent, "text": segment, "audioUrl": future.result()})
+                    sent += 1
+            for segment, future in voice_overs[sent:]:
+                yield sse_event({"index": sent, "text": segment, "audioUrl": future.result()})
+                sent += 1
+            yield sse_event({"done": True})
+        except Exception as e:
+            print(f"Error generating poem with voice-over: {e}")
+            yield sse_event({"error": str(e)})
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 
 if __name__ == "__main__":
     app.run(debug=True, port=3000)
\ No newline at end of file
@@ -0,0 +1,342 @@
+"""
+Async version of app.py, for serving many users from one process.
+
+It has the same routes and responses as app.py. The calls to OpenAI and ElevenLabs go through an aiohttp
+ClientSession, so a request waiting for an API does not hold a thread, and each API has its own limit of
+requests in flight. Run it with:
+
+    uvicorn async_app:app --port 3000
+"""
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import aiohttp
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app import (AUDIO_MAX_AGE, BACKOFF_FACTOR, CONNECT_TIMEOUT, ELEVENLABS_HEADERS, MAX_RETRIES, OPENAI_BASE_URL,
+                 OPENAI_HEADERS, READ_TIMEOUT, RETRY_STATUSES, SYNTHESIS_WAIT, TTS_MODEL, TTS_STREAM_URL, VOICE_ID,
+                 VOICE_SETTINGS, VerseSplitter, audio_cache, audio_key, pending_lock, pending_lyrics, poem_request,
+                 remember_lyrics, sse_event, voice_over_request)
+
+# Requests in flight to each API at the same time, the others wait for a free slot. ElevenLabs plans limit
+# concurrent requests, so set ELEVENLABS_CONCURRENCY to the limit of yours.
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", 500))
+ELEVENLABS_CONCURRENCY = int(os.getenv("ELEVENLABS_CONCURRENCY", 50))
+MAX_CONNECTIONS = OPENAI_CONCURRENCY + ELEVENLABS_CONCURRENCY
+
+session = None  # aiohttp.ClientSession, created when the server starts
+openai_limiter = asyncio.Semaphore(OPENAI_CONCURRENCY)
+elevenlabs_limiter = asyncio.Semaphore(ELEVENLABS_CONCURRENCY)
+# aiohttp rejects headers without a value, requests just leaves them out
+openai_headers = {name: value for name, value in OPENAI_HEADERS.items() if value is not None}
+elevenlabs_headers = {name: value for name, value in ELEVENLABS_HEADERS.items() if value is not None}
+# Voice-overs being synthesized, by audio key. Other requests for the same audio wait for the event.
+synthesizing = {}
+index_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "index.html")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global session
+    session = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+        connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+    )
+    yield
+    await session.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def retry_delay(response, attempt):
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return BACKOFF_FACTOR * 2 ** attempt
+
+
+@asynccontextmanager
+async def upstream(url, limiter, **kwargs):
+    """
+    POST to an API and yield the response before its body is read. Retries like the requests Session of app.py
+    and holds a slot of `limiter` until the response is closed.
+    """
+    async with limiter:
+        for attempt in range(MAX_RETRIES + 1):
+            response = None
+            try:
+                response = await session.post(url, **kwargs)
+            except (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError):
+                # Not sent yet. A read timeout is not retried, the request may already be generating and billed
+                if attempt == MAX_RETRIES:
+                    raise
+            if response is not None:
+                if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    break
+                response.release()
+            await asyncio.sleep(retry_delay(response, attempt))
+        try:
+            yield response
+        finally:
+            response.release()
+
+
+def synthesize(lyrics):
+    return upstream(TTS_STREAM_URL, elevenlabs_limiter, headers=elevenlabs_headers, json=voice_over_request(lyrics))
+
+
+async def relay_audio(response, key):
+    """Yield the audio chunks as they arrive from ElevenLabs while saving them to the cache."""
+    with audio_cache.writer(key) as audio_file:
+        async for chunk in response.content.iter_any():
+            await asyncio.to_thread(audio_file.write, chunk)
+            yield chunk
+
+
+def claim_synthesis(key):
+    """Like app.claim_synthesis, with an asyncio.Event."""
+    event = synthesizing.get(key)
+    if event:
+        return False, event
+    event = synthesizing[key] = asyncio.Event()
+    return True, event
+
+
+def finish_synthesis(key, event):
+    if synthesizing.get(key) is event:
+        del synthesizing[key]
+    event.set()
+
+
+async def cache_voice_over(lyrics):
+    """Synthesize lyrics into the audio cache, unless they are already there, and return the audio URL."""
+    key = audio_key(lyrics, VOICE_ID, TTS_MODEL, VOICE_SETTINGS)
+    while not audio_cache.get(key):
+        claimed, event = claim_synthesis(key)
+        if not claimed:
+            # Synthesized by another request, or by this one if that one failed
+            try:
+                await asyncio.wait_for(event.wait(), SYNTHESIS_WAIT)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            async with synthesize(lyrics) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"ElevenLabs API error: {await response.text()}")
+                async for _ in relay_audio(response, key):
+                    pass
+        finally:
+            finish_synthesis(key, event)
+    return f"/audio/{key}.mp3"
+
+
+async def stream_poem(words):
+    """Yield the text of a new poem as it is generated."""
+    async with upstream(f"{OPENAI_BASE_URL}/chat/completions", openai_limiter, headers=openai_headers,
+                        json=poem_request(words, stream=True)) as response:
+        if response.status != 200:
+            raise RuntimeError(f"OpenAI API error: {await response.text()}")
+        async for line in response.content:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data: "):
+                continue
+            if line == "data: [DONE]":
+                break
+            choices = json.loads(line[len("data: "):])["choices"]
+            if choices and choices[0]["delta"].get("content"):
+                yield choices[0]["delta"]["content"]
+
+
+def byte_range(header, size):
+    """Return (start, end) of a single "bytes=" range, None without one, or ValueError if it cannot be served."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    if not start:
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+@app.get("/")
+async def index():
+    return FileResponse(index_path)
+
+
+@app.post("/generate-poetry")
+async def generate_poetry(request: Request):
+    data = await request.json()
+    words = data.get("words")
+
+    if not words or len(words) != 2:
+        return JSONResponse({"error": "Please provide exactly 2 words."}, 400)
+
+    try:
+        async with upstream(f"{OPENAI_BASE_URL}/chat/completions", openai_limiter, headers=openai_headers,
+                            json=poem_request(words)) as response:
+            response_data = json.loads(await response.read())
+
+        if "choices" in response_data and len(response_data["choices"]) > 0:
+            lyrics = response_data["choices"][0]["message"]["content"].strip()
+            return {"lyrics": lyrics}
+        else:
+            return JSONResponse({"error": "Invalid response from OpenAI API."}, 500)
+
+    except Exception as e:
+        print(f"Error generating poetry: {e}")
+        return JSONResponse({"error": f"Failed to generate poetry: {str(e)}"}, 500)
+
+
+@app.post("/voice-over")
+async def voice_over(request: Request):
+    data = await request.json()
+    lyrics = data.get("lyrics")
+
+    if not lyrics:
+        return JSONResponse({"error": "No lyrics provided."}, 400)
+
+    key = audio_key(lyrics, VOICE_ID, TTS_MODEL, VOICE_SETTINGS)
+    audio_url = f"/audio/{key}.mp3"
+    if audio_cache.get(key):
+        return {"audioUrl": audio_url, "cached": True}
+
+    if data.get("stream"):
+        remember_lyrics(key, lyrics)
+        return {"audioUrl": audio_url, "cached": False}
+
+    try:
+        async with synthesize(lyrics) as response:
+            if response.status != 200:
+                return JSONResponse({"error": f"ElevenLabs API error: {await response.text()}"}, response.status)
+            async for _ in relay_audio(response, key):
+                pass
+
+        return {"audioUrl": audio_url, "cached": False}
+
+    except Exception as e:
+        print(f"Error generating voice-over: {e}")
+        return JSONResponse({"error": "Failed to generate voice-over."}, 500)
+
+
+@app.get("/audio/{key}.mp3")
+async def audio(key: str, request: Request):
+    while True:
+        path = audio_cache.get(key)
+        if path:
+            headers = {"ETag": f'"{key}"', "Cache-Control": f"public, max-age={AUDIO_MAX_AGE}",
+                       "Accept-Ranges": "bytes"}
+            if key in request.headers.get("if-none-match", ""):
+                return Response(status_code=304, headers=headers)
+            size = os.path.getsize(path)
+            try:
+                requested = byte_range(request.headers.get("range"), size)
+            except ValueError:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+            if requested:
+                start, end = requested
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                body = await asyncio.to_thread(read_range, path, start, end - start + 1)
+                return Response(body, status_code=206, headers=headers, media_type="audio/mpeg")
+            return FileResponse(path, headers=headers, media_type="audio/mpeg")
+
+        with pending_lock:
+            lyrics = pending_lyrics.get(key)
+        if lyrics is None:
+            return JSONResponse({"error": "Audio not found."}, 404)
+
+        claimed, event = claim_synthesis(key)
+        if claimed:
+            break
+        # A range request, a retry or another player of audio that is being synthesized: serve the file once
+        # it is saved, or synthesize it if that request failed
+        try:
+            await asyncio.wait_for(event.wait(), SYNTHESIS_WAIT)
+        except asyncio.TimeoutError:
+            return JSONResponse({"error": "Timed out waiting for the voice-over."}, 504)
+
+    # The response outlives this function, so the upstream request is closed by the generator
+    stack = AsyncExitStack()
+    stack.callback(finish_synthesis, key, event)
+    try:
+        response = await stack.enter_async_context(synthesize(lyrics))
+        if response.status != 200:
+            error = await response.text()
+            await stack.aclose()
+            return JSONResponse({"error": f"ElevenLabs API error: {error}"}, response.status)
+    except Exception as e:
+        await stack.aclose()
+        print(f"Error generating voice-over: {e}")
+        return JSONResponse({"error": "Failed to generate voice-over."}, 500)
+
+    async def relay():
+        async with stack:
+            async for chunk in relay_audio(response, key):
+                yield chunk
+
+    # The background task also runs when the client went away before the first chunk
+    return StreamingResponse(relay(), media_type="audio/mpeg", headers={"Cache-Control": "no-store"},
+                             background=BackgroundTask(stack.aclose))
+
+
+@app.post("/poem-to-speech")
+async def poem_to_speech(request: Request):
+    data = await request.json()
+    words = data.get("words")
+
+    if not words or len(words) != 2:
+        return JSONResponse({"error": "Please provide exactly 2 words."}, 400)
+
+    async def generate():
+        voice_overs = []  # (segment, task) in poem order
+        sent = 0
+        try:
+            async for text, segments in split_verses(stream_poem(words)):
+                if text:
+                    yield sse_event({"lyrics": text})
+                voice_overs += [(segment, asyncio.create_task(cache_voice_over(segment))) for segment in segments]
+                while sent < len(voice_overs) and voice_overs[sent][1].done():
+                    segment, task = voice_overs[sent]
+                    yield sse_event({"index": sent, "text": segment, "audioUrl": task.result()})
+                    sent += 1
+            for segment, task in voice_overs[sent:]:
+                yield sse_event({"index": sent, "text": segment, "audioUrl": await task})
+                sent += 1
+            yield sse_event({"done": True})
+        except Exception as e:
+            print(f"Error generating poem with voice-over: {e}")
+            yield sse_event({"error": str(e)})
+        finally:
+            for _, task in voice_overs[sent:]:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def split_verses(texts):
+    """Like split_verses() in app.py, for an async stream of text."""
+    splitter = VerseSplitter()
+    async for text in texts:
+        yield text, splitter.feed(text)
+    yield "", splitter.finish()
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=3000)
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def audio_key(text, voice_id, model_id, voice_settings):
+    """Hash everything that changes the synthesized audio, so the same request always maps to the same file."""
+    payload = json.dumps([text, voice_id, model_id, voice_settings], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    Content-addressed store of synthesized audio files in `directory`.
+
+    Files are named after their key and only appear once they were written completely. When the files take
+    more than `max_bytes`, the least recently used ones are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, extension=".mp3"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.lock = threading.Lock()
+        self.sizes = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # Left over from an interrupted download
+            elif name.endswith(extension):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-len(extension)], stat.st_size))
+        for _, key, size in sorted(files):
+            self.sizes[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def get(self, key):
+        """Return the path of the cached file for `key`, or None."""
+        with self.lock:
+            if key not in self.sizes:
+                self.misses += 1
+                return None
+            self.sizes.move_to_end(key)
+            self.hits += 1
+        path = self.path(key)
+        try:
+            os.utime(path)  # Keeps the recency order across restarts
+        except FileNotFoundError:
+            with self.lock:
+                self.total_bytes -= self.sizes.pop(key, 0)
+            return None
+        return path
+
+    @contextmanager
+    def writer(self, key):
+        """Write a new file for `key`. It is added to the cache only if the block finishes without an error."""
+        tmp_path = os.path.join(self.directory, f"{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                yield f
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            # Also covers GeneratorExit, when the client of a streamed response goes away
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self.lock:
+            self.total_bytes += size - self.sizes.pop(key, 0)
+            self.sizes[key] = size
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.sizes), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses}
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.sizes) > 1:
+            key, size = self.sizes.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,76 @@
+"""
+Compare a fresh requests.post per call with the shared, pooled session, against local stub APIs.
+
+Every request goes through the Flask routes (/generate-poetry and /voice-over). The stub charges
+--handshake-delay for every new connection, like the DNS, TCP and TLS round trips to a remote API:
+
+    python bench_http.py --requests 64 --handshake-delay 0.03
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import mock_apis
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--handshake-delay", type=float, default=mock_apis.HANDSHAKE_DELAY)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    server, base_url = mock_apis.start_in_background(handshake_delay=args.handshake_delay)
+    os.environ.update(OPENAI_BASE_URL=base_url, ELEVENLABS_BASE_URL=base_url)
+    state = server.RequestHandlerClass.state
+
+    import app
+
+    def call(route_and_body):
+        route, body = route_and_body
+        start = time.perf_counter()
+        response = app.app.test_client().post(route, json=body)
+        assert response.status_code == 200, response.json
+        return time.perf_counter() - start
+
+    # Different lyrics every time, so the audio cache does not answer the voice-overs
+    calls = [("/generate-poetry", {"words": ["Ada", "birthday"]}) if n % 2 else
+             ("/voice-over", {"lyrics": f"{mock_apis.POEM} ({n})"}) for n in range(args.requests)]
+
+    print(f"Stub APIs: {args.handshake_delay * 1000:.0f} ms per new connection, "
+          f"{mock_apis.CHAT_LATENCY * 1000:.0f} ms per poem, {mock_apis.TTS_LATENCY * 1000:.0f} ms per voice-over")
+    print("client    concurrency   requests/s   p50 latency   p99 latency   connections")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for concurrency in args.concurrency:
+            results = {}
+            for name, http in (("fresh", requests), ("pooled", app.make_session())):
+                app.http = http
+                app.audio_cache = app.AudioCache(os.path.join(tmp_dir, f"{name}-{concurrency}"))
+                connections = state.connections
+                with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(concurrency) as pool:
+                    start = time.perf_counter()
+                    latencies = list(pool.map(call, calls))
+                    elapsed = time.perf_counter() - start
+                results[name] = statistics.median(latencies)
+                print(f"{name:<8}  {concurrency:>11}  {len(calls) / elapsed:11.1f}  "
+                      f"{results[name] * 1000:9.1f} ms  {percentile(latencies, 99) * 1000:9.1f} ms  "
+                      f"{state.connections - connections:>12}")
+            print(f"  saved {(results['fresh'] - results['pooled']) * 1000:.1f} ms per request at p50")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
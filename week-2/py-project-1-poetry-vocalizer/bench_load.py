@@ -0,0 +1,119 @@
+"""
+Load test app.py (Flask, threads) and async_app.py (uvicorn, asyncio) against local stub APIs.
+
+Each server runs in its own process. The load generator keeps --concurrency requests in flight, alternating
+/generate-poetry and /voice-over with lyrics that are never cached, and reports throughput and tail latency:
+
+    python bench_load.py --requests 600 --concurrency 50 200 500 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from bench_http import percentile
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+SYNC_SERVER = ("import logging, sys; sys.path.insert(0, sys.argv[2]); import app; "
+               "logging.getLogger('werkzeug').setLevel(logging.ERROR); "
+               "app.app.run(port=int(sys.argv[1]), threaded=True)")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(command, port, env, cwd):
+    process = subprocess.Popen(command, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{' '.join(command)} did not start")
+
+
+async def load(base_url, requests, concurrency, run):
+    """Send `requests` requests with `concurrency` in flight. Return (latencies, errors, seconds)."""
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for n in range(requests):
+        if n % 2:
+            queue.put_nowait(("/generate-poetry", {"words": ["Ada", "birthday"]}))
+        else:
+            queue.put_nowait(("/voice-over", {"lyrics": f"Happy birthday, Ada ({run}-{n})"}))
+
+    async def worker(session):
+        nonlocal errors
+        while not queue.empty():
+            route, body = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                async with session.post(base_url + route, json=body, raise_for_status=True) as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - start)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds the stubs take per poem and voice-over")
+    parser.add_argument("--elevenlabs-concurrency", type=int, default=500,
+                        help="Limit of async_app.py, the default does not throttle the stub")
+    args = parser.parse_args()
+
+    api_port, sync_port, async_port = free_port(), free_port(), free_port()
+    env = dict(os.environ, OPENAI_BASE_URL=f"http://127.0.0.1:{api_port}/v1",
+               ELEVENLABS_BASE_URL=f"http://127.0.0.1:{api_port}/v1", OPENAI_API_KEY="test",
+               ELEVENLABS_API_KEY="test", ELEVENLABS_CONCURRENCY=str(args.elevenlabs_concurrency))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The apps run in a temporary directory, so the audio cache does not end up in static/
+        processes = [
+            start([sys.executable, os.path.join(PROJECT_DIR, "mock_apis.py"), "--port", str(api_port),
+                   "--chat-latency", str(args.latency), "--tts-latency", str(args.latency)], api_port, env, tmp_dir),
+            start([sys.executable, "-c", SYNC_SERVER, str(sync_port), PROJECT_DIR], sync_port, env, tmp_dir),
+            start([sys.executable, "-m", "uvicorn", "--app-dir", PROJECT_DIR, "--port", str(async_port),
+                   "--log-level", "warning", "--no-access-log", "async_app:app"], async_port, env, tmp_dir),
+        ]
+        try:
+            print(f"Stub APIs: {args.latency * 1000:.0f} ms per poem and per voice-over, "
+                  f"ELEVENLABS_CONCURRENCY={args.elevenlabs_concurrency}")
+            print("server              concurrency   requests/s   p50 latency   p99 latency   errors")
+            for concurrency in args.concurrency:
+                for name, port in (("sync (Flask)", sync_port), ("async (uvicorn)", async_port)):
+                    latencies, errors, seconds = asyncio.run(
+                        load(f"http://127.0.0.1:{port}", args.requests, concurrency, f"{name}-{concurrency}"))
+                    print(f"{name:<18}  {concurrency:>11}  {len(latencies) / seconds:11.1f}  "
+                          f"{statistics.median(latencies) * 1000:9.0f} ms  {percentile(latencies, 99) * 1000:9.0f} ms  "
+                          f"{errors:>6}")
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compare /generate-poetry followed by /voice-over with the pipelined /poem-to-speech, against local stub APIs.
+
+The stub LLM streams the poem with a delay per token and the stub TTS takes a delay per character, so the
+results show how much of the synthesis overlaps with the generation:
+
+    python bench_pipeline.py --requests 5 --token-delay 0.02 --char-delay 0.004
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+import mock_apis
+
+
+def sequential(base_url):
+    """Return (time to the first audio, time to the whole audio) of the two-step flow."""
+    start = time.perf_counter()
+    lyrics = requests.post(f"{base_url}/generate-poetry", json={"words": ["Ada", "birthday"]}).json()["lyrics"]
+    requests.post(f"{base_url}/voice-over", json={"lyrics": lyrics}).raise_for_status()
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def pipelined(base_url):
+    """Return (time to the first audio, time to the whole audio) of /poem-to-speech."""
+    start = time.perf_counter()
+    first_audio = None
+    with requests.post(f"{base_url}/poem-to-speech", json={"words": ["Ada", "birthday"]}, stream=True) as response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            assert "error" not in event, event["error"]
+            if "audioUrl" in event and first_audio is None:
+                first_audio = time.perf_counter() - start
+    return first_audio, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds per generated token")
+    parser.add_argument("--char-delay", type=float, default=0.004, help="Seconds per synthesized character")
+    args = parser.parse_args()
+
+    server, api_url = mock_apis.start_in_background(handshake_delay=0, token_delay=args.token_delay,
+                                                    char_delay=args.char_delay)
+    os.environ.update(OPENAI_BASE_URL=api_url, ELEVENLABS_BASE_URL=api_url)
+    state = server.RequestHandlerClass.state
+
+    import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        app_server = make_server("127.0.0.1", 0, app.app, threaded=True)
+        threading.Thread(target=app_server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{app_server.server_port}"
+
+        for flow in (sequential, pipelined):
+            results[flow.__name__] = []
+            for n in range(args.requests):
+                # A fresh cache every time, so every run synthesizes the whole poem
+                app.audio_cache = app.AudioCache(os.path.join(tmp_dir, f"{flow.__name__}-{n}"))
+                results[flow.__name__].append(flow(base_url))
+        app_server.shutdown()
+
+    poem_time = args.token_delay * len(state.tokens)
+    tts_time = args.char_delay * len(state.poem)
+    print(f"Stub APIs: {poem_time * 1000:.0f} ms to write the poem, {tts_time * 1000:.0f} ms to voice all of it")
+    print("flow         first audio    whole audio")
+    for flow, timings in results.items():
+        print(f"{flow:<11}  {statistics.median(t[0] for t in timings) * 1000:8.0f} ms  "
+              f"{statistics.median(t[1] for t in timings) * 1000:9.0f} ms")
+    print("TTS calls:", state.calls.get("tts", 0))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
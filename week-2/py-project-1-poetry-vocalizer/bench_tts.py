@@ -0,0 +1,87 @@
+"""
+Measure the time to the first audio byte of a voice-over, buffered, streamed and from the audio cache.
+
+Runs app.py on a local port against the stub text-to-speech API and plays the browser's part: POST /voice-over,
+then GET the returned audio URL:
+
+    python bench_tts.py --requests 10 --tts-latency 1.0
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+import mock_apis
+
+
+def fetch_audio(base_url, lyrics, stream):
+    """Return (time to first audio byte, total time, audio size) as the browser would see them."""
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/voice-over", json={"lyrics": lyrics, "stream": stream})
+    response.raise_for_status()
+    first_byte = None
+    size = 0
+    with requests.get(base_url + response.json()["audioUrl"], stream=True) as audio:
+        audio.raise_for_status()
+        for chunk in audio.iter_content(chunk_size=None):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+    return first_byte, time.perf_counter() - start, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--tts-latency", type=float, default=1.0, help="Seconds to synthesize a whole poem")
+    args = parser.parse_args()
+
+    server, api_url = mock_apis.start_in_background(handshake_delay=0, tts_latency=args.tts_latency)
+    os.environ.update(OPENAI_BASE_URL=api_url, ELEVENLABS_BASE_URL=api_url)
+    state = server.RequestHandlerClass.state
+
+    import app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        app.audio_cache = app.AudioCache(tmp_dir)
+        app_server = make_server("127.0.0.1", 0, app.app, threaded=True)
+        threading.Thread(target=app_server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{app_server.server_port}"
+
+        results = {}
+        for mode, stream, prefix in (("buffered", False, "b"), ("streamed", True, "s"), ("cached", True, "s")):
+            calls = state.calls.get("tts", 0)
+            results[mode] = [fetch_audio(base_url, f"{mock_apis.POEM} ({prefix}{n})", stream)
+                             for n in range(args.requests)]
+            results[mode + " calls"] = state.calls.get("tts", 0) - calls
+
+        # The cached file supports range requests and revalidation
+        audio_url = base_url + requests.post(f"{base_url}/voice-over", json={"lyrics": mock_apis.POEM + " (s0)"}
+                                             ).json()["audioUrl"]
+        ranged = requests.get(audio_url, headers={"Range": "bytes=0-1023"})
+        revalidated = requests.get(audio_url, headers={"If-None-Match": ranged.headers["ETag"]})
+        app_server.shutdown()
+
+    print(f"Stub TTS: {args.tts_latency * 1000:.0f} ms per poem, {results['buffered'][0][2] // 1024} KB of audio")
+    print("mode        first audio byte   full audio   upstream calls")
+    for mode in ("buffered", "streamed", "cached"):
+        first_bytes = [result[0] for result in results[mode]]
+        totals = [result[1] for result in results[mode]]
+        print(f"{mode:<10}  {statistics.median(first_bytes) * 1000:13.1f} ms  "
+              f"{statistics.median(totals) * 1000:8.1f} ms  {results[mode + ' calls']:>14}")
+    print(f"Range request: {ranged.status_code} with {len(ranged.content)} bytes, "
+          f"If-None-Match: {revalidated.status_code}, Cache-Control: {ranged.headers.get('Cache-Control')}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
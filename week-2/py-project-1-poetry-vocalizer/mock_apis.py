@@ -0,0 +1,208 @@
+"""
+Fake OpenAI and ElevenLabs endpoints for the poetry vocalizer's benchmarks, serving both APIs on one port.
+
+Every poem is POEM and its voice-over is made of deterministic bytes, so the same lyrics always give the same
+audio. Opening a connection costs HANDSHAKE_DELAY, which shows what reusing connections saves, and
+ERROR_RATE of the requests are answered with 503 to exercise the retries. bench_load.py runs it in its own
+process. To try the app against it:
+
+    python mock_apis.py --port 4030
+    OPENAI_BASE_URL=http://127.0.0.1:4030/v1 ELEVENLABS_BASE_URL=http://127.0.0.1:4030/v1 python app.py
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HANDSHAKE_DELAY = 0.03  # Seconds to open a connection (DNS, TCP and TLS round trips to a remote API)
+CHAT_LATENCY = 0.05  # Seconds to write a whole poem
+TTS_LATENCY = 0.05  # Seconds to synthesize a whole poem
+TOKEN_DELAY = None  # Seconds per generated token, replaces CHAT_LATENCY when set
+CHAR_DELAY = None  # Seconds per synthesized character, replaces TTS_LATENCY when set
+TTS_CHUNK_SIZE = 4096  # Bytes per chunk of streamed audio
+ERROR_RATE = 0.0  # Fraction of requests answered with 503
+POEM = ("Dear Ada, today the candles glow,\n"
+        "for every year you've watched us grow,\n"
+        "your laughter fills the crowded hall,\n"
+        "the brightest light among us all.\n\n"
+        "So raise a glass and sing it clear,\n"
+        "to Ada's birthday, and the year,\n"
+        "may every wish you make come true,\n"
+        "and all our love come back to you.")
+AUDIO_BYTES_PER_CHAR = 800  # Roughly the size of a 128 kbit/s MP3 at speaking pace
+
+_ids = itertools.count(1)
+
+
+class MockState:
+    def __init__(self, handshake_delay=HANDSHAKE_DELAY, chat_latency=CHAT_LATENCY, tts_latency=TTS_LATENCY,
+                 token_delay=TOKEN_DELAY, char_delay=CHAR_DELAY, error_rate=ERROR_RATE, poem=POEM):
+        self.handshake_delay = handshake_delay
+        self.chat_latency = chat_latency
+        self.tts_latency = tts_latency
+        self.token_delay = token_delay
+        self.char_delay = char_delay
+        self.error_rate = error_rate
+        self.poem = poem
+        self.tokens = re.findall(r'\S+\s*', poem)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.calls = {}
+        self.errors = 0
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def chat_time(self):
+        return self.token_delay * len(self.tokens) if self.token_delay is not None else self.chat_latency
+
+    def tts_time(self, text):
+        return self.char_delay * len(text) if self.char_delay is not None else self.tts_latency
+
+    def fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            with self.lock:
+                self.errors += 1
+            return True
+        return False
+
+
+def fake_audio(text):
+    """Return deterministic MP3-sized bytes for a text, so the same lyrics always give the same audio."""
+    seed = text.encode("utf-8") or b"\0"
+    size = max(1, len(text)) * AUDIO_BYTES_PER_CHAR
+    return b"ID3" + (seed * (size // len(seed) + 1))[:size]
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # Set by make_server()
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        # Called once per connection, so keep-alive requests skip it
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.state.lock:
+            self.state.connections += 1
+        time.sleep(self.state.handshake_delay)
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200, headers=None):
+        self.send_body(json.dumps(payload).encode("utf-8"), "application/json", status, headers)
+
+    def start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_chunk(self, data):
+        """Send one chunk of a chunked response. An empty chunk ends the response."""
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def stream_poem(self, model):
+        state = self.state
+        completion_id = f"chatcmpl-{next(_ids)}"
+        self.start_chunked("text/event-stream")
+        for token in state.tokens:
+            time.sleep(state.chat_time() / len(state.tokens))
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self.send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/v1/chat/completions":
+            state.count("chat")
+            if state.fail():
+                return self.send_json({"error": {"message": "Overloaded"}}, 503, {"retry-after": "0"})
+            if body.get("stream"):
+                return self.stream_poem(body.get("model"))
+            time.sleep(state.chat_time())
+            return self.send_json({
+                "id": f"chatcmpl-{next(_ids)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": state.poem},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 60, "completion_tokens": len(state.poem) // 4,
+                          "total_tokens": 60 + len(state.poem) // 4},
+            })
+
+        if self.path.startswith("/v1/text-to-speech/"):
+            state.count("tts")
+            if state.fail():
+                return self.send_json({"detail": {"message": "Overloaded"}}, 503, {"retry-after": "0"})
+            audio = fake_audio(body.get("text", ""))
+            tts_time = state.tts_time(body.get("text", ""))
+            if not self.path.endswith("/stream"):
+                time.sleep(tts_time)
+                return self.send_body(audio, "audio/mpeg")
+
+            # Chunks are produced evenly over the synthesis time
+            chunks = [audio[n:n + TTS_CHUNK_SIZE] for n in range(0, len(audio), TTS_CHUNK_SIZE)]
+            self.start_chunked("audio/mpeg")
+            for chunk in chunks:
+                time.sleep(tts_time / len(chunks))
+                self.send_chunk(chunk)
+            return self.send_chunk(b"")
+
+        self.send_json({"error": {"message": f"Unknown route {self.path}"}}, 404)
+
+
+class MockServer(ThreadingHTTPServer):
+    request_queue_size = 512  # bench_load.py connects hundreds of clients at once through the app
+
+
+def make_server(port=0, **settings):
+    """Create a mock server bound to localhost. Use port=0 to pick a free port."""
+    handler = type("Handler", (MockApiHandler,), {"state": MockState(**settings)})
+    return MockServer(("127.0.0.1", port), handler)
+
+
+def start_in_background(**settings):
+    """Start a mock server on a free port and return (server, base_url)."""
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI and ElevenLabs APIs.")
+    parser.add_argument("--port", type=int, default=4030)
+    parser.add_argument("--handshake-delay", type=float, default=HANDSHAKE_DELAY)
+    parser.add_argument("--chat-latency", type=float, default=CHAT_LATENCY, help="Seconds to write a whole poem")
+    parser.add_argument("--tts-latency", type=float, default=TTS_LATENCY, help="Seconds to voice a whole poem")
+    parser.add_argument("--token-delay", type=float, default=TOKEN_DELAY, help="Seconds per generated token")
+    parser.add_argument("--char-delay", type=float, default=CHAR_DELAY, help="Seconds per synthesized character")
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    args = parser.parse_args()
+
+    server = make_server(args.port, handshake_delay=args.handshake_delay, chat_latency=args.chat_latency,
+                         tts_latency=args.tts_latency, token_delay=args.token_delay, char_delay=args.char_delay,
+                         error_rate=args.error_rate)
+    print(f"Mock OpenAI and ElevenLabs APIs listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,149 @@
+"""
+Measure how long the assistant keeps talking after the caller interrupts it.
+
+main.py runs in its own process, connected to fake_realtime.py in conversation mode: the caller talks for a
+second, the fake API answers with --reply-seconds of audio, streamed faster than real time like the real one,
+and after hearing part of the answer the caller talks again. The fake Twilio side plays the audio it receives
+in real time, echoes marks once they are played, and drops its buffer on a clear event, like Twilio. For each
+call the report has:
+
+- the interruption latency, from the first frame of the caller's speech to the end of the assistant's audio,
+- when the clear event arrived, if any,
+- how far conversation.item.truncate was from the audio the caller had actually heard.
+
+    python bench_barge_in.py --calls 10
+    python bench_barge_in.py --app-dir /path/to/other/version  # Compare with another main.py
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+
+import websockets
+
+import fake_realtime
+from bench_relay import free_port, start, synthetic_call
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_SECONDS = 0.02
+SPEECH_FRAME = base64.b64encode(b"\x10" * 160).decode()
+SILENT_FRAME = base64.b64encode(b"\xff" * 160).decode()
+
+
+class Interruption:
+    def __init__(self):
+        self.speech_at = None  # The caller starts talking over the answer
+        self.clear_at = None
+        self.silent_at = None  # The last of the answer is played
+        self.heard_ms = None  # Answer played when the clear arrived
+
+
+async def call(url, interrupt_after, tail):
+    """A call interrupting the answer after `interrupt_after` seconds of it were played."""
+    loop = asyncio.get_running_loop()
+    connected, started, *_, stop = synthetic_call(0)
+    stream_sid = json.loads(started)["streamSid"]
+    result = Interruption()
+    answer_from = None  # When the answer started playing
+    received = 0.0  # Seconds of answer received
+    play_until = 0.0
+    marks = []  # (timer handle, name) of the marks to echo once played
+
+    async with websockets.connect(url, max_size=None, compression=None) as websocket:
+        def echo_mark(name):
+            loop.create_task(websocket.send(json.dumps({"event": "mark", "streamSid": stream_sid,
+                                                        "mark": {"name": name}})))
+
+        async def play():
+            nonlocal answer_from, received, play_until
+            async for message in websocket:
+                now = loop.time()
+                event = json.loads(message)
+                if event["event"] == "media":
+                    seconds = len(base64.b64decode(event["media"]["payload"])) / 8000
+                    answer_from = answer_from or now
+                    received += seconds
+                    play_until = max(play_until, now) + seconds
+                elif event["event"] == "mark":
+                    name = event["mark"]["name"]
+                    marks.append((loop.call_at(max(play_until, now), echo_mark, name), name))
+                elif event["event"] == "clear":
+                    result.clear_at = now
+                    result.heard_ms = (received - max(0.0, play_until - now)) * 1000
+                    play_until = now
+                    # Twilio sends back the marks it had not played
+                    for handle, name in marks:
+                        if not handle.cancelled() and handle.when() > now:
+                            handle.cancel()
+                            echo_mark(name)
+
+        player = loop.create_task(play())
+        await websocket.send(connected)
+        await websocket.send(started)
+        start_at = loop.time()
+        n = 0
+
+        async def send_frame(frame):
+            nonlocal n
+            delay = start_at + n * FRAME_SECONDS - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            n += 1
+            await websocket.send('{"event":"media","streamSid":"%s","media":{"payload":"%s"}}' % (stream_sid, frame))
+
+        for _ in range(50):
+            await send_frame(SPEECH_FRAME)
+        while answer_from is None or loop.time() < answer_from + interrupt_after:
+            await send_frame(SILENT_FRAME)
+        result.speech_at = loop.time()
+        # The caller keeps talking, so no new answer starts, until whatever is left of this one has played
+        while loop.time() < max(play_until, result.speech_at) + tail:
+            await send_frame(SPEECH_FRAME)
+        result.silent_at = max(play_until, result.speech_at)
+        await websocket.send(stop)
+        player.cancel()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=10)
+    parser.add_argument("--reply-seconds", type=float, default=8)
+    parser.add_argument("--reply-speed", type=float, default=4, help="Answers stream this many times real time")
+    parser.add_argument("--app-dir", default=PROJECT_DIR, help="Directory of the main.py to measure")
+    args = parser.parse_args()
+
+    state, fake_url = fake_realtime.start_in_background(delta_frames=5, reply_seconds=args.reply_seconds,
+                                                        reply_speed=args.reply_speed)
+    app_port = free_port()
+    env = dict(os.environ, OPENAI_REALTIME_URL=fake_url, OPENAI_API_KEY="test", PORT=str(app_port))
+    app = start([sys.executable, os.path.join(args.app_dir, "main.py")], app_port, env)
+    random.seed(0)
+    latencies = []
+    try:
+        print(f"{args.reply_seconds:.0f} s answers streamed at {args.reply_speed:.0f}x real time")
+        print("interrupted after   speech -> silence   speech -> clear   truncated at   heard")
+        for _ in range(args.calls):
+            interrupt_after = random.uniform(0.5, args.reply_seconds / 2)
+            truncations = len(state.truncations)
+            result = asyncio.run(call(f"ws://127.0.0.1:{app_port}/media-stream", interrupt_after, 0.5))
+            latency = result.silent_at - result.speech_at
+            latencies.append(latency)
+            clear = f"{(result.clear_at - result.speech_at) * 1000:11.0f} ms" if result.clear_at else f"{'-':>14}"
+            truncated = state.truncations[truncations:]
+            truncated_at = f"{truncated[0][1]:8d} ms" if truncated else f"{'-':>11}"
+            heard = f"{result.heard_ms:5.0f} ms" if result.heard_ms is not None else f"{'-':>8}"
+            print(f"{interrupt_after * 1000:14.0f} ms  {latency * 1000:15.0f} ms  {clear}   {truncated_at}  {heard}")
+    finally:
+        app.terminate()
+        app.wait()
+    print(f"speech -> silence p50 {statistics.median(latencies) * 1000:.0f} ms, "
+          f"max {max(latencies) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
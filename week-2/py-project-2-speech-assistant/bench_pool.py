@@ -0,0 +1,101 @@
+"""
+Compare the call setup latency of /media-stream with and without the pool of Realtime sessions.
+
+main.py runs in its own process, connected to fake_realtime.py, which takes --handshake-delay seconds to accept
+a session, like a TLS connection to the real API, and echoes the caller's audio. Calls arrive at random, --rate
+per second on average, and each lasts --call-seconds. The setup latency is the time from the call's connection to
+/media-stream until its first audio frame comes back:
+
+    python bench_pool.py --calls 60 --rate 2 --handshake-delay 0.3
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import websockets
+
+from bench_relay import free_port, start, synthetic_call
+from load_test import get_metrics, percentile
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_SECONDS = 0.02
+FRAME = base64.b64encode(b"\x10" * 160).decode()
+
+
+async def call(url, seconds):
+    """One call. Returns the seconds until its first audio frame came back."""
+    loop = asyncio.get_running_loop()
+    connected, started, *_, stop = synthetic_call(0)
+    stream_sid = json.loads(started)["streamSid"]
+    begin = loop.time()
+    async with websockets.connect(url, max_size=None, compression=None) as websocket:
+        async def first_audio():
+            async for message in websocket:
+                if json.loads(message)["event"] == "media":
+                    return loop.time() - begin
+
+        receiver = loop.create_task(first_audio())
+        await websocket.send(connected)
+        await websocket.send(started)
+        for n in range(int(seconds / FRAME_SECONDS)):
+            delay = begin + n * FRAME_SECONDS - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await websocket.send('{"event":"media","streamSid":"%s","media":{"payload":"%s"}}' % (stream_sid, FRAME))
+        setup = await asyncio.wait_for(receiver, 10)
+        await websocket.send(stop)
+    return setup
+
+
+async def arrivals(url, calls, rate, seconds):
+    random.seed(0)
+    tasks = []
+    for _ in range(calls):
+        tasks.append(asyncio.create_task(call(url, seconds)))
+        await asyncio.sleep(random.expovariate(rate))
+    return await asyncio.gather(*tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--rate", type=float, default=2, help="Calls per second")
+    parser.add_argument("--call-seconds", type=float, default=3)
+    parser.add_argument("--handshake-delay", type=float, default=0.3)
+    args = parser.parse_args()
+
+    fake_port = free_port()
+    fake = start([sys.executable, os.path.join(PROJECT_DIR, "fake_realtime.py"), "--port", str(fake_port),
+                  "--handshake-delay", str(args.handshake_delay)], fake_port)
+    try:
+        print(f"{args.calls} calls, {args.rate:g} per second, {args.handshake_delay * 1000:.0f} ms handshake")
+        print("pool   setup p50     p99     max   sessions from the pool")
+        for pool_max in (0, 8):
+            app_port = free_port()
+            env = dict(os.environ, OPENAI_REALTIME_URL=f"ws://127.0.0.1:{fake_port}", OPENAI_API_KEY="test",
+                       PORT=str(app_port), REALTIME_POOL_MAX=str(pool_max))
+            app = start([sys.executable, os.path.join(PROJECT_DIR, "main.py")], app_port, env)
+            try:
+                time.sleep(args.handshake_delay + 1)  # The pool fills up when the app starts
+                setups = asyncio.run(arrivals(f"ws://127.0.0.1:{app_port}/media-stream", args.calls, args.rate,
+                                              args.call_seconds))
+                pool = get_metrics(app_port)["workers"][0]["realtime_pool"]
+            finally:
+                app.terminate()
+                app.wait()
+            print(f"{'on' if pool_max else 'off':<4}  {statistics.median(setups) * 1000:7.0f} ms  "
+                  f"{percentile(setups, 0.99) * 1000:6.0f}  {max(setups) * 1000:6.0f}   "
+                  f"{pool['hits']} of {pool['hits'] + pool['misses']}, kept {pool['target']}")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Replay Twilio media streams through /media-stream and measure the bridge's frames/sec and CPU per frame.
+
+main.py runs in its own process, connected to fake_realtime.py, which echoes each audio frame back as a
+response.audio.delta. Each simulated call sends its frames as fast as the bridge takes them and waits for all of
+them to come back, so the bridge relays two frames per frame sent. The bridge sends audio to Twilio at the pace
+it plays, so a call lasts at least as long as its audio. CPU is the bridge process's user + system time, so the
+per-frame cost and the number of live calls (50 frames/s each way) a core can relay follow:
+
+    python bench_relay.py --calls 1 10 50 --frames 3000
+    python bench_relay.py --recording call.jsonl  # Twilio messages of a recorded call, one per line
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import websockets
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_BYTES = 160  # 20 ms of 8 kHz g711 u-law
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(command, port, env=None):
+    process = subprocess.Popen(command, env=env, cwd=os.path.dirname(command[1]), stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{' '.join(command)} did not start")
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def synthetic_call(frames):
+    """Twilio messages of a call: connected, start, `frames` media frames of noise and stop."""
+    stream_sid = f"MZ{random.getrandbits(128):032x}"
+    messages = [{"event": "connected", "protocol": "Call", "version": "1.0.0"},
+                {"event": "start", "sequenceNumber": "1", "streamSid": stream_sid,
+                 "start": {"streamSid": stream_sid, "accountSid": "AC" + "0" * 32, "callSid": "CA" + "0" * 32,
+                           "tracks": ["inbound"], "customParameters": {},
+                           "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}}}]
+    for n in range(frames):
+        payload = base64.b64encode(random.randbytes(FRAME_BYTES)).decode()
+        messages.append({"event": "media", "sequenceNumber": str(n + 2), "streamSid": stream_sid,
+                         "media": {"track": "inbound", "chunk": str(n + 1), "timestamp": str(n * 20),
+                                   "payload": payload}})
+    messages.append({"event": "stop", "sequenceNumber": str(frames + 2), "streamSid": stream_sid,
+                     "stop": {"accountSid": "AC" + "0" * 32, "callSid": "CA" + "0" * 32}})
+    return [json.dumps(message) for message in messages]
+
+
+async def replay(url, messages):
+    """Send a call's messages and wait until every media frame came back. Returns the frames relayed."""
+    media = [message for message in messages if '"event": "media"' in message or '"event":"media"' in message]
+    async with websockets.connect(url, max_size=None) as websocket:
+        received = 0
+
+        async def receive():
+            nonlocal received
+            async for message in websocket:
+                if json.loads(message).get("event") == "media":
+                    received += 1
+                    if received == len(media):
+                        return
+
+        receiver = asyncio.create_task(receive())
+        for message in messages:
+            if '"stop"' in message.split(",", 1)[0]:
+                await asyncio.wait_for(receiver, 120)
+            await websocket.send(message)
+        return len(media) + received
+
+
+async def run(url, calls, make_messages):
+    messages = [make_messages() for _ in range(calls)]
+    start = time.perf_counter()
+    relayed = await asyncio.gather(*(replay(url, call) for call in messages))
+    return sum(relayed), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--frames", type=int, default=3000, help="Media frames per synthetic call (60 s)")
+    parser.add_argument("--recording", help="JSONL file of the Twilio messages of a call, replayed by each call")
+    parser.add_argument("--app-dir", default=PROJECT_DIR, help="Directory of the main.py to measure")
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording) as f:
+            recording = [line.strip() for line in f if line.strip()]
+        make_messages = lambda: recording
+    else:
+        make_messages = lambda: synthetic_call(args.frames)
+
+    fake_port, app_port = free_port(), free_port()
+    env = dict(os.environ, OPENAI_REALTIME_URL=f"ws://127.0.0.1:{fake_port}", OPENAI_API_KEY="test")
+    processes = [start([sys.executable, os.path.join(PROJECT_DIR, "fake_realtime.py"), "--port", str(fake_port)],
+                       fake_port)]
+    # Run as `python main.py`, with the server settings of main.py
+    app = start([sys.executable, os.path.join(args.app_dir, "main.py")], app_port, dict(env, PORT=str(app_port)))
+    processes.append(app)
+    try:
+        print("calls   frames relayed    frames/s   bridge CPU per frame   calls per core")
+        for calls in args.calls:
+            cpu_before = cpu_seconds(app.pid)
+            relayed, seconds = asyncio.run(run(f"ws://127.0.0.1:{app_port}/media-stream", calls, make_messages))
+            cpu = cpu_seconds(app.pid) - cpu_before
+            per_frame = cpu / relayed
+            print(f"{calls:>5}  {relayed:>15}  {relayed / seconds:10.0f}  {per_frame * 1e6:17.1f} us  "
+                  f"{1 / (per_frame * 100):15.0f}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measure the local VAD (LOCAL_VAD=1): the CPU it adds per caller frame, and the upstream messages it saves.
+
+The audio is a Twilio recording (JSONL, one message per line, as for bench_relay.py) or, by default, a synthetic
+call: the caller's turns of voiced syllables, quiet fricatives and short pauses, and the stretches of line noise
+while they listen to the assistant. For the synthetic call, whose speech frames are known, the report also
+shows how many of them were sent upstream, which must be all of them:
+
+    python bench_vad.py --seconds 300
+    python bench_vad.py --recording call.jsonl
+"""
+import argparse
+import base64
+import json
+import time
+
+import numpy as np
+import orjson
+
+from main import AUDIO_APPEND_TEMPLATE, TURN_SILENCE_MS
+from vad import SilenceGate, ulaw_encode
+
+RATE = 8000
+FRAME = 160
+
+
+def synthetic_call(seconds, seed=0):
+    """u-law frames of a call, and whether each one has speech."""
+    rng = np.random.default_rng(seed)
+    samples, speech = [], []
+    while sum(len(chunk) for chunk in samples) < seconds * RATE:
+        # Listening to the assistant: line noise
+        quiet = int(rng.uniform(2, 6) * RATE)
+        samples.append(rng.normal(0, 20, quiet))
+        speech.append(np.zeros(quiet, bool))
+        # A turn of syllables, with pauses
+        for _ in range(rng.integers(3, 15)):
+            length = int(rng.uniform(0.12, 0.3) * RATE)
+            t = np.arange(length) / RATE
+            pitch = rng.uniform(100, 220)
+            voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 8))
+            envelope = np.sin(np.pi * t / t[-1]) * rng.uniform(1500, 8000)
+            syllable = voiced * envelope
+            if rng.random() < 0.3:  # A quiet fricative before the vowel
+                syllable = np.concatenate([rng.normal(0, 300, int(0.08 * RATE)), syllable])
+            pause = int(rng.uniform(0.02, 0.25) * RATE)
+            samples += [syllable, rng.normal(0, 20, pause)]
+            speech += [np.ones(len(syllable), bool), np.zeros(pause, bool)]
+    audio = ulaw_encode(np.clip(np.concatenate(samples), -32768, 32767))
+    labels = np.concatenate(speech)
+    frames = len(audio) // FRAME
+    return ([audio[n * FRAME:(n + 1) * FRAME] for n in range(frames)],
+            [bool(labels[n * FRAME:(n + 1) * FRAME].any()) for n in range(frames)])
+
+
+def twilio_messages(frames):
+    return [json.dumps({"event": "media", "streamSid": "MZ" + "0" * 32,
+                        "media": {"track": "inbound", "payload": base64.b64encode(frame).decode()}})
+            for frame in frames]
+
+
+def relay(messages, gate):
+    """The inbound hot path of the bridge, without the sending. Returns the messages for OpenAI."""
+    upstream = []
+    for message in messages:
+        data = orjson.loads(message)
+        if data['event'] == 'media':
+            payload = data['media']['payload']
+            if gate:
+                payload = gate.push(payload)
+            if payload:
+                upstream.append(AUDIO_APPEND_TEMPLATE % payload)
+    return upstream
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=300, help="Length of the synthetic call")
+    parser.add_argument("--recording", help="JSONL file of the Twilio messages of a call")
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording) as f:
+            messages = [line.strip() for line in f if line.strip()]
+        labels = None
+    else:
+        frames, labels = synthetic_call(args.seconds)
+        messages = twilio_messages(frames)
+    media = sum('"media"' in message for message in messages)
+
+    print(f"{media} caller frames ({media / 50:.0f} s)")
+    print("local VAD   CPU per frame   upstream messages   upstream bytes")
+    results = {}
+    for enabled in (False, True):
+        gate = SilenceGate(hangover_frames=TURN_SILENCE_MS // 20 + 10) if enabled else None
+        start = time.process_time()
+        upstream = relay(messages, gate)
+        cpu = time.process_time() - start
+        results[enabled] = upstream
+        print(f"{'on' if enabled else 'off':<9}  {cpu / media * 1e6:10.1f} us  {len(upstream):>18}  "
+              f"{sum(map(len, upstream)):>15}")
+    off, on = results[False], results[True]
+    print(f"{1 - len(on) / len(off):.0%} fewer messages, {1 - sum(map(len, on)) / sum(map(len, off)):.0%} fewer bytes")
+
+    if labels:
+        # Every speech frame must be sent, in its own message or with the frames before an onset
+        sent = np.zeros(len(labels), bool)
+        gate = SilenceGate(hangover_frames=TURN_SILENCE_MS // 20 + 10)
+        for n, message in enumerate(messages):
+            payload = gate.push(json.loads(message)["media"]["payload"])
+            if payload:
+                count = len(base64.b64decode(payload)) // FRAME
+                sent[n - count + 1:n + 1] = True
+        speech = np.array(labels)
+        print(f"speech frames sent: {sent[speech].sum()} of {speech.sum()}, silent frames sent: "
+              f"{sent[~speech].sum()} of {(~speech).sum()}")
+
+
+if __name__ == "__main__":
+    main()
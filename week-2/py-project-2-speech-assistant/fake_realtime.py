@@ -0,0 +1,169 @@
+"""
+Local stand-in for the OpenAI Realtime API WebSocket that main.py connects to.
+
+It answers session.update with session.updated and echoes the audio of input_audio_buffer.append events back
+as response.audio.delta events, with the fields the real API sends, so a bridge under test relays as much audio
+to Twilio as it receives and a client can time each frame's round trip. Like the real API, it can bundle
+several 20 ms frames per delta (--delta-frames), answer after a model delay (--delay) and take as long as a
+connection over the internet to accept a new session (--handshake-delay).
+
+With --reply-seconds, it holds a conversation instead of echoing: like server VAD, a frame that is not all
+silence (0xFF in u-law) after silence is speech_started, and a silent frame after speech is speech_stopped,
+answered with --reply-seconds of audio, streamed --reply-speed times faster than real time. Speech during an
+answer cancels what is left of it, and conversation.item.truncate events are recorded. The benchmark scripts
+start it in a background thread or process; it can also be run on its own and the app pointed at it:
+
+    python fake_realtime.py --port 4050 --delta-frames 5 --delay 0.2
+    python fake_realtime.py --port 4050 --reply-seconds 8
+    OPENAI_REALTIME_URL=ws://127.0.0.1:4050 python main.py
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import threading
+
+import websockets
+
+_ids = itertools.count(1)
+REPLY_FRAME = b"\x55" * 160  # 20 ms of the assistant's answer
+
+
+def event_id():
+    return f"event_{next(_ids):016d}"
+
+
+class FakeRealtimeState:
+    def __init__(self, delay=0.0, delta_frames=1, reply_seconds=0.0, reply_speed=4.0, handshake_delay=0.0):
+        self.delay = delay
+        self.delta_frames = delta_frames
+        self.reply_seconds = reply_seconds
+        self.reply_speed = reply_speed
+        self.handshake_delay = handshake_delay
+        self.sessions = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.truncations = []  # (item id, audio_end_ms)
+
+
+async def handle_session(websocket, state):
+    state.sessions += 1
+    session_id = f"sess_{next(_ids):012d}"
+    await websocket.send(json.dumps({"type": "session.created", "event_id": event_id(),
+                                     "session": {"id": session_id, "object": "realtime.session"}}))
+    response_id, item_id = f"resp_{next(_ids):012d}", f"item_{next(_ids):012d}"
+    loop = asyncio.get_running_loop()
+    outbox = asyncio.Queue()  # (time to send, message), in order
+    pending = []  # Audio of the frames received for the next delta
+
+    async def send_when_due():
+        while True:
+            due, message = await outbox.get()
+            if due > loop.time():
+                await asyncio.sleep(due - loop.time())
+            await websocket.send(message)
+
+    def queue_delta(frames, due=None):
+        delta = base64.b64encode(b"".join(frames)).decode() if len(frames) > 1 else frames[0]
+        outbox.put_nowait((loop.time() + state.delay if due is None else due, json.dumps({
+            "type": "response.audio.delta", "event_id": event_id(), "response_id": response_id,
+            "item_id": item_id, "output_index": 0, "content_index": 0, "delta": delta,
+        })))
+        state.frames_out += len(frames)
+
+    def queue_event(event_type, due=0, **fields):
+        outbox.put_nowait((due, json.dumps(dict(fields, type=event_type, event_id=event_id()))))
+
+    def reply():
+        nonlocal response_id, item_id
+        response_id, item_id = f"resp_{next(_ids):012d}", f"item_{next(_ids):012d}"
+        due = loop.time() + state.delay
+        frames = int(state.reply_seconds / 0.02)
+        for start in range(0, frames, state.delta_frames):
+            queue_delta([REPLY_FRAME] * min(state.delta_frames, frames - start), due)
+            due += state.delta_frames * 0.02 / state.reply_speed
+        queue_event("response.audio.done", due, response_id=response_id, item_id=item_id, output_index=0,
+                    content_index=0)
+
+    def converse(audio, speaking):
+        """Server VAD on one frame. Returns whether the caller is speaking."""
+        if audio.strip(b"\xff") and not speaking:
+            # The caller talks over the answer, which is cancelled
+            while not outbox.empty():
+                outbox.get_nowait()
+            queue_event("input_audio_buffer.speech_started", audio_start_ms=state.frames_in * 20)
+            return True
+        if speaking and not audio.strip(b"\xff"):
+            queue_event("input_audio_buffer.speech_stopped", audio_end_ms=state.frames_in * 20)
+            reply()
+            return False
+        return speaking
+
+    sender = asyncio.create_task(send_when_due())
+    speaking = False
+    try:
+        async for message in websocket:
+            event = json.loads(message)
+            if event["type"] == "input_audio_buffer.append" and state.reply_seconds:
+                state.frames_in += 1
+                speaking = converse(base64.b64decode(event["audio"]), speaking)
+            elif event["type"] == "input_audio_buffer.append":
+                state.frames_in += 1
+                pending.append(base64.b64decode(event["audio"]) if state.delta_frames > 1 else event["audio"])
+                if len(pending) >= state.delta_frames:
+                    queue_delta(pending)
+                    pending = []
+            elif event["type"] == "conversation.item.truncate":
+                state.truncations.append((event["item_id"], event["audio_end_ms"]))
+                queue_event("conversation.item.truncated", item_id=event["item_id"], content_index=0,
+                            audio_end_ms=event["audio_end_ms"])
+            elif event["type"] == "session.update":
+                outbox.put_nowait((0, json.dumps({"type": "session.updated", "event_id": event_id(),
+                                                  "session": dict(event["session"], id=session_id)})))
+    finally:
+        sender.cancel()
+
+
+async def serve(port=0, state=None, ready=None):
+    """Serve until cancelled. `ready` is called with the bound port once the server listens."""
+    state = state or FakeRealtimeState()
+
+    async def handshake(path, request_headers):
+        if state.handshake_delay:
+            await asyncio.sleep(state.handshake_delay)
+
+    async with websockets.serve(lambda websocket: handle_session(websocket, state), "127.0.0.1", port,
+                                max_size=None, process_request=handshake) as server:
+        if ready:
+            ready(server.sockets[0].getsockname()[1])
+        await asyncio.Future()
+
+
+def start_in_background(port=0, **settings):
+    """Start the fake API on its own event loop thread and return (state, url)."""
+    state = FakeRealtimeState(**settings)
+    bound = []
+    started = threading.Event()
+
+    def run():
+        asyncio.run(serve(port, state, ready=lambda port: (bound.append(port), started.set())))
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait(10)
+    return state, f"ws://127.0.0.1:{bound[0]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the OpenAI Realtime API.")
+    parser.add_argument("--port", type=int, default=4050)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before the audio of a frame is sent back")
+    parser.add_argument("--delta-frames", type=int, default=1, help="20 ms frames per response.audio.delta")
+    parser.add_argument("--reply-seconds", type=float, default=0.0, help="Answer each turn with this much audio")
+    parser.add_argument("--reply-speed", type=float, default=4.0, help="Answers stream this many times real time")
+    parser.add_argument("--handshake-delay", type=float, default=0.0, help="Seconds to accept a new session")
+    args = parser.parse_args()
+    print(f"Fake OpenAI Realtime API listening on ws://127.0.0.1:{args.port}")
+    asyncio.run(serve(args.port, FakeRealtimeState(delay=args.delay, delta_frames=args.delta_frames,
+                                                   reply_seconds=args.reply_seconds, reply_speed=args.reply_speed,
+                                                   handshake_delay=args.handshake_delay)))
@@ -0,0 +1,214 @@
+"""
+Load-test /media-stream with a ramp of concurrent simulated phone calls, entirely on this machine.
+
+main.py runs in its own process, connected to fake_realtime.py, which sends the caller's audio back in
+response.audio.delta events of --delta-frames frames after --delay seconds. Each call is a fake Twilio media
+stream that sends a 20 ms g711 u-law frame every 20 ms, like a phone line, for --duration seconds. The first
+8 bytes of every frame are its sequence number, so each frame that comes back is matched to the time it was
+sent. For every step of the ramp the report shows:
+
+- the audio latency, from when the fake API had a delta's audio (its newest frame was sent) to when the delta
+  reached the caller, including --delay,
+- dropped frames, that never came back, and late frames, back more than --late-ms (plus --delay) after being
+  sent,
+- the bridge's event loop lag from its /metrics, and the load test's own, which must stay low for the numbers
+  to mean something,
+- the bridge's memory per call, from its resident memory during the step compared to when idle, and its CPU
+  time per frame relayed, counting both ways.
+
+    python load_test.py --calls 1 5 10 25 50 --duration 10
+    python load_test.py --calls 25 --max-p99-ms 100 --max-dropped 0  # Exits with 1 over the limits or on errors
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import struct
+import sys
+import time
+import urllib.request
+
+import websockets
+
+from bench_relay import cpu_seconds, free_port, start, synthetic_call
+from loop_lag import LoopLagMonitor
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_BYTES = 160  # 20 ms of 8 kHz g711 u-law
+FRAME_SECONDS = 0.02
+
+
+def rss_bytes(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def get_metrics(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=10) as response:
+        return json.load(response)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+class CallResult:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.late = 0
+        self.latencies = []  # Seconds, one per response.audio.delta
+        self.error = None
+
+
+async def call(url, frames, delta_frames, late, result, start_at):
+    """One phone call: send `frames` frames at the pace of a phone line and time each one coming back."""
+    loop = asyncio.get_running_loop()
+    connected, started, *_, stop = synthetic_call(0)
+    sent_at = [0.0] * frames
+    noise = random.randbytes(FRAME_BYTES - 8)
+
+    async def receive(websocket):
+        async for message in websocket:
+            now = loop.time()
+            event = json.loads(message)
+            if event.get("event") != "media":
+                continue
+            audio = base64.b64decode(event["media"]["payload"])
+            available = 0.0
+            for offset in range(0, len(audio), FRAME_BYTES):
+                n = struct.unpack_from(">Q", audio, offset)[0]
+                result.received += 1
+                result.late += now - sent_at[n] > late
+                # The fake API had the audio once the last frame of its delta was sent
+                last = min(frames - 1, n // delta_frames * delta_frames + delta_frames - 1)
+                available = max(available, sent_at[last])
+            result.latencies.append(now - available)
+            if result.received == frames:
+                return
+
+    try:
+        async with websockets.connect(url, max_size=None, compression=None) as websocket:
+            await websocket.send(connected)
+            await websocket.send(started)
+            receiver = asyncio.create_task(receive(websocket))
+            template = '{"event":"media","streamSid":"%s","media":{"track":"inbound","payload":"%s"}}'
+            stream_sid = json.loads(started)["streamSid"]
+            for n in range(frames):
+                # On an absolute schedule, so a late frame does not delay the next ones
+                delay = start_at + n * FRAME_SECONDS - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                sent_at[n] = loop.time()
+                payload = base64.b64encode(struct.pack(">Q", n) + noise).decode()
+                await websocket.send(template % (stream_sid, payload))
+                result.sent += 1
+            try:
+                # Frames still on their way have until they count as late to come back
+                await asyncio.wait_for(receiver, late + 1)
+            except asyncio.TimeoutError:
+                pass
+            await websocket.send(stop)
+    except Exception as e:
+        result.error = repr(e)
+
+
+async def step(url, metrics_port, app_pid, calls, frames, delta_frames, late):
+    loop = asyncio.get_running_loop()
+    results = [CallResult() for _ in range(calls)]
+    # Calls start at random points of the first frame, like real callers, not in lockstep
+    start_at = loop.time() + 0.5
+    tasks = [asyncio.create_task(call(url, frames, delta_frames, late, result,
+                                      start_at + random.uniform(0, FRAME_SECONDS)))
+             for result in results]
+    # Sample memory and the bridge's loop lag while every call is streaming
+    await asyncio.sleep(0.5 + frames * FRAME_SECONDS * 0.9)
+    rss = rss_bytes(app_pid)
+    metrics = await asyncio.to_thread(get_metrics, metrics_port)
+    await asyncio.gather(*tasks)
+    return results, rss, metrics
+
+
+async def run(url, metrics_port, app_pid, calls, frames, delta_frames, late):
+    # Measures the load test's own event loop: if it lags, the calls it simulates are late, not the bridge
+    client_lag = LoopLagMonitor(window=frames * FRAME_SECONDS)
+    client_lag.start()
+    try:
+        return await step(url, metrics_port, app_pid, calls, frames, delta_frames, late) + (client_lag.stats(),)
+    finally:
+        client_lag.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, nargs="+", default=[1, 5, 10, 25, 50], help="Concurrent calls per step")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of audio each call sends per step")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds the fake API takes to send audio back")
+    parser.add_argument("--delta-frames", type=int, default=5, help="Frames per response.audio.delta (100 ms)")
+    parser.add_argument("--late-ms", type=float, default=250, help="Frames back later than this count as late")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if a step's p99 audio latency is higher")
+    parser.add_argument("--max-dropped", type=int, help="Fail if a step drops more frames")
+    parser.add_argument("--app-dir", default=PROJECT_DIR, help="Directory of the main.py to measure")
+    args = parser.parse_args()
+    # Whole deltas only, the fake API keeps a partial one until more audio arrives
+    frames = -(-int(args.duration / FRAME_SECONDS) // args.delta_frames) * args.delta_frames
+    late = args.late_ms / 1000 + args.delay
+
+    fake_port, app_port = free_port(), free_port()
+    env = dict(os.environ, OPENAI_REALTIME_URL=f"ws://127.0.0.1:{fake_port}", OPENAI_API_KEY="test")
+    processes = [start([sys.executable, os.path.join(PROJECT_DIR, "fake_realtime.py"), "--port", str(fake_port),
+                        "--delay", str(args.delay), "--delta-frames", str(args.delta_frames)], fake_port)]
+    app = start([sys.executable, os.path.join(args.app_dir, "main.py")], app_port, dict(env, PORT=str(app_port)))
+    processes.append(app)
+    failed = []
+    try:
+        time.sleep(1)
+        idle_rss = rss_bytes(app.pid)
+        print(f"{args.duration:.0f} s calls, {args.delta_frames} frames per delta, {args.delay * 1000:.0f} ms API "
+              f"delay, late after {args.late_ms:.0f} ms; bridge idle at {idle_rss / 2 ** 20:.1f} MiB")
+        print("calls   latency p50     p99     max   dropped   late   errors   bridge lag p99 / max   "
+              "client lag p99   memory per call   CPU per frame")
+        for calls in args.calls:
+            cpu_before = cpu_seconds(app.pid)
+            results, rss, metrics, client_lag = asyncio.run(
+                run(f"ws://127.0.0.1:{app_port}/media-stream", app_port, app.pid, calls, frames, args.delta_frames,
+                    late))
+            cpu = cpu_seconds(app.pid) - cpu_before
+            latencies = [latency for result in results for latency in result.latencies]
+            sent = sum(result.sent for result in results)
+            dropped = sent - sum(result.received for result in results)
+            late_frames = sum(result.late for result in results)
+            errors = [result.error for result in results if result.error]
+            # The most lagging worker, when the bridge runs several
+            lag = max((worker["event_loop_lag_ms"] for worker in metrics["workers"]), key=lambda lag: lag["p99"])
+            p99 = percentile(latencies, 0.99) * 1000
+            print(f"{calls:>5}  {percentile(latencies, 0.5) * 1000:8.1f} ms  {p99:6.1f}  "
+                  f"{max(latencies, default=float('nan')) * 1000:6.1f}  {dropped:>8}  {late_frames:>5}  "
+                  f"{len(errors):>7}  {lag['p99']:10.1f} / {lag['max']:5.1f} ms  {client_lag['p99']:11.1f} ms  "
+                  f"{(rss - idle_rss) / calls / 1024:12.0f} KiB  {cpu / max(1, 2 * sent) * 1e6:10.1f} us")
+            for error in sorted(set(errors)):
+                print(f"       error: {error}")
+            if args.max_p99_ms is not None and not p99 <= args.max_p99_ms:
+                failed.append(f"{calls} calls: p99 latency {p99:.1f} ms > {args.max_p99_ms:.1f} ms")
+            if args.max_dropped is not None and dropped > args.max_dropped:
+                failed.append(f"{calls} calls: {dropped} dropped frames > {args.max_dropped}")
+            if errors:
+                failed.append(f"{calls} calls: {len(errors)} calls failed")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    for failure in failed:
+        print(f"FAILED {failure}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import asyncio
+from collections import deque
+
+
+class LoopLagMonitor:
+    """
+    Measure how late the event loop runs callbacks: every `interval` seconds a task asks to be woken up and
+    records how much later than asked it was. A busy loop delays every call's audio frames by as much.
+    Statistics cover the last `window` seconds.
+    """
+
+    def __init__(self, interval=0.05, window=10):
+        self.interval = interval
+        self.samples = deque(maxlen=int(window / interval))
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def stats(self):
+        """Lag percentiles in milliseconds."""
+        samples = sorted(self.samples)
+        if not samples:
+            return {'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+        return {
+            'p50': round(samples[len(samples) // 2] * 1000, 2),
+            'p99': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2),
+            'max': round(samples[-1] * 1000, 2),
+        }
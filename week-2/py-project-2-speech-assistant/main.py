@@ -1,19 +1,27 @@
 import os
 import json
-import base64
 import asyncio
+import tempfile
+import orjson
 import websockets
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.websockets import WebSocketDisconnect
+from fastapi.websockets import WebSocketDisconnect, WebSocketState
 from twilio.twiml.voice_response import VoiceResponse, Connect, Start, Stream
 from dotenv import load_dotenv
 from pathlib import Path
+from loop_lag import LoopLagMonitor
+from realtime_pool import RealtimePool
+from vad import SilenceGate
+from serving import DrainingServer, WorkerStats
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_REALTIME_URL = os.getenv('OPENAI_REALTIME_URL',
+                                'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01')
 PORT = int(os.getenv('PORT', 5050))
 SYSTEM_MESSAGE = (
     "You are a helpful and bubbly AI assistant who loves to chat about "
@@ -27,8 +35,74 @@ LOG_EVENT_TYPES = [
     'input_audio_buffer.committed', 'input_audio_buffer.speech_stopped',
     'input_audio_buffer.speech_started', 'session.created'
 ]
+# Envelopes of the audio frames, 50 per second each way and call. The base64 payloads are copied into them as
+# they are, both APIs only send base64 characters, which need no JSON escaping.
+TWILIO_MEDIA_TEMPLATE = '{"event":"media","streamSid":%s,"media":{"payload":"%s"}}'
+AUDIO_APPEND_TEMPLATE = '{"type":"input_audio_buffer.append","audio":"%s"}'
+TWILIO_MARK_TEMPLATE = '{"event":"mark","streamSid":%s,"mark":{"name":"%d"}}'
+TWILIO_CLEAR_TEMPLATE = '{"event":"clear","streamSid":%s}'
+# The assistant's audio is queued per call and sent to Twilio in chunks of 3 g711 frames (60 ms, 480 bytes), the
+# smallest whole number of 20 ms frames that can be cut out of the base64 audio without decoding it. Chunks are
+# sent at most TWILIO_AUDIO_LEAD seconds ahead of playback, so when the caller interrupts, the rest is still here
+# to drop. A full queue stops reading from OpenAI, which also holds back speech_started events behind the audio,
+# so the queue holds far more than a usual answer.
+AUDIO_CHUNK_CHARS = 640
+OUTBOUND_QUEUE_SIZE = 500  # Chunks, 30 s of audio
+TWILIO_AUDIO_LEAD = 0.2
+MARK_INTERVAL_MS = 100  # Playback position resolution, Twilio echoes each mark once the audio before it played
+# Realtime sessions set up ahead of calls, REALTIME_POOL_MAX=0 turns the pool off
+REALTIME_POOL_MIN = int(os.getenv('REALTIME_POOL_MIN', 1))
+REALTIME_POOL_MAX = int(os.getenv('REALTIME_POOL_MAX', 8))
+REALTIME_POOL_MAX_IDLE = int(os.getenv('REALTIME_POOL_MAX_IDLE', 120))
+# LOCAL_VAD=1 drops the caller's silence before it is sent to OpenAI, whose server VAD still detects the turns.
+# The silence after speech is sent for TURN_SILENCE_MS plus a margin, so the server sees each turn end.
+LOCAL_VAD = os.getenv('LOCAL_VAD', '0') == '1'
+TURN_SILENCE_MS = 500
+# Worker processes, each with its own event loop, and the calls each one takes. On SIGTERM, a worker stops taking
+# calls and exits once its calls ended, or after DRAIN_TIMEOUT seconds.
+WORKERS = int(os.getenv('WEB_CONCURRENCY', 1))
+MAX_CALLS_PER_WORKER = int(os.getenv('MAX_CALLS_PER_WORKER', 100))
+DRAIN_TIMEOUT = int(os.getenv('DRAIN_TIMEOUT', 900))
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'speech-assistant-{PORT}'))
+
+loop_lag = LoopLagMonitor()
+
+
+async def connect_realtime():
+    """Open a Realtime API session, configured for calls."""
+    # No permessage-deflate: base64 audio hardly compresses, and zlib was the largest cost per frame
+    openai_ws = await websockets.connect(
+        OPENAI_REALTIME_URL,
+        compression=None,
+        extra_headers={
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "OpenAI-Beta": "realtime=v1",
+            "Content-Type": "application/json"
+        }
+    )
+    await send_session_update(openai_ws)
+    return openai_ws
+
+
+realtime_pool = RealtimePool(connect_realtime, min_size=min(REALTIME_POOL_MIN, REALTIME_POOL_MAX),
+                             max_size=REALTIME_POOL_MAX, max_idle=REALTIME_POOL_MAX_IDLE)
+worker_stats = WorkerStats(MAX_CALLS_PER_WORKER, METRICS_DIR, extra=lambda: {
+    "event_loop_lag_ms": loop_lag.stats(), "realtime_pool": realtime_pool.stats()})
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    loop_lag.start()
+    worker_stats.start()
+    if REALTIME_POOL_MAX:
+        realtime_pool.start()
+    yield
+    loop_lag.stop()
+    worker_stats.stop()
+    await realtime_pool.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Create and mount static directory
 static_dir = Path("static")
@@ -62,6 +136,11 @@ async def handle_incoming_call(request: Request):
     """Handle incoming call and return TwiML response to connect to Media Stream."""
     response = VoiceResponse()
 
+    if worker_stats.full():
+        response.say("All our assistants are busy right now. Please call again in a few minutes.", voice='alice')
+        response.hangup()
+        return HTMLResponse(content=str(response), media_type="application/xml")
+
     # Start with initial greeting
     response.say(
         "Please wait while we connect your call to the AI voice assistant, powered by Twilio and OpenAI.",
@@ -99,23 +178,44 @@ async def handle_incoming_call(request: Request):
     return HTMLResponse(content=str(response), media_type="application/xml")
 
 
+@app.get("/metrics")
+async def metrics():
+    """Calls, event loop lag and audio frames per second of every worker."""
+    workers = worker_stats.workers()
+    return JSONResponse({
+        "active_calls": sum(worker["active_calls"] for worker in workers),
+        "frames_per_second": {direction: sum(worker["frames_per_second"][direction] for worker in workers)
+                              for direction in ("in", "out")},
+        "workers": workers,
+    })
+
+
 @app.websocket("/media-stream")
 async def handle_media_stream(websocket: WebSocket):
     """Handle WebSocket connections between Twilio and OpenAI."""
+    if worker_stats.full():
+        # The stream reached a worker without room, which refuses it before accepting
+        print("Client refused, the worker is full or draining")
+        await websocket.close(code=1013)
+        return
     print("Client connected")
     await websocket.accept()
+    worker_stats.active_calls += 1
 
     try:
-        async with websockets.connect(
-                'wss://api.openai.com/v1/audio/speech',
-                extra_headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "OpenAI-Beta": "realtime=v1",
-                    "Content-Type": "application/json"
-                }
-        ) as openai_ws:
-            await send_session_update(openai_ws)
+        # A session set up ahead of the call, when the pool has one
+        async with realtime_pool.session() as openai_ws:
             stream_sid = None
+            stream_sid_json = 'null'  # stream_sid encoded once for the media envelopes
+            loop = asyncio.get_running_loop()
+            outbound = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)  # (epoch, item id, end in ms, base64 audio)
+            epoch = 0  # Incremented on interruptions, chunks of an earlier epoch are dropped
+            play_until = 0.0  # When Twilio will have played all the audio sent to it
+            item_id = None  # Assistant message being spoken
+            received_ms = played_ms = 0  # Audio of item_id received from OpenAI, and played to the caller
+            marks = {}  # Mark name -> (item id, end in ms) of the marks sent to Twilio, not played yet
+            mark_count = 0
+            silence_gate = SilenceGate(hangover_frames=TURN_SILENCE_MS // 20 + 10) if LOCAL_VAD else None
 
             async def handle_disconnect():
                 """Handle cleanup on disconnect"""
@@ -130,20 +230,31 @@ async def handle_media_stream(websocket: WebSocket):
 
             async def receive_from_twilio():
                 """Receive audio data from Twilio and send it to the OpenAI Realtime API."""
-                nonlocal stream_sid
+                nonlocal stream_sid, stream_sid_json, played_ms
                 try:
                     async for message in websocket.iter_text():
-                        data = json.loads(message)
-                        print(f"Received event from Twilio: {data['event']}")
+                        data = orjson.loads(message)
+
+                        # Hot path, nothing is logged for media frames
+                        if data['event'] == 'media':
+                            worker_stats.frames_in += 1
+                            payload = data['media']['payload']
+                            if silence_gate:
+                                payload = silence_gate.push(payload)
+                            if payload and openai_ws.open:
+                                await openai_ws.send(AUDIO_APPEND_TEMPLATE % payload)
+                            continue
+
+                        if data['event'] == 'mark':
+                            mark = marks.pop(data['mark']['name'], None)
+                            if mark and mark[0] == item_id:
+                                played_ms = mark[1]
+                            continue
 
-                        if data['event'] == 'media' and openai_ws.open:
-                            audio_append = {
-                                "type": "input_audio_buffer.append",
-                                "audio": data['media']['payload']
-                            }
-                            await openai_ws.send(json.dumps(audio_append))
-                        elif data['event'] == 'start':
+                        print(f"Received event from Twilio: {data['event']}")
+                        if data['event'] == 'start':
                             stream_sid = data['start']['streamSid']
+                            stream_sid_json = orjson.dumps(stream_sid).decode()
                             print(f"Incoming stream started: {stream_sid}")
                         elif data['event'] == 'stop':
                             print(f"Stream stopped: {stream_sid}")
@@ -156,40 +267,106 @@ async def handle_media_stream(websocket: WebSocket):
                     await handle_disconnect()
 
             async def send_to_twilio():
-                """Receive events from the OpenAI Realtime API, send audio back to Twilio."""
-                nonlocal stream_sid
+                """Receive events from the OpenAI Realtime API, queue the audio for Twilio."""
+                nonlocal item_id, received_ms, played_ms
                 try:
                     async for openai_message in openai_ws:
-                        response = json.loads(openai_message)
+                        response = orjson.loads(openai_message)
+
+                        # Hot path, the base64 audio is queued in chunks without being decoded
+                        if response['type'] == 'response.audio.delta':
+                            delta = response.get('delta')
+                            if delta:
+                                if response['item_id'] != item_id:
+                                    item_id, received_ms, played_ms = response['item_id'], 0, 0
+                                for start in range(0, len(delta), AUDIO_CHUNK_CHARS):
+                                    chunk = delta[start:start + AUDIO_CHUNK_CHARS]
+                                    received_ms += (len(chunk) * 3 // 4 - chunk.count('=', -2)) / 8
+                                    await outbound.put((epoch, item_id, received_ms, chunk))
+                            continue
 
                         if response['type'] in LOG_EVENT_TYPES:
                             print(f"Received OpenAI event: {response['type']}")
 
+                        if response['type'] == 'response.audio.done' and response.get('item_id') == item_id:
+                            # Mark the end of the answer, to know when the caller heard all of it
+                            await outbound.put((epoch, item_id, received_ms, None))
+                        elif response['type'] == 'input_audio_buffer.speech_started':
+                            await interrupt()
+
                         if response['type'] == 'session.updated':
                             print("Session updated successfully")
-
-                        if response['type'] == 'response.audio.delta' and response.get('delta'):
-                            try:
-                                audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
-                                audio_delta = {
-                                    "event": "media",
-                                    "streamSid": stream_sid,
-                                    "media": {
-                                        "payload": audio_payload
-                                    }
-                                }
-                                await websocket.send_json(audio_delta)
-                            except Exception as e:
-                                print(f"Error processing audio data: {e}")
                 except Exception as e:
                     print(f"Error in send_to_twilio: {e}")
                     await handle_disconnect()
 
-            await asyncio.gather(receive_from_twilio(), send_to_twilio())
+            async def pace_to_twilio():
+                """Send the queued audio to Twilio as it plays, with a mark every MARK_INTERVAL_MS."""
+                nonlocal play_until, mark_count
+                marked_item, marked_ms = None, 0
+                try:
+                    while True:
+                        chunk_epoch, chunk_item, end_ms, chunk = await outbound.get()
+                        if chunk is not None:
+                            wait = play_until - loop.time() - TWILIO_AUDIO_LEAD
+                            if wait > 0:
+                                await asyncio.sleep(wait)
+                            if chunk_epoch != epoch:
+                                continue
+                            await websocket.send_text(TWILIO_MEDIA_TEMPLATE % (stream_sid_json, chunk))
+                            worker_stats.frames_out += 1
+                            play_until = max(play_until, loop.time()) + len(chunk) * 3 / 4 / 8000
+                        elif chunk_epoch != epoch:
+                            continue
+                        if chunk_item != marked_item:
+                            marked_item, marked_ms = chunk_item, 0
+                        # A chunk of None is the end of the item, always marked
+                        if chunk is None or end_ms - marked_ms >= MARK_INTERVAL_MS:
+                            mark_count += 1
+                            marks[str(mark_count)] = (chunk_item, end_ms)
+                            await websocket.send_text(TWILIO_MARK_TEMPLATE % (stream_sid_json, mark_count))
+                            marked_ms = end_ms
+                except Exception as e:
+                    print(f"Error in pace_to_twilio: {e}")
+                    await handle_disconnect()
+
+            async def interrupt():
+                """The caller started talking over the assistant: drop the audio it has not heard yet."""
+                nonlocal epoch, play_until, received_ms
+                epoch += 1
+                while not outbound.empty():
+                    outbound.get_nowait()
+                if item_id is None or played_ms >= received_ms:
+                    return
+                print(f"Caller interrupted, truncating {item_id} at {played_ms:.0f} of {received_ms:.0f} ms")
+                # Twilio drops the audio it has buffered and sends back its marks, which are not ours anymore
+                marks.clear()
+                play_until = 0.0
+                received_ms = played_ms  # What is left of the item was never heard
+                await websocket.send_text(TWILIO_CLEAR_TEMPLATE % stream_sid_json)
+                await openai_ws.send(json.dumps({"type": "conversation.item.truncate", "item_id": item_id,
+                                                 "content_index": 0, "audio_end_ms": int(played_ms)}))
+
+            pacer = asyncio.create_task(pace_to_twilio())
+            openai_reader = asyncio.create_task(send_to_twilio())
+            try:
+                # The call lasts as long as the Twilio stream, which every error path closes
+                await receive_from_twilio()
+            finally:
+                pacer.cancel()
+                openai_reader.cancel()
 
     except Exception as e:
+        # Also raised when no Realtime session could be set up, before handle_disconnect exists, so the
+        # Twilio stream is closed here
         print(f"WebSocket connection error: {e}")
-        await handle_disconnect()
+        if websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await websocket.close()
+            except Exception as e:
+                print(f"Error during disconnect cleanup: {e}")
+    finally:
+        worker_stats.active_calls -= 1
 
 
 async def send_session_update(openai_ws):
@@ -197,7 +374,8 @@ async def send_session_update(openai_ws):
     session_update = {
         "type": "session.update",
         "session": {
-            "turn_detection": {"type": "server_vad"},
+            "turn_detection": ({"type": "server_vad", "silence_duration_ms": TURN_SILENCE_MS} if LOCAL_VAD
+                               else {"type": "server_vad"}),
             "input_audio_format": "g711_ulaw",
             "output_audio_format": "g711_ulaw",
             "voice": VOICE,
@@ -213,4 +391,12 @@ async def send_session_update(openai_ws):
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
+    from uvicorn.supervisors import Multiprocess
+
+    # Each worker imports the app, and serves until its calls are drained
+    config = uvicorn.Config("main:app", host="0.0.0.0", port=PORT, workers=WORKERS, ws_per_message_deflate=False)
+    server = DrainingServer(config, stats="main:worker_stats", drain_timeout=DRAIN_TIMEOUT)
+    if WORKERS > 1:
+        Multiprocess(config, target=server.run, sockets=[]).run()
+    else:
+        server.run()
\ No newline at end of file
@@ -0,0 +1,135 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+HEALTH_CHECK_INTERVAL = 5  # Seconds between checks of the idle sessions
+
+
+class RealtimePool:
+    """
+    Connected and configured OpenAI Realtime sessions waiting for calls, so a call does not wait for the TLS
+    handshake and the session setup.
+
+    `connect` is a coroutine function returning a new session. A call takes the newest idle session, or sets
+    one up itself when there is none; the pool is then refilled in the background. The pool holds enough
+    sessions for the calls arriving while new sessions are set up: at the call rate of the last `window`
+    seconds, the mean of those arrivals plus two standard deviations (Poisson), between `min_size` and
+    `max_size`. Idle sessions that were closed (the
+    websockets keepalive pings close dead connections) or idle for more than `max_idle` seconds are dropped.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=8, max_idle=120, window=60):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.window = window
+        self.idle = deque()  # (session, connected at), newest on the right
+        self.arrivals = deque()  # When the calls of the last `window` seconds arrived
+        self.setup_seconds = 1.0  # Moving average of the time to set up a session
+        self.connecting = 0
+        self.hits = 0
+        self.misses = 0
+        self._refill = asyncio.Event()
+        self._tasks = set()
+        self._task = None
+        self._started_at = time.monotonic()
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._refill.set()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        while self.idle:
+            await self.idle.pop()[0].close()
+
+    def target(self):
+        """Number of idle sessions to keep."""
+        now = time.monotonic()
+        while self.arrivals and self.arrivals[0] < now - self.window:
+            self.arrivals.popleft()
+        rate = len(self.arrivals) / max(1.0, min(self.window, now - self._started_at))
+        expected = rate * self.setup_seconds
+        return max(self.min_size, min(self.max_size, math.ceil(expected + 2 * math.sqrt(expected))))
+
+    def stats(self):
+        return {'idle': len(self.idle), 'target': self.target(), 'hits': self.hits, 'misses': self.misses,
+                'setup_ms': round(self.setup_seconds * 1000, 1)}
+
+    async def take(self):
+        """A session for a new call, from the pool if one is ready."""
+        now = time.monotonic()
+        self.arrivals.append(now)
+        self._refill.set()
+        while self.idle:
+            session, connected_at = self.idle.pop()
+            if self._healthy(session, connected_at, now):
+                self.hits += 1
+                return session
+            self._close(session)
+        self.misses += 1
+        return await self._connect()
+
+    @asynccontextmanager
+    async def session(self):
+        """Take a session for the duration of a call, closed afterwards."""
+        session = await self.take()
+        try:
+            yield session
+        finally:
+            await session.close()
+
+    def _healthy(self, session, connected_at, now):
+        return session.open and now - connected_at < self.max_idle
+
+    def _close(self, session):
+        self._spawn(session.close())
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)  # Keep a reference until it is done
+        task.add_done_callback(self._tasks.discard)
+
+    async def _connect(self):
+        start = time.monotonic()
+        session = await self.connect()
+        self.setup_seconds = 0.8 * self.setup_seconds + 0.2 * (time.monotonic() - start)
+        return session
+
+    async def _add(self):
+        self.connecting += 1
+        try:
+            session = await self._connect()
+        except Exception as e:
+            # Tried again at the next health check
+            print(f"Could not set up a Realtime session for the pool: {e}")
+            return
+        finally:
+            self.connecting -= 1
+        self.idle.append((session, time.monotonic()))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._refill.wait(), HEALTH_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._refill.clear()
+            now = time.monotonic()
+            healthy = deque()
+            for session, connected_at in self.idle:
+                if self._healthy(session, connected_at, now):
+                    healthy.append((session, connected_at))
+                else:
+                    self._close(session)
+            self.idle = healthy
+            target = self.target()
+            while len(self.idle) > target:
+                self._close(self.idle.popleft()[0])  # The oldest first
+            for _ in range(target - len(self.idle) - self.connecting):
+                self._spawn(self._add())
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from collections import deque
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+
+class WorkerStats:
+    """
+    Calls and audio frames of this worker process, and its admission state.
+
+    Every `interval` seconds the worker writes a snapshot to `directory`, one file per worker, so that /metrics,
+    whichever worker serves it, can report all of them. `extra` returns more fields for the snapshot.
+    """
+
+    def __init__(self, max_calls, directory, interval=1.0, window=10, extra=None):
+        self.max_calls = max_calls
+        self.directory = directory
+        self.interval = interval
+        self.extra = extra
+        self.active_calls = 0
+        self.draining = False
+        self.accepting = True  # Whether the worker accepts connections
+        self.frames_in = 0  # Media frames from Twilio
+        self.frames_out = 0  # Media messages to Twilio
+        self._samples = deque(maxlen=int(window / interval) + 1)  # (time, frames in, frames out)
+        self._task = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"worker-{os.getpid()}.json")
+
+    def full(self):
+        """Whether this worker takes no more calls."""
+        return self.draining or self.active_calls >= self.max_calls
+
+    def frames_per_second(self):
+        if len(self._samples) < 2:
+            return {'in': 0.0, 'out': 0.0}
+        (start, frames_in, frames_out), (end, last_in, last_out) = self._samples[0], self._samples[-1]
+        return {'in': round((last_in - frames_in) / (end - start), 1),
+                'out': round((last_out - frames_out) / (end - start), 1)}
+
+    def snapshot(self):
+        snapshot = {'pid': os.getpid(), 'active_calls': self.active_calls, 'max_calls': self.max_calls,
+                    'draining': self.draining, 'accepting': self.accepting,
+                    'frames_per_second': self.frames_per_second()}
+        if self.extra:
+            snapshot.update(self.extra())
+        return snapshot
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _run(self):
+        while True:
+            self._samples.append((time.monotonic(), self.frames_in, self.frames_out))
+            self.publish()
+            await asyncio.sleep(self.interval)
+
+    def publish(self):
+        """Write this worker's snapshot for the others."""
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(dict(self.snapshot(), updated_at=time.time()), f)
+        os.replace(temporary, self.path)
+
+    def workers(self):
+        """Snapshots of the running workers, this one up to date."""
+        snapshots = {os.getpid(): self.snapshot()}
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            # Workers that stopped writing are gone
+            if time.time() - snapshot.pop('updated_at') < 3 * self.interval and snapshot['pid'] != os.getpid():
+                snapshots.setdefault(snapshot['pid'], snapshot)
+        return sorted(snapshots.values(), key=lambda snapshot: snapshot['pid'])
+
+    def others_accepting(self):
+        """Whether another worker has room for calls and accepts connections."""
+        return any(worker['accepting'] and not worker['draining'] and worker['active_calls'] < worker['max_calls']
+                   for worker in self.workers() if worker['pid'] != os.getpid())
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    A uvicorn server that drains on SIGTERM or SIGINT instead of cutting live calls: it stops accepting
+    connections, lets the active calls end, up to `drain_timeout` seconds, and then shuts down. A second signal
+    shuts it down at once. With several workers, uvicorn sends each one SIGTERM when it is stopped, and on
+    SIGHUP restarts them one by one, so the others keep taking calls meanwhile.
+
+    Several workers each listen on their own socket, with SO_REUSEPORT, so the kernel spreads new connections
+    evenly over them. On a single shared socket, the same worker tends to accept most of them. A worker at its
+    maximum of calls closes its socket while another worker has room, so calls go to the workers that can take
+    them; the last one keeps listening, to answer that everybody is busy.
+
+    `stats` is the import string of the app's WorkerStats, like the app's, since each worker imports the app.
+    """
+
+    def __init__(self, config, stats, drain_timeout=900):
+        super().__init__(config)
+        self.stats_name = stats
+        self.drain_timeout = drain_timeout
+        self.drain_deadline = None
+
+    @property
+    def stats(self):
+        return import_from_string(self.stats_name)
+
+    def run(self, sockets=None):
+        if self.config.workers > 1 and not sockets:
+            sockets = [self._reuse_port_socket()]
+        return super().run(sockets)
+
+    def _reuse_port_socket(self):
+        sock = socket.socket(socket.AF_INET6 if ":" in self.config.host else socket.AF_INET)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.config.host, self.config.port))
+        return sock
+
+    def _stop_accepting(self):
+        for server in self.servers:
+            server.close()
+        self.servers = []
+        self.stats.accepting = False
+        self.stats.publish()
+
+    async def _start_accepting(self):
+        config = self.config
+
+        def create_protocol(_loop=None):
+            # As in uvicorn.Server.startup
+            return config.http_protocol_class(config=config, server_state=self.server_state,
+                                              app_state=self.lifespan.state, _loop=_loop)
+
+        server = await asyncio.get_running_loop().create_server(
+            create_protocol, sock=self._reuse_port_socket(), ssl=config.ssl, backlog=config.backlog)
+        self.servers.append(server)
+        self.stats.accepting = True
+        self.stats.publish()
+
+    def handle_exit(self, sig, frame):
+        if self.stats.draining or not self.stats.active_calls:
+            super().handle_exit(sig, frame)
+            return
+        # Called between two steps of the event loop, the listening sockets are closed at the next tick
+        self.stats.draining = True
+        self.drain_deadline = time.monotonic() + self.drain_timeout
+        print(f"Draining: waiting for {self.stats.active_calls} active calls to end")
+
+    async def on_tick(self, counter):
+        stats = self.stats
+        if self.drain_deadline is not None:
+            if stats.accepting:
+                self._stop_accepting()
+            if not stats.active_calls or time.monotonic() > self.drain_deadline:
+                self.should_exit = True
+        elif self.config.workers > 1 and not self.should_exit:
+            if stats.accepting and stats.full() and stats.others_accepting():
+                self._stop_accepting()
+            elif not stats.accepting and (not stats.full() or not stats.others_accepting()):
+                await self._start_accepting()
+        return await super().on_tick(counter)
@@ -1,18 +1,72 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
 import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+import time
 import openai
 from werkzeug.utils import secure_filename
-import json
+from poster_store import PosterStore
+from image_mirror import ImageMirror
+from poster_jobs import PosterJobs, QueueFull
+from poster_cache import PosterCache, poster_key
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads/'
-app.config['POSTERS_JSON'] = 'posters.json'
+app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024  # Largest recording Whisper accepts, bigger uploads get a 413
+app.config['SPOOL_MAX_SIZE'] = 1024 * 1024  # Recordings up to this size stay in memory, larger ones go to a temp file
+app.config['AUDIO_CHUNK_SECONDS'] = 0  # When set, longer recordings are split and the pieces transcribed in parallel
+app.config['AUDIO_CHUNK_WORKERS'] = 4
+app.config['POSTERS_JSON'] = 'posters.json'  # Only read once, to import the posters saved before posters.db
+app.config['POSTERS_DB'] = 'posters.db'
+app.config['PAGE_SIZE'] = 20
+app.config['MAX_PAGE_SIZE'] = 100
+app.config['IMAGES_FOLDER'] = os.path.join(app.root_path, 'public', 'images')  # Local copies of the generated images
+app.config['IMAGE_URL_LIFETIME'] = 2 * 3600  # Seconds before OpenAI's image URLs expire
+app.config['IMAGE_MAX_AGE'] = 365 * 24 * 3600  # Seconds browsers may cache an image, their names never change
+app.config['MIRROR_WORKERS'] = 2
+app.config['TRANSCRIPTION_WORKERS'] = 2  # Recordings transcribed at the same time
+app.config['IMAGE_WORKERS'] = 6  # Posters drawn at the same time, drawing takes much longer than transcribing
+app.config['MAX_PENDING_JOBS'] = 64  # Unfinished uploads, further ones are refused until some finish
+app.config['STAGE_RETRIES'] = 3  # Attempts per stage when OpenAI is unreachable, rate limited or failing
+app.config['RETRY_BACKOFF'] = 2  # Seconds before the second attempt, doubled for each following one
+app.config['IMAGE_MODEL'] = 'dall-e-3'
+app.config['IMAGE_SIZE'] = '1024x1024'
+app.config['POSTER_CACHE_TTL'] = 7 * 24 * 3600  # Seconds a song reuses its poster, send regenerate=1 for a new one
+app.config['POSTER_CACHE_SIZE'] = 10000
+
+
+class AudioUploadRequest(Request):
+    """Receive uploaded files in a buffer that is only written to disk above SPOOL_MAX_SIZE."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['SPOOL_MAX_SIZE'])
+
 
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+app.request_class = AudioUploadRequest
+
+if app.config['AUDIO_CHUNK_SECONDS'] and not shutil.which('ffmpeg'):
+    print('ffmpeg is not installed, recordings will be transcribed in one piece')
+    app.config['AUDIO_CHUNK_SECONDS'] = 0
+chunk_pool = ThreadPoolExecutor(max_workers=app.config['AUDIO_CHUNK_WORKERS'], thread_name_prefix='audio-chunk')
 
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+poster_store = PosterStore(app.config['POSTERS_DB'])
+imported = poster_store.migrate_json(app.config['POSTERS_JSON'])
+if imported:
+    print(f"Imported {imported} posters from {app.config['POSTERS_JSON']}")
+
+poster_cache = PosterCache(ttl=app.config['POSTER_CACHE_TTL'], max_size=app.config['POSTER_CACHE_SIZE'])
+
+image_mirror = ImageMirror(poster_store, app.config['IMAGES_FOLDER'], '/images',
+                           workers=app.config['MIRROR_WORKERS'])
+# Posters saved just before a restart still have a valid image URL
+image_mirror.resume(app.config['IMAGE_URL_LIFETIME'])
+
 
 def generate_poster_prompt(song_title):
     """
@@ -35,19 +89,127 @@ def generate_poster_prompt(song_title):
 
 
 def save_poster_data(title, image_url):
-    # Load existing data
-    if os.path.exists(app.config['POSTERS_JSON']):
-        with open(app.config['POSTERS_JSON'], 'r') as f:
-            posters_data = json.load(f)
-    else:
-        posters_data = []
+    return poster_store.add(title, image_url)
+
+
+def recording(audio):
+    """
+    The spooled upload as it should be sent to the API. The client sizes a file object with fileno(), which
+    moves a SpooledTemporaryFile to disk, so a recording still in memory is sent as its bytes instead.
+    """
+    if isinstance(audio, tempfile.SpooledTemporaryFile) and not audio._rolled:
+        return audio._file.getvalue()
+    return audio
+
+
+def transcribe(filename, audio):
+    # A file object is streamed in the request rather than read into memory
+    transcription = openai.audio.transcriptions.create(
+        model="whisper-1",
+        file=(filename, audio)
+    )
+    return transcription.text
+
+
+def split_audio(audio, seconds, directory):
+    """
+    Cut a recording into pieces of `seconds` with ffmpeg, converted to 16 kHz mono Opus, which is all Whisper
+    needs and much smaller than the browser's recording. Returns the paths of the pieces in order.
+    """
+    command = ['ffmpeg', '-loglevel', 'error', '-i', 'pipe:0', '-vn', '-ac', '1', '-ar', '16000',
+               '-c:a', 'libopus', '-b:a', '24k', '-f', 'segment', '-segment_time', str(seconds),
+               os.path.join(directory, 'chunk%03d.ogg')]
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as ffmpeg:
+        # Fed in blocks, so a recording spooled to disk is not read into memory
+        try:
+            shutil.copyfileobj(audio, ffmpeg.stdin)
+        except BrokenPipeError:
+            pass  # ffmpeg stopped reading, its exit status tells why
+        finally:
+            ffmpeg.stdin.close()
+    if ffmpeg.returncode:
+        raise subprocess.CalledProcessError(ffmpeg.returncode, command)
+    return sorted(pathlib.Path(directory).iterdir())
+
+
+def transcribe_audio(job):
+    # The upload stays in memory or in its temporary file and is read from the start, again on a retry
+    audio = job['_audio']
 
-    # Add new poster entry
-    posters_data.append({"title": title, "image_url": image_url})
+    if app.config['AUDIO_CHUNK_SECONDS']:
+        with tempfile.TemporaryDirectory() as directory:
+            audio.seek(0)
+            chunks = split_audio(audio, app.config['AUDIO_CHUNK_SECONDS'], directory)
+            if len(chunks) > 1:
+                texts = chunk_pool.map(lambda path: transcribe(path.name, path), chunks)
+                text = ' '.join(text.strip() for text in texts)
+                print(f'Transcribed text ({len(chunks)} pieces):', text)
+                return {'transcript': text}
 
-    # Save updated data
-    with open(app.config['POSTERS_JSON'], 'w') as f:
-        json.dump(posters_data, f, ensure_ascii=False, indent=4)
+    audio.seek(0)
+    text = transcribe(job['_audio_name'], recording(audio))
+    print('Transcribed text:', text)
+    return {'transcript': text}
+
+
+def draw_poster(transcript):
+    # Generate the enhanced prompt for the poster
+    poster_prompt = generate_poster_prompt(transcript)
+
+    response = openai.images.generate(
+        prompt=poster_prompt,
+        n=1,
+        size=app.config['IMAGE_SIZE'],
+        model=app.config['IMAGE_MODEL'],
+        response_format='url',
+    )
+
+    image_url = response.data[0].url
+    print('Generated image URL:', image_url)
+    poster_id = save_poster_data(transcript, image_url)
+    # OpenAI's URL expires after a while, so keep a copy. The browser can show this URL meanwhile.
+    image_mirror.submit(poster_id, image_url)
+    return poster_id
+
+
+def generate_poster(job):
+    """Reuse the poster of the same song when there is one, otherwise draw it."""
+    key = poster_key(job['transcript'], model=app.config['IMAGE_MODEL'], size=app.config['IMAGE_SIZE'])
+    regenerate = job.get('regenerate', False)
+    while True:
+        poster_id, outcome = poster_cache.get_or_generate(key, lambda: draw_poster(job['transcript']), regenerate)
+        poster = poster_store.get(poster_id)
+        # A cached poster whose image could not be mirrored is useless once OpenAI's URL has expired
+        if poster and (poster['mirrored'] or time.time() - poster['created_at'] < app.config['IMAGE_URL_LIFETIME']):
+            break
+        regenerate = True
+
+    return {'imageUrl': poster['image_url'], 'posterId': poster_id, 'cached': outcome in ('hit', 'coalesced')}
+
+
+def is_transient(error):
+    """Errors worth retrying a stage for. Others, like a prompt refused by the safety system, would fail again."""
+    return isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+
+def close_audio(job):
+    # Also removes the temporary file of a large upload
+    job['_audio'].close()
+
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+poster_jobs = PosterJobs(
+    [('transcribing', transcribe_audio, app.config['TRANSCRIPTION_WORKERS']),
+     ('generating', generate_poster, app.config['IMAGE_WORKERS'])],
+    max_pending=app.config['MAX_PENDING_JOBS'],
+    retries=app.config['STAGE_RETRIES'],
+    backoff=app.config['RETRY_BACKOFF'],
+    should_retry=is_transient,
+    on_finish=close_audio,
+)
 
 
 @app.route('/')
@@ -64,48 +226,85 @@ def upload_audio():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    if file:
-        filename = secure_filename(file.filename)
-        audio_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(audio_path)
+    # The stages run after this request has returned, so take the spooled upload away from the request,
+    # which closes its files when it ends
+    audio = file.stream
+    file.stream = io.BytesIO()
+
+    try:
+        regenerate = request.form.get('regenerate', '').lower() in ('1', 'true', 'yes')
+        job_id = poster_jobs.submit({'_audio': audio, '_audio_name': secure_filename(file.filename) or 'audio.webm',
+                                     'regenerate': regenerate})
+    except QueueFull as e:
+        audio.close()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '10'}
+
+    return jsonify({'jobId': job_id, 'statusUrl': f'/jobs/{job_id}', 'eventsUrl': f'/jobs/{job_id}/events'}), 202
+
+
+@app.errorhandler(413)
+def audio_too_large(e):
+    limit = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'error': f"Recording too large, the limit is {limit} MB"}), 413
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = poster_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
 
-        try:
-            with open(audio_path, 'rb') as audio_file:
-                transcription = openai.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
 
-            transcript_text = transcription.text
-            print('Transcribed text:', transcript_text)
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Send the job as server-sent events each time it changes, until it is completed or failed."""
+    if poster_jobs.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
 
-            # Generate the enhanced prompt for the poster
-            poster_prompt = generate_poster_prompt(transcript_text)
+    def generate():
+        version = -1
+        while True:
+            job = poster_jobs.wait(job_id, version)
+            if job is None:
+                yield sse_event({'error': 'Unknown job'})
+                return
+            if job['version'] == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = job['version']
+            yield sse_event(job)
+            if job['status'] in ('completed', 'failed'):
+                return
 
-            response = openai.images.generate(
-                prompt=poster_prompt,
-                n=1,
-                size='1024x1024',
-                model='dall-e-3',
-                response_format='url',
-            )
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-            image_url = response.data[0].url
-            print('Generated image URL:', image_url)
-            # Save metadata to JSON
-            save_poster_data(transcript_text, image_url)
 
-            os.remove(audio_path)
+@app.route('/posters')
+def list_posters():
+    """List the saved posters newest first, optionally only those whose title starts with ?q=."""
+    try:
+        limit = min(int(request.args.get('limit', app.config['PAGE_SIZE'])), app.config['MAX_PAGE_SIZE'])
+        posters, next_cursor = poster_store.list(limit=max(limit, 1), cursor=request.args.get('cursor'),
+                                                 title_prefix=request.args.get('q'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    return jsonify({'posters': posters, 'nextCursor': next_cursor})
 
-            return jsonify({'imageUrl': image_url})
 
-        except Exception as e:
-            print('Error processing audio or generating image:', e)
-            return jsonify({'error': 'Failed to process audio or generate image.'}), 500
+@app.route('/metrics')
+def metrics():
+    return jsonify({'poster_cache': poster_cache.stats()})
 
 
 @app.route('/<path:filename>')
 def serve_static(filename):
+    if filename.startswith('images/'):
+        # Mirrored images are named after their content, so they can be cached for good
+        response = send_from_directory('public', filename, max_age=app.config['IMAGE_MAX_AGE'])
+        response.cache_control.immutable = True
+        return response
     return send_from_directory('public', filename)
 
 
@@ -0,0 +1,110 @@
+"""
+Check and measure the poster cache against the local mock OpenAI API.
+
+First --uploads identical recordings are uploaded at the same time, which must make exactly one image
+generation. Then a stream of uploads where a few popular songs come back often is run with and without the
+cache, and the image calls and poster times are compared:
+
+    python bench_cache.py --uploads 20 --songs 200 --image-latency 2
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mock_openai
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+TITLES = ["We don't talk anymore", "Shape of you", "Someone like you", "Blinding lights", "Bad guy", "Hello",
+          "Rolling in the deep", "Perfect", "Thinking out loud", "Let it go", "Yellow", "Halo"]
+
+
+def upload(app, transcript, regenerate=False):
+    """Upload a recording of `transcript` and wait for its poster. Returns the completed job."""
+    client = app.app.test_client()
+    data = {'file': (io.BytesIO(transcript.encode()), 'audio.webm')}
+    if regenerate:
+        data['regenerate'] = '1'
+    response = client.post('/upload-audio', data=data)
+    assert response.status_code == 202, response.json
+    client.get(response.json['eventsUrl']).get_data()  # The stream ends once the job is completed or failed
+    job = client.get(response.json['statusUrl']).json
+    assert job['status'] == 'completed', job
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=20, help="Identical uploads sent at the same time")
+    parser.add_argument("--songs", type=int, default=200, help="Uploads of the mixed workload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--image-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    server, base_url = mock_openai.start_in_background(transcription_latency=0.05, image_latency=args.image_latency)
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="test")
+    state = server.RequestHandlerClass.state
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The app keeps its database in the working directory
+        os.chdir(tmp_dir)
+        sys.path.insert(0, PROJECT_DIR)
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+            app.image_mirror = app.ImageMirror(app.poster_store, os.path.join(tmp_dir, 'images'), '/images')
+            app.poster_jobs = app.PosterJobs(
+                [('transcribing', app.transcribe_audio, args.concurrency),
+                 ('generating', app.generate_poster, args.concurrency)],
+                max_pending=max(args.uploads, args.songs), should_retry=app.is_transient, on_finish=app.close_audio,
+            )
+
+            with ThreadPoolExecutor(max_workers=args.uploads) as pool:
+                jobs = list(pool.map(lambda n: upload(app, "We don't talk anymore."), range(args.uploads)))
+            identical_calls = state.calls.get('image', 0)
+            identical_stats = app.poster_cache.stats()
+            regenerated = upload(app, "we don't talk anymore", regenerate=True)
+
+        print(f"{args.uploads} identical uploads at once: {identical_calls} image generation, "
+              f"{len({job['posterId'] for job in jobs})} poster, cache {identical_stats}")
+        assert identical_calls == 1, identical_calls
+        assert regenerated['posterId'] != jobs[0]['posterId'] and state.calls['image'] == 2
+        print(f"regenerate=1: a new image generation, poster {regenerated['posterId']}")
+
+        # A few songs are much more popular than the others
+        random.seed(0)
+        songs = random.choices(TITLES + [f"Unknown song {n}" for n in range(args.songs // 2)],
+                               weights=[50 // (rank + 1) for rank in range(len(TITLES))] + [1] * (args.songs // 2),
+                               k=args.songs)
+        print(f"\n{args.songs} uploads of {len(set(songs))} different songs, {args.concurrency} at a time, "
+              f"{args.image_latency * 1000:.0f} ms per image")
+        print("cache      image calls   poster p50   poster mean")
+        for enabled in (False, True):
+            app.poster_cache = app.PosterCache()
+
+            def timed_upload(song):
+                start = time.perf_counter()
+                # Without the cache, every upload asks for a new poster like before
+                upload(app, song, regenerate=not enabled)
+                return time.perf_counter() - start
+
+            calls_before = state.calls['image']
+            with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                durations = list(pool.map(timed_upload, songs))
+            print(f"{'on' if enabled else 'off':<9}  {state.calls['image'] - calls_before:>11}  "
+                  f"{statistics.median(durations):8.2f} s  {statistics.mean(durations):9.2f} s")
+        print(f"cache {app.poster_cache.stats()}")
+
+        app.image_mirror.pool.shutdown(wait=True)
+        os.chdir(PROJECT_DIR)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Throughput of POST /upload-audio against the local mock OpenAI API, with several sizes of stage pools.
+
+Every run uploads --uploads recordings at once and waits until all posters are done. The first row runs both
+stages inside the upload request, like /upload-audio did before it returned a job, on --threads server threads:
+
+    python bench_jobs.py --uploads 64 --transcription-latency 0.5 --image-latency 2 --error-rate 0.1
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mock_openai
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))]
+
+
+def run_blocking(app, uploads, threads):
+    """Both stages in the request thread. Returns (seconds, request durations, end-to-end durations)."""
+    def upload(n):
+        start = time.perf_counter()
+        job = {'_audio': io.BytesIO(f"Song number {n}".encode()), '_audio_name': 'audio.webm'}
+        job.update(app.transcribe_audio(job))
+        job.update(app.generate_poster(job))
+        app.close_audio(job)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        durations = list(pool.map(upload, range(uploads)))
+    return time.perf_counter() - start, durations, durations
+
+
+def run_jobs(app, uploads, transcription_workers, image_workers, retries, backoff):
+    """Through the job pipeline. Returns (seconds, request durations, end-to-end durations)."""
+    app.poster_jobs = app.PosterJobs(
+        [('transcribing', app.transcribe_audio, transcription_workers),
+         ('generating', app.generate_poster, image_workers)],
+        max_pending=uploads, retries=retries, backoff=backoff, should_retry=app.is_transient,
+        on_finish=app.close_audio,
+    )
+    accepted, finished = [], []
+    lock = threading.Lock()
+
+    def upload(n):
+        client = app.app.test_client()
+        start = time.perf_counter()
+        audio = io.BytesIO(f"Song number {n}".encode())
+        response = client.post('/upload-audio', data={'file': (audio, 'audio.webm')})
+        assert response.status_code == 202, response.json
+        with lock:
+            accepted.append(time.perf_counter() - start)
+        # Follow the job like the browser does, until its last event
+        events = client.get(response.json['eventsUrl'])
+        assert b'"status": "completed"' in events.data, events.data
+        with lock:
+            finished.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=uploads) as pool:
+        list(pool.map(upload, range(uploads)))
+    return time.perf_counter() - start, accepted, finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=8, help="Server threads for the in-request baseline")
+    parser.add_argument("--pools", nargs="+", default=["2:6", "4:4", "2:14", "4:28"],
+                        help="transcription:image workers of each pipeline run")
+    parser.add_argument("--transcription-latency", type=float, default=0.5)
+    parser.add_argument("--image-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server, base_url = mock_openai.start_in_background(transcription_latency=args.transcription_latency,
+                                                       image_latency=args.image_latency, error_rate=args.error_rate)
+    os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="test")
+    state = server.RequestHandlerClass.state
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The app keeps its database in the working directory
+        os.chdir(tmp_dir)
+        sys.path.insert(0, PROJECT_DIR)
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+        app.image_mirror = app.ImageMirror(app.poster_store, os.path.join(tmp_dir, 'images'), '/images')
+        # Leave the retries to the stages, so a failed call does not repeat the stages before it
+        app.openai.max_retries = 0
+
+        print(f"Mock API: {args.transcription_latency * 1000:.0f} ms per transcription, "
+              f"{args.image_latency * 1000:.0f} ms per image, {args.error_rate:.0%} of calls fail with 503")
+        print("mode                      posters/s   request p50   poster p50   poster p99   "
+              "transcriptions   images   failed calls")
+        runs = [("in request", f"{args.threads} threads", None)]
+        runs += [("jobs", f"{pool} workers", pool) for pool in args.pools]
+        for mode, label, pool in runs:
+            calls_before = dict(state.calls)
+            errors_before = state.errors
+            app.poster_cache = app.PosterCache()  # Every run draws all of its posters
+            with contextlib.redirect_stdout(io.StringIO()):
+                if pool is None:
+                    app.openai.max_retries = 2  # The OpenAI client's own retries were all it had
+                    seconds, requests, posters = run_blocking(app, args.uploads, args.threads)
+                    app.openai.max_retries = 0
+                else:
+                    transcription_workers, image_workers = (int(n) for n in pool.split(':'))
+                    seconds, requests, posters = run_jobs(app, args.uploads, transcription_workers, image_workers,
+                                                          retries=5, backoff=0.05)
+            calls = {name: count - calls_before.get(name, 0) for name, count in state.calls.items()}
+            print(f"{mode + ', ' + label:<24}  {args.uploads / seconds:9.2f}  "
+                  f"{statistics.median(requests) * 1000:9.0f} ms  {statistics.median(posters):8.2f} s  "
+                  f"{percentile(posters, 99):8.2f} s  {calls.get('transcription', 0):>14}  {calls.get('image', 0):>7}  "
+                  f"{state.errors - errors_before:>13}")
+        app.image_mirror.pool.shutdown(wait=True)
+        os.chdir(PROJECT_DIR)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
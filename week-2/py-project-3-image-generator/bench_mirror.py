@@ -0,0 +1,138 @@
+"""
+Measure the image mirror against a local stub blob store that serves 1024x1024 PNGs with some latency.
+
+It times what mirroring adds to the request thread, how long an image takes to be mirrored, the size of the
+thumbnails, and a gallery page loaded from the blob store versus from the local thumbnails:
+
+    python bench_mirror.py --posters 20 --latency 0.3
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from flask import Flask, send_from_directory
+from PIL import Image
+
+from image_mirror import ImageMirror
+from poster_store import PosterStore
+
+
+def make_png(seed):
+    """A noisy 1024x1024 PNG, about as large as a generated poster."""
+    random.seed(seed)
+    image = Image.effect_noise((1024, 1024), 40).convert('RGB')
+    image = Image.blend(image, Image.new('RGB', image.size, tuple(random.choices(range(256), k=3))), 0.5)
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+def start_blob_store(images, latency):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            data = images[int(self.path.strip('/').split('.')[0]) % len(images)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posters", type=int, default=20, help="Posters generated, and shown on a gallery page")
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds the blob store takes per image")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    images = [make_png(n) for n in range(args.posters)]
+    server, base_url = start_blob_store(images, args.latency)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = PosterStore(os.path.join(tmp_dir, 'posters.db'))
+        images_dir = os.path.join(tmp_dir, 'public', 'images')
+        mirror = ImageMirror(store, images_dir, '/images', workers=args.workers)
+
+        # What upload_audio() pays: save the poster and hand the URL to the mirror
+        submit_times, futures = [], []
+        start = time.perf_counter()
+        for n in range(args.posters):
+            begin = time.perf_counter()
+            poster_id = store.add(f"Song {n}", f"{base_url}/{n}.png")
+            futures.append((poster_id, time.perf_counter(), mirror.submit(poster_id, f"{base_url}/{n}.png")))
+            submit_times.append(time.perf_counter() - begin)
+        mirror_times = []
+        for poster_id, submitted, future in futures:
+            assert future.result()
+            mirror_times.append(time.perf_counter() - submitted)
+        elapsed = time.perf_counter() - start
+
+        print(f"Blob store: {args.latency * 1000:.0f} ms per image, mirror workers: {args.workers}")
+        print(f"  save + submit on the request thread   p50 {statistics.median(submit_times) * 1000:8.3f} ms")
+        print(f"  mirrored (download + thumbnail)        p50 {statistics.median(mirror_times) * 1000:8.0f} ms   "
+              f"all {args.posters} in {elapsed:.1f} s")
+
+        posters, _ = store.list(limit=args.posters)
+        original = sum(len(image) for image in images) / len(images)
+        thumbnails = [os.path.getsize(os.path.join(images_dir, os.path.basename(p['thumbnail_url']))) for p in posters]
+        print(f"  original PNG                           {original / 1024:8.0f} KiB")
+        print(f"  thumbnail JPEG                         {statistics.mean(thumbnails) / 1024:8.0f} KiB   "
+              f"{original / statistics.mean(thumbnails):.0f}x smaller")
+
+        # A gallery page: the browser fetches every image, 6 at a time like over HTTP/1.1
+        app = Flask(__name__, root_path=tmp_dir)
+
+        @app.route('/<path:filename>')
+        def serve_static(filename):
+            response = send_from_directory('public', filename, max_age=365 * 24 * 3600)
+            response.cache_control.immutable = True
+            return response
+
+        def load_page(fetch, urls):
+            begin = time.perf_counter()
+            for n in range(0, len(urls), 6):
+                threads = [threading.Thread(target=fetch, args=(url,)) for url in urls[n:n + 6]]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            return time.perf_counter() - begin
+
+        with httpx.Client() as client:
+            blob_urls = [f"{base_url}/{n}.png" for n in range(args.posters)]
+            print(f"  gallery page from the blob store       {load_page(client.get, blob_urls) * 1000:8.0f} ms")
+
+        local = threading.local()
+
+        def fetch_local(url):
+            if not hasattr(local, 'client'):
+                local.client = app.test_client()
+            response = local.client.get(url)
+            assert response.status_code == 200
+            local.cache_control = response.headers['Cache-Control']
+
+        print(f"  gallery page from local thumbnails     "
+              f"{load_page(fetch_local, [p['thumbnail_url'] for p in posters]) * 1000:8.0f} ms")
+        print(f"  Cache-Control of mirrored images       {app.test_client().get(posters[0]['image_url']).headers['Cache-Control']}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
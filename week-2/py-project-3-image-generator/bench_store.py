@@ -0,0 +1,120 @@
+"""
+Compare the old posters.json read-modify-write with the SQLite poster store, at several gallery sizes.
+
+For each size, the gallery is filled with generated posters, then single saves, concurrent saves, page
+listing and title search are timed:
+
+    python bench_store.py --sizes 10000 1000000 --writes 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from poster_store import PosterStore
+
+WORDS = ["love", "night", "river", "heart", "summer", "fire", "dance", "rain", "home", "light", "dream", "road"]
+
+
+def random_title():
+    return " ".join(random.choices(WORDS, k=random.randint(2, 5))).capitalize()
+
+
+def random_url():
+    return f"https://images.example.com/posters/img-{random.getrandbits(64):016x}.png"
+
+
+def save_to_json(path, title, image_url):
+    """The previous save_poster_data(): load the whole file, append, write everything back."""
+    with open(path, 'r') as f:
+        posters_data = json.load(f)
+    posters_data.append({"title": title, "image_url": image_url})
+    with open(path, 'w') as f:
+        json.dump(posters_data, f, ensure_ascii=False, indent=4)
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name, times):
+    print(f"  {name:<34} {len(times) / sum(times):10.0f}/s   p50 {statistics.median(times) * 1000:8.3f} ms   "
+          f"max {max(times) * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--json-max-size", type=int, default=100000,
+                        help="Largest gallery to time posters.json at, it rewrites the whole file on every save")
+    args = parser.parse_args()
+    random.seed(0)
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            print(f"Gallery of {size} posters")
+            start = time.time() - size
+            rows = [(random_title(), random_url(), start + n) for n in range(size)]
+
+            if size <= args.json_max_size:
+                json_path = os.path.join(tmp_dir, "posters.json")
+                with open(json_path, 'w') as f:
+                    json.dump([{"title": t, "image_url": u} for t, u, _ in rows], f, ensure_ascii=False, indent=4)
+                report("posters.json save", timed(lambda: save_to_json(json_path, random_title(), random_url()),
+                                                   max(3, min(args.writes, 1_000_000 // size))))
+            else:
+                print(f"  {'posters.json save':<34} skipped, above --json-max-size")
+
+            store = PosterStore(os.path.join(tmp_dir, "posters.db"))
+            fill_start = time.perf_counter()
+            for n in range(0, size, 100_000):
+                store.add_many(rows[n:n + 100_000])
+            print(f"  {'SQLite fill':<34} {time.perf_counter() - fill_start:10.1f} s")
+
+            report("SQLite save", timed(lambda: store.add(random_title(), random_url()), args.writes))
+
+            times = []
+            lock = threading.Lock()
+
+            def writer():
+                for _ in range(args.writes // args.threads):
+                    begin = time.perf_counter()
+                    store.add(random_title(), random_url())
+                    with lock:
+                        times.append(time.perf_counter() - begin)
+
+            threads = [threading.Thread(target=writer) for _ in range(args.threads)]
+            begin = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - begin
+            print(f"  {f'SQLite save, {args.threads} threads':<34} {len(times) / elapsed:10.0f}/s   "
+                  f"p50 {statistics.median(times) * 1000:8.3f} ms   max {max(times) * 1000:8.3f} ms")
+
+            report("SQLite first page", timed(lambda: store.list(limit=20), 200))
+            cursors = []
+            cursor = None
+            for _ in range(50):
+                _, cursor = store.list(limit=20, cursor=cursor)
+                cursors.append(cursor)
+            report("SQLite page 50", timed(lambda: store.list(limit=20, cursor=cursors[-1]), 200))
+            report("SQLite title search", timed(lambda: store.list(limit=20, title_prefix=random_title()), 200))
+            report("SQLite title search, one word", timed(lambda: store.list(limit=20, title_prefix="Love"), 50))
+            assert store.count() == size + args.writes + len(times)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Compare the disk I/O and latency of receiving a recording and transcribing it, before and after uploads were
+spooled in memory, at several recording sizes.
+
+"before" is the previous /upload-audio: Werkzeug buffers the upload (in a temporary file above 500 KB), it is
+saved to uploads/, opened again for the transcription and removed. "after" is the job's transcription stage,
+reading the spooled upload once. The mock transcription endpoint runs in another process, so the file I/O
+counters only count this process, the upload to the API is the same in both:
+
+    python bench_upload.py --sizes 256 4096 20480 --repeat 20
+"""
+import argparse
+import io
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from flask import Flask, jsonify, request
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+from werkzeug.utils import secure_filename
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def io_counters():
+    """Bytes this process passed to read() and write() calls so far. Sockets are written with send()."""
+    with open('/proc/self/io') as f:
+        counters = dict(line.split(': ') for line in f.read().splitlines())
+    return int(counters['rchar']), int(counters['wchar'])
+
+
+def before_app(openai, upload_folder):
+    app = Flask(__name__)
+
+    @app.route('/upload-audio', methods=['POST'])
+    def upload_audio():
+        file = request.files['file']
+        audio_path = os.path.join(upload_folder, secure_filename(file.filename))
+        file.save(audio_path)
+        with open(audio_path, 'rb') as audio_file:
+            transcription = openai.audio.transcriptions.create(model="whisper-1", file=audio_file)
+        os.remove(audio_path)
+        return jsonify({'transcript': transcription.text})
+
+    return app
+
+
+def after_app(app_module):
+    app = Flask(__name__)
+    app.request_class = app_module.AudioUploadRequest
+
+    @app.route('/upload-audio', methods=['POST'])
+    def upload_audio():
+        file = request.files['file']
+        job = {'_audio': file.stream, '_audio_name': secure_filename(file.filename)}
+        file.stream = io.BytesIO()
+        try:
+            return jsonify(app_module.transcribe_audio(job))
+        finally:
+            app_module.close_audio(job)
+
+    return app
+
+
+def measure(app, audio, repeat):
+    client = app.test_client()
+    # Encode the request in memory once, so the test client does not add its own temporary file
+    boundary, body = encode_multipart({'file': FileStorage(io.BytesIO(audio), 'audio.webm')})
+    times = []
+    rchar, wchar = io_counters()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post('/upload-audio', data=body, content_type=f'multipart/form-data; boundary={boundary}')
+        assert response.status_code == 200, response.data
+        times.append(time.perf_counter() - start)
+    after_rchar, after_wchar = io_counters()
+    return times, (after_rchar - rchar) / repeat, (after_wchar - wchar) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 4096, 20480], help="Recording sizes in KiB")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    port = free_port()
+    mock = subprocess.Popen([sys.executable, os.path.join(PROJECT_DIR, "mock_openai.py"), "--port", str(port),
+                             "--transcription-latency", "0"], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    os.environ.update(OPENAI_BASE_URL=f"http://127.0.0.1:{port}/v1", OPENAI_API_KEY="test")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The app keeps its database in the working directory
+        os.chdir(tmp_dir)
+        sys.path.insert(0, PROJECT_DIR)
+        import app as app_module
+        import openai
+        app_module.print = lambda *args, **kwargs: None  # Keep the transcripts out of the report
+
+        apps = {'before': before_app(openai, tmp_dir), 'after': after_app(app_module)}
+        print("size        mode     p50 latency   read per request   written per request")
+        for size in args.sizes:
+            # Text, since the mock transcribes a recording by decoding it
+            audio = (b"la " * (size * 1024 // 3 + 1))[:size * 1024]
+            for name, app in apps.items():
+                times, read, written = measure(app, audio, args.repeat)
+                print(f"{size:>6} KiB  {name:<6}  {statistics.median(times) * 1000:9.1f} ms  "
+                      f"{read / 1024 / 1024:12.2f} MiB  {written / 1024 / 1024:15.2f} MiB")
+        os.chdir(PROJECT_DIR)
+
+    mock.terminate()
+    mock.wait()
+
+
+if __name__ == "__main__":
+    main()
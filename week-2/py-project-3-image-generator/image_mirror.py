@@ -0,0 +1,90 @@
+import hashlib
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from PIL import Image
+
+
+def write_atomically(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def make_thumbnail(data, size, quality):
+    """Return a JPEG of the image that fits in size x size pixels."""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return output.getvalue()
+
+
+class ImageMirror:
+    """
+    Download generated images in background threads and keep them under `directory`, named after the
+    SHA-256 of their content, together with a JPEG thumbnail. The poster is then updated to point at the
+    local copies, which are served as `url_prefix`/<name>.
+    """
+
+    def __init__(self, store, directory, url_prefix, workers=2, thumbnail_size=320, thumbnail_quality=80,
+                 retries=3, timeout=30):
+        self.store = store
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self.retries = retries
+        self.client = httpx.Client(timeout=timeout, follow_redirects=True)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-mirror')
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, poster_id, image_url):
+        return self.pool.submit(self.mirror, poster_id, image_url)
+
+    def resume(self, max_age):
+        """Mirror the posters of the last `max_age` seconds that were not mirrored, e.g. after a restart."""
+        pending = self.store.unmirrored(time.time() - max_age)
+        for poster_id, image_url in pending:
+            self.submit(poster_id, image_url)
+        return len(pending)
+
+    def download(self, image_url):
+        for attempt in range(self.retries):
+            try:
+                response = self.client.get(image_url)
+                response.raise_for_status()
+                return response.content
+            except httpx.HTTPError as e:
+                # Only server errors and network errors are worth retrying, a 403 means the URL expired
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code >= 500
+                if attempt == self.retries - 1 or not retryable:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def mirror(self, poster_id, image_url):
+        """Download one image and point the poster at it. Returns the local image URL, or None on failure."""
+        try:
+            data = self.download(image_url)
+            digest = hashlib.sha256(data).hexdigest()
+            image_name = f"{digest}.png"
+            thumbnail_name = f"{digest}_thumb.jpg"
+
+            # The same image (same content) is only stored once
+            if not os.path.exists(os.path.join(self.directory, image_name)):
+                thumbnail = make_thumbnail(data, self.thumbnail_size, self.thumbnail_quality)
+                write_atomically(os.path.join(self.directory, thumbnail_name), thumbnail)
+                write_atomically(os.path.join(self.directory, image_name), data)
+
+            local_url = f"{self.url_prefix}/{image_name}"
+            self.store.set_image(poster_id, local_url, f"{self.url_prefix}/{thumbnail_name}")
+            return local_url
+        except Exception as e:
+            print(f'Error mirroring the image of poster {poster_id}:', e)
+            return None
@@ -0,0 +1,148 @@
+"""
+Fake Whisper and DALL-E endpoints for bench_cache.py, bench_jobs.py and bench_upload.py.
+
+A transcription is the uploaded file decoded as text, so a benchmark picks the lyrics it "sang" by uploading
+them as the recording. Every generated image is the same small blue PNG, served by the mock under /files/ so
+the app mirrors it from localhost. Point the app at it with:
+
+    python mock_openai.py --port 4040
+    OPENAI_BASE_URL=http://127.0.0.1:4040/v1 python app.py
+"""
+import argparse
+import io
+import itertools
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+TRANSCRIPTION_LATENCY = 0.1  # Seconds for Whisper to transcribe a short recording
+IMAGE_LATENCY = 0.5  # Seconds per image, far below the 10-20 s DALL-E 3 takes
+ERROR_RATE = 0.0  # Fraction of requests answered with 503
+
+_ids = itertools.count(1)
+
+
+def make_png(size=256):
+    output = io.BytesIO()
+    Image.new('RGB', (size, size), (40, 90, 160)).save(output, 'PNG')
+    return output.getvalue()
+
+
+class MockState:
+    def __init__(self, transcription_latency=TRANSCRIPTION_LATENCY, image_latency=IMAGE_LATENCY,
+                 error_rate=ERROR_RATE):
+        self.transcription_latency = transcription_latency
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.image = make_png()
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = 0
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            with self.lock:
+                self.errors += 1
+            return True
+        return False
+
+
+def uploaded_file(content_type, body):
+    """Return the content of the "file" field of a multipart/form-data body."""
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    for part in message.iter_parts():
+        if part.get_param('name', header='content-disposition') == 'file':
+            return part.get_payload(decode=True)
+    return b""
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # Set by make_server()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200, headers=None):
+        self.send_body(json.dumps(payload).encode("utf-8"), "application/json", status, headers)
+
+    def do_GET(self):
+        if self.path.startswith("/files/"):
+            return self.send_body(self.state.image, "image/png")
+        self.send_json({"error": {"message": f"Unknown route {self.path}"}}, 404)
+
+    def do_POST(self):
+        state = self.state
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        if self.path == "/v1/audio/transcriptions":
+            state.count("transcription")
+            if state.fail():
+                return self.send_json({"error": {"message": "Overloaded"}}, 503, {"retry-after": "0"})
+            time.sleep(state.transcription_latency)
+            text = uploaded_file(self.headers["Content-Type"], body).decode("utf-8", "replace")
+            return self.send_json({"text": text})
+
+        if self.path == "/v1/images/generations":
+            state.count("image")
+            if state.fail():
+                return self.send_json({"error": {"message": "Overloaded"}}, 503, {"retry-after": "0"})
+            time.sleep(state.image_latency)
+            host, port = self.server.server_address
+            prompt = json.loads(body)["prompt"]
+            return self.send_json({
+                "created": int(time.time()),
+                "data": [{"url": f"http://{host}:{port}/files/img-{next(_ids)}.png", "revised_prompt": prompt}],
+            })
+
+        self.send_json({"error": {"message": f"Unknown route {self.path}"}}, 404)
+
+
+class MockServer(ThreadingHTTPServer):
+    request_queue_size = 512  # bench_cache.py transcribes and draws up to --concurrency posters at once
+
+
+def make_server(port=0, **settings):
+    """Create a mock server bound to localhost. Use port=0 to pick a free port."""
+    handler = type("Handler", (MockOpenAIHandler,), {"state": MockState(**settings)})
+    return MockServer(("127.0.0.1", port), handler)
+
+
+def start_in_background(**settings):
+    """Start a mock server on a free port and return (server, base_url)."""
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI transcription and image APIs.")
+    parser.add_argument("--port", type=int, default=4040)
+    parser.add_argument("--transcription-latency", type=float, default=TRANSCRIPTION_LATENCY)
+    parser.add_argument("--image-latency", type=float, default=IMAGE_LATENCY)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    args = parser.parse_args()
+
+    server = make_server(args.port, transcription_latency=args.transcription_latency,
+                         image_latency=args.image_latency, error_rate=args.error_rate)
+    print(f"Mock OpenAI API listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def normalize(text):
+    """Ignore case, spacing and the final punctuation, which Whisper adds or not for the same song."""
+    return " ".join(text.lower().split()).rstrip(".!?…")
+
+
+def poster_key(transcript, **params):
+    """Hash the normalized transcript together with the image parameters (model, size, ...)."""
+    payload = json.dumps([normalize(transcript), sorted(params.items())], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PosterCache:
+    """
+    Remember which poster was generated for a key, so the same song does not pay for another image.
+
+    Entries expire after `ttl` seconds and the least recently used ones are dropped beyond `max_size`.
+    Concurrent requests for a key that is being generated wait for that generation instead of starting their
+    own, so N identical uploads at once make one upstream call.
+    """
+
+    def __init__(self, ttl=24 * 3600, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (value, created_at)
+        self._in_flight = {}  # key -> Future of the generation
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.regenerated = 0
+
+    def get_or_generate(self, key, generate, regenerate=False):
+        """
+        Return (value, outcome) where outcome is 'hit', 'coalesced', 'miss' or 'regenerated'. `generate()` is
+        called on a miss; with regenerate=True it is always called and replaces the cached value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not regenerate:
+                if time.monotonic() - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], 'hit'
+                del self._entries[key]
+
+            future = self._in_flight.get(key)
+            if future and not regenerate:
+                self.coalesced += 1
+                outcome = 'coalesced'
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                if regenerate:
+                    self.regenerated += 1
+                    outcome = 'regenerated'
+                else:
+                    self.misses += 1
+                    outcome = 'miss'
+
+        if outcome == 'coalesced':
+            return future.result(), outcome
+
+        try:
+            value = generate()
+        except BaseException as e:
+            # The waiting requests fail too, each of them may retry
+            with self._lock:
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        future.set_result(value)
+        return value, outcome
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'regenerated': self.regenerated,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
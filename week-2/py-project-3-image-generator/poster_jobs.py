@@ -0,0 +1,120 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    pass
+
+
+class PosterJobs:
+    """
+    Run jobs through a sequence of stages, each stage on its own bounded pool of worker threads, so the
+    stages of different jobs overlap: while one poster is being drawn, the next recordings are transcribed.
+
+    `stages` is a list of (name, func, workers). func is called with the job's data dict and returns a dict
+    of fields to add to it, which the next stage receives. A stage that raises an error for which
+    `should_retry(error)` is true is run again after a backoff, up to `retries` attempts; the stages before it
+    are not run again. Data keys starting with '_' are private to the stages and dropped when the job ends,
+    the other keys are reported to clients. At most `max_pending` jobs may be unfinished at once; further
+    submissions are refused with QueueFull.
+    """
+
+    def __init__(self, stages, max_pending=64, retries=3, backoff=1.0, should_retry=None, on_finish=None,
+                 max_jobs=1000):
+        self.stages = [(name, func, ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name))
+                       for name, func, workers in stages]
+        self.retries = retries
+        self.backoff = backoff
+        self.should_retry = should_retry or (lambda error: True)
+        self.on_finish = on_finish
+        self.max_jobs = max_jobs
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+
+    def submit(self, data):
+        """Start a job with the given data and return its ID."""
+        if not self._pending.acquire(blocking=False):
+            raise QueueFull("Too many posters in progress, please try again later")
+
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'queued', 'stage': self.stages[0][0], 'attempt': 1, 'error': None,
+               'version': 0, 'data': dict(data)}
+        with self._changed:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        self._schedule(job, 0, 1)
+        return job_id
+
+    def get(self, job_id):
+        """Return a snapshot of a job, or None for an unknown job."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def wait(self, job_id, version, timeout=15):
+        """
+        Return a snapshot of the job once its version is newer than `version`, or after `timeout` seconds
+        without changes. Returns None for an unknown job.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: job_id not in self._jobs or self._jobs[job_id]['version'] > version,
+                                   timeout)
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job else None
+
+    def _snapshot(self, job):
+        snapshot = {key: value for key, value in job['data'].items() if not key.startswith('_')}
+        snapshot.update({key: job[key] for key in ('id', 'status', 'stage', 'attempt', 'version')})
+        if job['error']:
+            snapshot['error'] = job['error']
+        return snapshot
+
+    def _update(self, job, data=None, keep_private=True, **fields):
+        with self._changed:
+            job['data'].update(data or {})
+            if not keep_private:
+                job['data'] = {key: value for key, value in job['data'].items() if not key.startswith('_')}
+            job.update(fields)
+            job['version'] += 1
+            self._changed.notify_all()
+
+    def _schedule(self, job, index, attempt):
+        self.stages[index][2].submit(self._run, job, index, attempt)
+
+    def _run(self, job, index, attempt):
+        name, func, _ = self.stages[index]
+        self._update(job, status='running', stage=name, attempt=attempt)
+        try:
+            result = func(dict(job['data']))
+        except Exception as e:
+            if attempt < self.retries and self.should_retry(e):
+                print(f"Job {job['id']}: {name} failed (attempt {attempt}), retrying:", e)
+                self._update(job, status='retrying', error=str(e))
+                # Wait off the pool, so the other jobs of this stage keep their workers meanwhile
+                timer = threading.Timer(self.backoff * 2 ** (attempt - 1), self._schedule, (job, index, attempt + 1))
+                timer.daemon = True
+                timer.start()
+                return
+            print(f"Job {job['id']}: {name} failed:", e)
+            self._finish(job, status='failed', error=str(e))
+            return
+
+        if index + 1 < len(self.stages):
+            self._update(job, result, status='queued', stage=self.stages[index + 1][0], attempt=1, error=None)
+            self._schedule(job, index + 1, 1)
+        else:
+            self._finish(job, result, status='completed', error=None)
+
+    def _finish(self, job, data=None, **fields):
+        try:
+            if self.on_finish:
+                self.on_finish(job['data'])
+        except Exception as e:
+            print(f"Job {job['id']}: error cleaning up:", e)
+        finally:
+            self._update(job, data, keep_private=False, **fields)
+            self._pending.release()
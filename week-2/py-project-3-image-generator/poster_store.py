@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class PosterStore:
+    """
+    Posters saved in a SQLite database in WAL mode.
+
+    Adding a poster is a single INSERT, whatever the size of the gallery, and concurrent requests can add
+    posters at the same time. The title (case-insensitive) and the creation time are indexed, so the gallery
+    can be listed newest first and searched by title prefix one page at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS posters (
+                    id INTEGER PRIMARY KEY,
+                    title TEXT NOT NULL COLLATE NOCASE,
+                    image_url TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    thumbnail_url TEXT,
+                    mirrored INTEGER NOT NULL DEFAULT 0
+                )""")
+            columns = {row['name'] for row in db.execute("PRAGMA table_info(posters)")}
+            if 'mirrored' not in columns:
+                # Databases created before images were mirrored locally
+                db.execute("ALTER TABLE posters ADD COLUMN thumbnail_url TEXT")
+                db.execute("ALTER TABLE posters ADD COLUMN mirrored INTEGER NOT NULL DEFAULT 0")
+            db.execute("CREATE INDEX IF NOT EXISTS posters_title ON posters (title)")
+            db.execute("CREATE INDEX IF NOT EXISTS posters_created_at ON posters (created_at, id)")
+            db.execute("CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, applied_at REAL NOT NULL)")
+
+    def connect(self):
+        """Return the connection of the current thread, SQLite connections cannot be shared between threads."""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")  # Durable enough in WAL mode, and much faster per commit
+            self.local.db = db
+        return db
+
+    def add(self, title, image_url, created_at=None):
+        with self.connect() as db:
+            cursor = db.execute("INSERT INTO posters (title, image_url, created_at) VALUES (?, ?, ?)",
+                                (title, image_url, created_at or time.time()))
+        return cursor.lastrowid
+
+    def add_many(self, posters):
+        """Add (title, image_url, created_at) tuples in one transaction."""
+        with self.connect() as db:
+            db.executemany("INSERT INTO posters (title, image_url, created_at) VALUES (?, ?, ?)", posters)
+
+    def set_image(self, poster_id, image_url, thumbnail_url):
+        """Point a poster at its local copy once the generated image was mirrored."""
+        with self.connect() as db:
+            db.execute("UPDATE posters SET image_url = ?, thumbnail_url = ?, mirrored = 1 WHERE id = ?",
+                       (image_url, thumbnail_url, poster_id))
+
+    def unmirrored(self, since):
+        """Return (id, image_url) of the posters created after `since` whose image is not mirrored yet."""
+        rows = self.connect().execute(
+            "SELECT id, image_url FROM posters WHERE mirrored = 0 AND created_at > ? ORDER BY created_at", (since,)
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get(self, poster_id):
+        row = self.connect().execute("SELECT * FROM posters WHERE id = ?", (poster_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self):
+        return self.connect().execute("SELECT COUNT(*) FROM posters").fetchone()[0]
+
+    def list(self, limit=20, cursor=None, title_prefix=None):
+        """
+        Return (posters, next_cursor), newest first. Pass next_cursor back to get the following page; it is
+        None on the last page. With title_prefix, only the posters whose title starts with it are returned.
+        """
+        conditions, params = [], []
+        if title_prefix:
+            # LIKE on a NOCASE column with a constant prefix is answered from the title index
+            escaped = title_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            params.append(escaped + '%')
+        if cursor:
+            created_at, poster_id = cursor.split(':')
+            conditions.append("(created_at, id) < (?, ?)")
+            params += [float(created_at), int(poster_id)]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connect().execute(
+            f"SELECT * FROM posters {where} ORDER BY created_at DESC, id DESC LIMIT ?", params + [limit + 1]
+        ).fetchall()
+
+        posters = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = posters[-1]
+            next_cursor = f"{last['created_at']!r}:{last['id']}"
+        return posters, next_cursor
+
+    def migrate_json(self, json_path):
+        """Import the posters of the old posters.json once. Returns the number of posters imported."""
+        if not os.path.exists(json_path):
+            return 0
+        name = os.path.basename(json_path)
+        db = self.connect()
+        if db.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+            return 0
+
+        with open(json_path, 'r') as f:
+            posters = json.load(f)
+        # posters.json has no timestamps, so keep its order with times just before the file was last written
+        written_at = os.path.getmtime(json_path)
+        rows = [(poster['title'], poster['image_url'], written_at - (len(posters) - n) * 0.001)
+                for n, poster in enumerate(posters)]
+        try:
+            with db:
+                db.execute("INSERT INTO migrations (name, applied_at) VALUES (?, ?)", (name, time.time()))
+                db.executemany("INSERT INTO posters (title, image_url, created_at) VALUES (?, ?, ?)", rows)
+        except sqlite3.IntegrityError:
+            return 0  # Another process imported it at the same time
+        return len(rows)